@@ -0,0 +1,80 @@
+"""
+Restic benchmark suite.
+
+Usage:
+
+.. code-block:: bash
+
+    # Run all benchmarks & save results as a baseline
+    python -m restic.benchmarks --output baseline.json
+
+    # Run serialization benchmarks only & compare with the baseline
+    python -m restic.benchmarks --filter serialize --compare baseline.json
+
+    # Include end-to-end HTTP benchmarks
+    python -m restic.benchmarks --http
+
+Results are printed to stdout as JSON (unless ``--output`` is given).
+In compare mode the exit code is 1 if any benchmark got slower than the
+baseline by more than ``--threshold``.
+"""
+import json
+import sys
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+from restic.benchmarks import micro, runner
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(prog='python -m restic.benchmarks', description='Run Restic benchmarks.')
+    parser.add_argument('--filter', help='run only benchmarks matching this regular expression')
+    parser.add_argument('--quick', action='store_true', help='skip the largest list sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing rounds (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimal round duration in seconds (default: %(default)s)')
+    parser.add_argument('--http', action='store_true', help='also run end-to-end HTTP benchmarks')
+    parser.add_argument('--requests', type=int, default=2000, help='HTTP requests per round (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=10, help='HTTP connections (default: %(default)s)')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare results with a JSON file produced by --output')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown ratio (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = micro.SIZES[:-1] if args.quick else micro.SIZES
+
+    results = runner.run(micro.get_benchmarks(sizes), pattern=args.filter, repeat=args.repeat, min_time=args.min_time)
+    if args.http:
+        from restic.benchmarks import endtoend
+        results.update(endtoend.run(
+            pattern=args.filter,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            repeat=args.repeat
+        ))
+
+    report = OrderedDict([
+        ('environment', runner.get_environment()),
+        ('results', results),
+    ])
+    if args.output:
+        with open(args.output, 'w') as fobj:
+            json.dump(report, fobj, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as fobj:
+            baseline = json.load(fobj)['results']
+        comparison = runner.compare(baseline, results, args.threshold)
+        sys.stderr.write(runner.format_comparison(comparison) + '\n')
+        if any(regressed for *_, regressed in comparison):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+End-to-end benchmarks: requests per second served by the test application
+(``restic/tests/app.py``) over HTTP.
+
+The server is started in a subprocess, requests are sent by an ``aiohttp``
+client through a pool of keep-alive connections.
+"""
+import re
+import socket
+import subprocess
+import sys
+import time
+from asyncio import new_event_loop, gather
+from collections import OrderedDict
+from statistics import median
+
+SERVER_CODE = (
+    'from restic.tests.app import app; '
+    'app.run(host="127.0.0.1", port={port}, access_log=False)'
+)
+
+CASES = (
+    ('list', 'GET', '/items', None),
+    ('retrieve', 'GET', '/items/1', None),
+    ('retrieve_404', 'GET', '/items/1000', None),
+    ('update_invalid', 'PATCH', '/items/1', b'{"date_created": "garbage"}'),
+)
+
+
+def get_free_port():
+    """
+    Return a TCP port which is free at the moment.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, timeout=10):
+    """
+    Start test application in a subprocess and wait until it accepts
+    connections. Return :py:class:`subprocess.Popen` object.
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER_CODE.format(port=port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Server exited with code {}.'.format(process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('Server did not start in {} seconds.'.format(timeout))
+
+
+async def send_requests(session, method, url, data, count):
+    """
+    Send ``count`` requests sequentially through ``session``.
+    """
+    for _ in range(count):
+        async with session.request(method, url, data=data) as response:
+            await response.read()
+
+
+def run(pattern=None, requests=2000, concurrency=10, repeat=3, output=sys.stderr):
+    """
+    Run end-to-end benchmarks, return results in the same format as
+    :py:func:`restic.benchmarks.runner.run`.
+
+    Each round sends ``requests`` requests through ``concurrency``
+    connections.
+    """
+    import aiohttp
+
+    port = get_free_port()
+    process = start_server(port)
+    loop = new_event_loop()
+    results = OrderedDict()
+    try:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency, loop=loop),
+            loop=loop
+        )
+        try:
+            for name, method, path, data in CASES:
+                name = 'http.{}'.format(name)
+                if pattern is not None and not re.search(pattern, name):
+                    continue
+                url = 'http://127.0.0.1:{}{}'.format(port, path)
+                per_client = max(1, requests // concurrency)
+                total = per_client * concurrency
+                # Warm up connections.
+                loop.run_until_complete(gather(*[
+                    send_requests(session, method, url, data, 1)
+                    for _
+                    in range(concurrency)
+                ], loop=loop))
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    loop.run_until_complete(gather(*[
+                        send_requests(session, method, url, data, per_client)
+                        for _
+                        in range(concurrency)
+                    ], loop=loop))
+                    times.append((time.perf_counter() - start) / total)
+                best = min(times)
+                results[name] = OrderedDict([
+                    ('rows', total),
+                    ('best', best),
+                    ('median', median(times)),
+                    ('ops_per_second', 1 / best),
+                    ('rows_per_second', 1 / best),
+                ])
+                if output is not None:
+                    output.write('{:<48} {:>14.1f} requests/s\n'.format(name, 1 / best))
+        finally:
+            session.close()
+    finally:
+        process.terminate()
+        process.wait()
+        loop.close()
+    return results
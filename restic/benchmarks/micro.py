@@ -0,0 +1,205 @@
+"""
+Micro-benchmarks of serializers, validation & request dispatching.
+
+All the data is generated deterministically, so results of different runs
+are comparable.
+"""
+from asyncio import new_event_loop
+from datetime import datetime, timedelta
+
+from sanic.request import Request
+from sanic.server import CIDict
+
+from restic.exceptions import BadRequest
+from restic.viewsets import ModelViewSet
+from restic.serializers import (
+    Serializer,
+    Field,
+    SerializerMethodField,
+    NaiveDateTimeField
+)
+
+from restic.benchmarks.runner import Benchmark
+
+SIZES = (10, 1000, 100000)
+EPOCH = datetime(2018, 1, 1, 12, 0, 0, 421337)
+
+
+def make_models(count):
+    """
+    Return a list of ``count`` dict models.
+    """
+    return [
+        {
+            'id': index,
+            'name': 'Item {}'.format(index),
+            'price': index * 0.5,
+            'active': index % 2 == 0,
+            'date_created': EPOCH + timedelta(seconds=index),
+            'date_updated': EPOCH + timedelta(days=1, seconds=index),
+        }
+        for index
+        in range(1, count + 1)
+    ]
+
+
+class PlainSerializer(Serializer):
+    id = Field(read_only=True)
+    name = Field(required=True)
+    price = Field()
+    active = Field()
+
+
+class CompiledPlainSerializer(PlainSerializer):
+    COMPILED = True
+
+
+class MethodSerializer(Serializer):
+    id = Field(read_only=True)
+    name = SerializerMethodField()
+    price = SerializerMethodField()
+    active = SerializerMethodField()
+
+    def get_name(self, model):
+        return model['name']
+
+    def get_price(self, model):
+        return model['price']
+
+    def get_active(self, model):
+        return model['active']
+
+
+class DateTimeSerializer(Serializer):
+    id = Field(read_only=True)
+    name = Field(required=True)
+    date_created = NaiveDateTimeField()
+    date_updated = NaiveDateTimeField()
+
+
+class CompiledDateTimeSerializer(DateTimeSerializer):
+    COMPILED = True
+
+
+SERIALIZERS = (
+    ('plain', PlainSerializer),
+    ('plain_compiled', CompiledPlainSerializer),
+    ('method', MethodSerializer),
+    ('datetime', DateTimeSerializer),
+    ('datetime_compiled', CompiledDateTimeSerializer),
+)
+
+
+def get_serialize_benchmarks(sizes=SIZES):
+    """
+    Return list serialization benchmarks.
+    """
+    benchmarks = []
+    for size in sizes:
+        models = make_models(size)
+        for name, serializer_class in SERIALIZERS:
+            benchmarks.append(Benchmark(
+                'serialize.{}.{}'.format(name, size),
+                lambda serializer_class=serializer_class, models=models: (
+                    serializer_class(models, many=True).serialize()
+                ),
+                rows=size
+            ))
+    return benchmarks
+
+
+def _validate_invalid(serializer, data):
+    try:
+        serializer._validate(data)  # pylint: disable=protected-access
+    except BadRequest:
+        pass
+
+
+def get_validate_benchmarks():
+    """
+    Return validation benchmarks for valid & invalid data.
+    """
+    valid = {'name': 'Foo', 'date_created': '2018-01-01T12:00:00.421337', 'date_updated': '2018-01-02 12:00:00'}
+    invalid = {'date_created': 'garbage', 'date_updated': '01.02.2018'}
+    benchmarks = []
+    for name, serializer_class in (('datetime', DateTimeSerializer), ('datetime_compiled', CompiledDateTimeSerializer)):
+        serializer = serializer_class()
+        benchmarks.append(Benchmark(
+            'validate.{}.valid'.format(name),
+            lambda serializer=serializer: serializer._validate(valid)  # pylint: disable=protected-access
+        ))
+        benchmarks.append(Benchmark(
+            'validate.{}.invalid'.format(name),
+            lambda serializer=serializer: _validate_invalid(serializer, invalid)
+        ))
+    fields = (
+        ('iso', NaiveDateTimeField(), '2018-01-01T12:00:00.421337'),
+        ('strptime', NaiveDateTimeField(formats=('%Y-%m-%d', '%d.%m.%Y %H:%M')), '01.01.2018 12:00'),
+    )
+    for name, field, value in fields:
+        benchmarks.append(Benchmark(
+            'validate.datetime_field.{}'.format(name),
+            lambda field=field, value=value: field.to_internal_value(None, 'date', value)
+        ))
+    return benchmarks
+
+
+class DispatchViewSet(ModelViewSet):
+    MODELS = make_models(10)
+
+    def get_serializer_class(self):
+        return DateTimeSerializer
+
+    def get_models(self):
+        return self.MODELS
+
+    def get_model(self, pk):
+        if 0 < pk <= len(self.MODELS):
+            return self.MODELS[pk - 1]
+
+
+def make_request(method, path, body=b''):
+    """
+    Create a request object which is not bound to any connection.
+    """
+    request = Request(path.encode('utf-8'), CIDict(), '1.1', method, None)
+    request.body = body
+    return request
+
+
+def get_dispatch_benchmarks(batch=100):
+    """
+    Return benchmarks of the full request path through a viewset dispatcher
+    (without HTTP parsing & networking).
+
+    Each call dispatches ``batch`` requests inside a running event loop.
+    """
+    loop = new_event_loop()
+    cases = (
+        ('list', 'GET', '/items/', b'', {}),
+        ('retrieve', 'GET', '/items/1', b'', {'pk': 1}),
+        ('retrieve_404', 'GET', '/items/1000', b'', {'pk': 1000}),
+        ('update_invalid', 'PATCH', '/items/1', b'{"date_created": "garbage"}', {'pk': 1}),
+    )
+    benchmarks = []
+    for name, method, path, body, kwargs in cases:
+        dispatcher = DispatchViewSet._create_dispatcher(name.split('_')[0])  # pylint: disable=protected-access
+        request = make_request(method, path, body)
+
+        async def dispatch_batch(dispatcher=dispatcher, request=request, kwargs=kwargs):
+            for _ in range(batch):
+                await dispatcher(request, **kwargs)
+
+        benchmarks.append(Benchmark(
+            'dispatch.{}'.format(name),
+            lambda dispatch_batch=dispatch_batch: loop.run_until_complete(dispatch_batch()),
+            rows=batch
+        ))
+    return benchmarks
+
+
+def get_benchmarks(sizes=SIZES):
+    """
+    Return all micro-benchmarks.
+    """
+    return get_serialize_benchmarks(sizes) + get_validate_benchmarks() + get_dispatch_benchmarks()
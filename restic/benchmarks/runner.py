@@ -0,0 +1,126 @@
+"""
+Benchmark runner: timing, reporting & comparison with a baseline.
+"""
+import gc
+import platform
+import re
+import sys
+from collections import OrderedDict
+from statistics import median
+from timeit import default_timer
+
+
+class Benchmark(object):
+    """
+    Single benchmark case.
+
+    ``func`` is called without arguments and should perform one operation.
+    ``rows`` is the number of rows (or requests) processed by one call, it is
+    used to report throughput.
+    """
+    def __init__(self, name, func, rows=1):
+        self.name = name
+        self.func = func
+        self.rows = rows
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    Measure ``func`` call duration.
+
+    The number of calls per round is calibrated so that each round takes at
+    least ``min_time`` seconds. Garbage collection is disabled while timing.
+    Return a list of ``repeat`` per-call durations in seconds.
+    """
+    number = 1
+    while True:
+        duration = _time(func, number)
+        if duration >= min_time or number >= 1 << 20:
+            break
+        number *= max(2, min(10, int(min_time / max(duration, 1e-9)) + 1))
+
+    return [_time(func, number) / number for _ in range(repeat)]
+
+
+def _time(func, number):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = default_timer()
+        for _ in range(number):
+            func()
+        return default_timer() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def run(benchmarks, pattern=None, repeat=5, min_time=0.2, output=sys.stderr):
+    """
+    Run ``benchmarks`` whose names match ``pattern`` regular expression.
+
+    Return results as a dict (benchmark name -> stats).
+    Progress is written to ``output``.
+    """
+    results = OrderedDict()
+    for benchmark in benchmarks:
+        if pattern is not None and not re.search(pattern, benchmark.name):
+            continue
+        times = measure(benchmark.func, repeat=repeat, min_time=min_time)
+        best = min(times)
+        results[benchmark.name] = OrderedDict([
+            ('rows', benchmark.rows),
+            ('best', best),
+            ('median', median(times)),
+            ('ops_per_second', 1 / best),
+            ('rows_per_second', benchmark.rows / best),
+        ])
+        if output is not None:
+            output.write('{:<48} {:>14.1f} rows/s\n'.format(benchmark.name, benchmark.rows / best))
+    return results
+
+
+def get_environment():
+    """
+    Return a dict describing the environment benchmarks are run in.
+    """
+    return OrderedDict([
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+    ])
+
+
+def compare(baseline, results, threshold=0.1):
+    """
+    Compare ``results`` with ``baseline`` results.
+
+    Return a list of ``(name, baseline_rate, rate, ratio, regressed)``
+    tuples for benchmarks present in both. A benchmark is considered
+    regressed if its throughput dropped by more than ``threshold``.
+    """
+    comparison = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        baseline_rate = baseline[name]['rows_per_second']
+        rate = stats['rows_per_second']
+        ratio = rate / baseline_rate
+        comparison.append((name, baseline_rate, rate, ratio, ratio < 1 - threshold))
+    return comparison
+
+
+def format_comparison(comparison):
+    """
+    Format result of :py:func:`.compare` as a text table.
+    """
+    lines = []
+    for name, baseline_rate, rate, ratio, regressed in comparison:
+        lines.append('{:<48} {:>14.1f} {:>14.1f} {:>+8.1%}{}'.format(
+            name,
+            baseline_rate,
+            rate,
+            ratio - 1,
+            '  REGRESSION' if regressed else ''
+        ))
+    return '\n'.join(lines)
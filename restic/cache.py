@@ -0,0 +1,126 @@
+"""
+Response cache logic.
+"""
+from collections import OrderedDict
+from time import monotonic
+
+from sanic.response import HTTPResponse
+
+
+class CachedResponse(object):
+    """
+    Rendered response stored in cache.
+
+    ``variants`` dict maps content encodings to compressed bodies.
+    """
+    __slots__ = ('status', 'body', 'content_type', 'headers', 'variants')
+
+    def __init__(self, status, body, content_type, headers):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers
+        self.variants = {}
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Create cache entry from a response.
+        """
+        return cls(
+            response.status,
+            response.body,
+            response.content_type,
+            dict(response.headers)
+        )
+
+    def to_response(self):
+        """
+        Return a new response with cached data.
+        """
+        return HTTPResponse(
+            body_bytes=self.body,
+            status=self.status,
+            headers=dict(self.headers),
+            content_type=self.content_type
+        )
+
+
+class ResponseCache(object):
+    """
+    Size-bounded LRU cache of rendered responses with time-to-live.
+
+    At most ``max_size`` responses are kept, least recently used ones are
+    evicted first. Responses older than ``ttl`` seconds are never returned.
+
+    ``hits`` and ``misses`` attributes count cache lookups.
+
+    ``generation`` is incremented by :py:meth:`.invalidate`. Responses
+    rendered before invalidation are not stored (see :py:meth:`.set`).
+
+    Example usage:
+
+    .. code-block:: python
+
+        class ItemsViewSet(ModelViewSet):
+            RESPONSE_CACHE = ResponseCache(max_size=1000, ttl=30)
+    """
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return :py:class:`.CachedResponse` for ``key`` or ``None``.
+        """
+        item = self._entries.get(key)
+        if item is not None:
+            expires, entry = item
+            if expires > monotonic():
+                # pylint does not know OrderedDict.move_to_end (false positive).
+                self._entries.move_to_end(key)  # pylint: disable=no-member
+                self.hits += 1
+                return entry
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, entry, generation=None):
+        """
+        Store :py:class:`.CachedResponse` for ``key``.
+
+        ``generation`` is the value of :py:attr:`generation` read before
+        the response was rendered. The response is dropped if the cache
+        was invalidated since then, as it may be stale.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[key] = (monotonic() + self.ttl, entry)
+        self._entries.move_to_end(key)  # pylint: disable=no-member
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Remove all responses from cache.
+        """
+        self.generation += 1
+        self._entries.clear()
+
+    def get_stats(self):
+        """
+        Return a dict with cache counters.
+        """
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._entries),
+            max_size=self.max_size
+        )
@@ -0,0 +1,55 @@
+"""
+Coalescing of identical concurrent requests ("single flight").
+
+When many clients request the same resource at once, only the first
+request is handled; the others wait for it and get a copy of its response.
+
+Example usage:
+
+.. code-block:: python
+
+    class ItemsViewSet(ModelViewSet):
+        SINGLE_FLIGHT = SingleFlight()
+"""
+from asyncio import ensure_future, shield
+
+
+class SingleFlight(object):
+    """
+    Registry of in-flight computations by key.
+
+    Each viewset class should have its own instance.
+    """
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def call(self, key, func):
+        """
+        Return a tuple of ``(result, leader)``.
+
+        If there is no computation in flight for ``key``, start ``func()``
+        coroutine and return its result with ``leader`` set to ``True``.
+        Otherwise wait for the computation in flight and return its result
+        with ``leader`` set to ``False``. Exceptions are raised in all
+        waiters.
+
+        The computation runs as a separate task, so cancelling a waiter
+        (including the one that started it) does not cancel it.
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            return await shield(future), False
+
+        future = self._calls[key] = ensure_future(func())
+        future.add_done_callback(lambda _: self._done(key, future))
+        return await shield(future), True
+
+    def _done(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Mark exception as retrieved even if all waiters are gone.
+            future.exception()
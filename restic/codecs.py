@@ -0,0 +1,377 @@
+"""
+Codecs.
+
+Codec decides how request bodies are decoded and how response data
+is encoded. The fastest available JSON codec is used by default:
+``orjson``, then ``ujson``, then the standard library ``json`` module.
+
+Viewsets also negotiate codecs with clients: responses are encoded with
+the codec that best matches ``Accept`` request header and request bodies
+are decoded with the codec that matches ``Content-Type`` header.
+Besides JSON, :py:class:`.NDJSONCodec` (newline-delimited JSON) and
+:py:class:`.MessagePackCodec` (if ``msgpack`` package is installed) are
+available by default (see ``DEFAULT_CODECS``).
+"""
+import json
+from functools import lru_cache
+
+from restic.exceptions import BadRequest
+
+_ERROR_BODIES = {}
+
+
+class Fragment(object):
+    """
+    Pre-encoded JSON value.
+
+    Serializers can return fragments (or put them into lists and dicts
+    they return) to avoid encoding the same data again, for example when
+    the representation of a model is cached as bytes.
+
+    Fragments are inserted into the output as is, so ``data``
+    must be a valid JSON document.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self.data = data
+
+
+class Codec(object):
+    """
+    Base codec class.
+
+    Subclasses should override :py:meth:`.Codec.loads`,
+    :py:meth:`.Codec.dumps` and :py:meth:`.Codec.encode_items` methods.
+
+    ``media_types`` are media types this codec is negotiated for,
+    ``content_type`` is sent in responses. ``list_start``,
+    ``list_separator`` and ``list_end`` are bytes that frame lists
+    encoded by chunks in streaming responses.
+
+    If ``supports_offload`` is ``True``, viewsets can encode lists in
+    worker processes (see :py:mod:`restic.offload`) as JSON fragments.
+
+    If ``supports_streaming`` is ``False``, lists encoded by this codec
+    are never streamed, because it cannot frame a list of unknown length.
+    """
+    content_type = None
+    media_types = ()
+    malformed_message = 'Malformed request body.'
+    list_start = b''
+    list_separator = b''
+    list_end = b''
+    supports_offload = False
+    supports_streaming = True
+
+    def loads(self, data):  # pragma: no cover
+        """
+        Parse request body ``bytes``.
+        """
+        raise NotImplementedError()
+
+    def dumps(self, obj):  # pragma: no cover
+        """
+        Encode ``obj`` into ``bytes``.
+        """
+        raise NotImplementedError()
+
+    def decode(self, data):
+        """
+        Parse request body.
+
+        Raise :py:class:`~restic.exceptions.BadRequest` if the body is
+        malformed.
+        """
+        try:
+            return self.loads(data)
+        except ValueError as error:
+            raise BadRequest(self.malformed_message, details=str(error))
+
+    def encode(self, obj):
+        """
+        Encode response data into ``bytes``.
+        """
+        return self.dumps(obj)
+
+    def encode_items(self, items):  # pragma: no cover
+        """
+        Encode a chunk of list ``items`` for a streaming response: encoded
+        items separated by ``list_separator`` without list framing.
+        """
+        raise NotImplementedError()
+
+    def encode_error(self, error):
+        """
+        Encode :py:class:`~restic.exceptions.APIException` into error
+        response body ``{"message": ..., "details": ...}``.
+
+        Bodies of errors with default message and no details never change,
+        so they are encoded once per exception class and codec.
+        """
+        if error.details is None and error.message == type(error).message:
+            key = (self, type(error))
+            body = _ERROR_BODIES.get(key)
+            if body is None:
+                body = _ERROR_BODIES[key] = self.dumps(dict(message=error.message, details=None))
+            return body
+        return self.dumps(dict(message=error.message, details=error.details))
+
+
+class JSONCodec(Codec):
+    """
+    JSON codec based on the standard library ``json`` module.
+
+    Subclasses should override :py:meth:`.JSONCodec.loads` and
+    :py:meth:`.JSONCodec.dumps` methods.
+    """
+    content_type = 'application/json'
+    media_types = ('application/json',)
+    malformed_message = 'Malformed JSON.'
+    list_start = b'['
+    list_separator = b','
+    list_end = b']'
+    supports_offload = True
+
+    def loads(self, data):
+        """
+        Parse JSON document from ``bytes``.
+        """
+        return json.loads(data.decode('utf-8'))
+
+    def dumps(self, obj):
+        """
+        Encode ``obj`` into JSON ``bytes``.
+        """
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def encode(self, obj):
+        """
+        Encode response data into ``bytes``.
+
+        :py:class:`.Fragment` objects are supported at the top level and
+        inside lists and dicts that directly contain them.
+        """
+        if isinstance(obj, Fragment):
+            return obj.data
+        if isinstance(obj, (list, tuple)):
+            if any(isinstance(item, Fragment) for item in obj):
+                return b'[' + b','.join(self.encode(item) for item in obj) + b']'
+        elif isinstance(obj, dict):
+            if any(isinstance(value, Fragment) for value in obj.values()):
+                return b'{' + b','.join(
+                    self.dumps(str(key)) + b':' + self.encode(value)
+                    for key, value
+                    in obj.items()
+                ) + b'}'
+        return self.dumps(obj)
+
+    def encode_items(self, items):
+        return self.encode(items)[1:-1]
+
+
+class UJSONCodec(JSONCodec):
+    """
+    JSON codec based on ``ujson`` package.
+    """
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, data):
+        return self._ujson.loads(data)
+
+    def dumps(self, obj):
+        return self._ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+class ORJSONCodec(JSONCodec):
+    """
+    JSON codec based on ``orjson`` package.
+    """
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps(self, obj):
+        """
+        Encode ``obj`` into JSON ``bytes``.
+
+        Non-string dict keys are stringified like the standard library does.
+        Falls back to :py:class:`JSONCodec` for values ``orjson`` rejects
+        (e.g. integers wider than 64 bits).
+        """
+        try:
+            return self._orjson.dumps(obj, option=self._orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super(ORJSONCodec, self).dumps(obj)
+
+
+class NDJSONCodec(Codec):
+    """
+    Newline-delimited JSON codec: lists are encoded as one JSON document
+    per line, other values as a single line.
+
+    Request bodies are decoded into lists. Each line is encoded & decoded
+    by ``json_codec`` (the default JSON codec if omitted).
+    """
+    content_type = 'application/x-ndjson'
+    media_types = ('application/x-ndjson',)
+    malformed_message = 'Malformed NDJSON.'
+
+    def __init__(self, json_codec=None):
+        self.json_codec = json_codec or get_default_codec()
+
+    def loads(self, data):
+        return [
+            self.json_codec.loads(line)
+            for line
+            in data.split(b'\n')
+            if line.strip()
+        ]
+
+    def dumps(self, obj):
+        return self.json_codec.dumps(obj) + b'\n'
+
+    def encode(self, obj):
+        if isinstance(obj, (list, tuple)):
+            return self.encode_items(obj)
+        return self.json_codec.encode(obj) + b'\n'
+
+    def encode_items(self, items):
+        encode = self.json_codec.encode
+        return b''.join(encode(item) + b'\n' for item in items)
+
+
+class MessagePackCodec(Codec):
+    """
+    MessagePack codec based on ``msgpack`` package.
+
+    Lists are always packed as MessagePack arrays. An array header needs
+    the number of items, so lists are not streamed with this codec and
+    viewsets with ``STREAM_LIST`` send buffered responses instead.
+
+    :py:class:`.Fragment` objects are decoded from JSON before packing,
+    which costs a JSON parse per fragment. Viewsets build fragments only
+    for codecs that support offloading, so this codec gets them only from
+    serializers that return fragments themselves.
+    """
+    content_type = 'application/msgpack'
+    media_types = ('application/msgpack', 'application/x-msgpack')
+    malformed_message = 'Malformed MessagePack.'
+    supports_streaming = False
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def loads(self, data):
+        try:
+            return self._msgpack.unpackb(data, raw=False)
+        except self._msgpack.UnpackException as error:
+            raise ValueError(str(error) or type(error).__name__)
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True, default=self._default)
+
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, Fragment):
+            return json.loads(obj.data.decode('utf-8'))
+        raise TypeError('Cannot serialize {!r}.'.format(obj))
+
+    def encode_items(self, items):
+        return b''.join(self.dumps(item) for item in items)
+
+
+def parse_accept(header):
+    """
+    Parse ``Accept`` header into a dict of media range -> quality.
+    """
+    result = {}
+    for item in header.split(','):
+        media_range, _, params = item.partition(';')
+        media_range = media_range.strip().lower()
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        result[media_range] = quality
+    return result
+
+
+@lru_cache(maxsize=256)
+def negotiate(header, default, codecs):
+    """
+    Return codec from ``default`` codec and ``codecs`` tuple that best
+    matches ``Accept`` ``header`` or ``None`` if none of them is acceptable.
+
+    ``default`` is returned if there is no header or qualities are equal.
+    """
+    if not header:
+        return default
+    accepted = parse_accept(header)
+    best, best_quality = None, 0.0
+    for codec in (default,) + codecs:
+        for media_type in codec.media_types:
+            for media_range in (media_type, media_type.partition('/')[0] + '/*', '*/*'):
+                if media_range in accepted:
+                    quality = accepted[media_range]
+                    if quality > best_quality:
+                        best, best_quality = codec, quality
+                    break
+    return best
+
+
+def get_codec_by_content_type(content_type, default, codecs):
+    """
+    Return codec from ``default`` codec and ``codecs`` tuple for request
+    body of ``content_type``. Return ``default`` for unknown media types.
+    """
+    if content_type:
+        media_type = content_type.partition(';')[0].strip().lower()
+        for codec in codecs:
+            if media_type in codec.media_types:
+                return codec
+    return default
+
+
+def get_default_codec():
+    """
+    Return an instance of the fastest codec available.
+    """
+    for codec_class in (ORJSONCodec, UJSONCodec):
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+    return JSONCodec()
+
+
+DEFAULT_CODEC = get_default_codec()
+
+
+def get_default_codecs():
+    """
+    Return a tuple of codecs negotiated by default besides the default one.
+    """
+    codecs = [NDJSONCodec(DEFAULT_CODEC)]
+    try:
+        codecs.append(MessagePackCodec())
+    except ImportError:
+        pass
+    return tuple(codecs)
+
+
+DEFAULT_CODECS = get_default_codecs()
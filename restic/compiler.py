@@ -0,0 +1,130 @@
+"""
+Generation of specialised serialize & validate functions for serializers
+(see ``COMPILED`` attribute of :py:class:`~restic.serializers.Serializer`).
+"""
+from collections import Mapping
+
+from restic.fields import ValidationError, is_batched, is_plain
+
+
+class CompiledSerializer(object):
+    """
+    Specialised serialize & validate functions for a set of fields.
+
+    Built by :py:func:`compile_fields`. Holds three generated functions:
+
+    * ``serialize_items(serializer, models)`` - serialize a list of
+      dict-like models.
+    * ``serialize_attrs(serializer, models)`` - serialize a list of
+      object models.
+    * ``validate(serializer, data, allow_partial)`` - same contract as
+      :py:meth:`~restic.serializers.Serializer._try_validate`.
+    """
+    def __init__(self, serialize_items, serialize_attrs, validate):
+        self.serialize_items = serialize_items
+        self.serialize_attrs = serialize_attrs
+        self.validate = validate
+
+    def serialize_many(self, serializer, models):
+        """
+        Serialize a list of models.
+
+        The access style (``getitem`` or ``getattr``) is chosen once
+        by looking at the first model, so all models in the list
+        are expected to be of the same kind.
+        """
+        if not models:
+            return []
+        if isinstance(models[0], Mapping):
+            return self.serialize_items(serializer, models)
+        return self.serialize_attrs(serializer, models)
+
+    def serialize(self, serializer, model):
+        """
+        Serialize a single model.
+        """
+        return self.serialize_many(serializer, [model])[0]
+
+
+def compile_fields(fields):
+    """
+    Generate specialised serialize & validate functions for ``fields``.
+
+    Plain :py:class:`~restic.fields.Field` instances (that do not override value access,
+    ``to_representation`` or ``to_internal_value``) are inlined into the
+    generated code, fields that override ``to_representation_many`` convert
+    the whole list at once, other fields are called through their methods.
+
+    Return :py:class:`.CompiledSerializer` instance.
+    """
+    namespace = dict(
+        ValidationError=ValidationError
+    )
+    items = []
+    attrs = []
+    columns = []
+    validate = [
+        'def validate(serializer, data, allow_partial):',
+        '    validated_data = {}',
+        '    errors = {}',
+    ]
+    for index, (name, field) in enumerate(fields.items()):
+        key = repr(name)
+        if is_batched(field):
+            namespace['_many{}'.format(index)] = field.to_representation_many
+            columns.append(index)
+            items.append('{}: _value{}'.format(key, index))
+            attrs.append('{}: _value{}'.format(key, index))
+        elif is_plain(field, 'to_representation'):
+            items.append('{}: model[{}]'.format(key, key))
+            attrs.append('{}: model.{}'.format(key, name))
+        else:
+            namespace['_repr{}'.format(index)] = field.to_representation
+            call = '{}: _repr{}(serializer, model, {})'.format(key, index, key)
+            items.append(call)
+            attrs.append(call)
+
+        if field.read_only:
+            continue
+        validate.append('    if {} in data:'.format(key))
+        if is_plain(field, 'to_internal_value'):
+            validate.append('        validated_data[{}] = data[{}]'.format(key, key))
+        else:
+            namespace['_parse{}'.format(index)] = field.to_internal_value
+            validate.extend([
+                '        try:',
+                '            validated_data[{}] = _parse{}(serializer, {}, data[{}])'.format(key, index, key, key),
+                '        except ValidationError as error:',
+                '            errors[{}] = str(error)'.format(key),
+            ])
+        if field.required:
+            validate.extend([
+                '    elif not allow_partial:',
+                '        errors[{}] = \'This field is required.\''.format(key),
+            ])
+    validate.append('    return validated_data, errors')
+
+    prepare = [
+        '    _column{} = _many{}(serializer, models, {})'.format(index, index, repr(list(fields)[index]))
+        for index
+        in columns
+    ]
+    loop = 'for model in models'
+    if columns:
+        loop = 'for model, {} in zip(models, {})'.format(
+            ', '.join('_value{}'.format(index) for index in columns),
+            ', '.join('_column{}'.format(index) for index in columns)
+        )
+    source = '\n'.join(
+        ['def serialize_items(serializer, models):'] + prepare +
+        ['    return [{{{}}} {}]'.format(', '.join(items), loop)] +
+        ['def serialize_attrs(serializer, models):'] + prepare +
+        ['    return [{{{}}} {}]'.format(', '.join(attrs), loop)] +
+        validate
+    )
+    exec(compile(source, '<compiled serializer>', 'exec'), namespace)  # pylint: disable=exec-used
+    return CompiledSerializer(
+        namespace['serialize_items'],
+        namespace['serialize_attrs'],
+        namespace['validate']
+    )
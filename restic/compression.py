@@ -0,0 +1,134 @@
+"""
+Response compression.
+
+Encoding is negotiated with ``Accept-Encoding`` request header. ``gzip``
+and ``deflate`` encodings are supported. Compressed output is
+deterministic (``gzip`` header has no timestamp), so compressed bodies
+can be cached.
+"""
+import zlib
+
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def parse_accept_encoding(header):
+    """
+    Parse ``Accept-Encoding`` header into a dict of encoding -> quality.
+    """
+    result = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        result[name] = quality
+    return result
+
+
+def choose_encoding(header, encodings=('gzip', 'deflate')):
+    """
+    Return the best of ``encodings`` acceptable by ``Accept-Encoding``
+    ``header`` or ``None`` if the response should not be compressed.
+    Earlier encodings are preferred if qualities are equal.
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    default = accepted.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def get_compressor(encoding, level=6):
+    """
+    Return ``zlib`` compression object for ``encoding``.
+    """
+    return zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+
+
+def compress(data, encoding, level=6):
+    """
+    Compress ``data`` bytes with ``encoding``.
+    """
+    compressor = get_compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def variant_etag(etag, encoding):
+    """
+    Return ``ETag`` of ``encoding`` variant of a response with ``etag``.
+    """
+    if etag.endswith('"'):
+        return '{}-{}"'.format(etag[:-1], encoding)
+    return '{}-{}'.format(etag, encoding)
+
+
+def add_vary(headers, name='Accept-Encoding'):
+    """
+    Add ``name`` to ``Vary`` header in ``headers`` dict.
+    """
+    vary = headers.get('Vary')
+    if not vary:
+        headers['Vary'] = name
+    elif name.lower() not in [item.strip().lower() for item in vary.split(',')]:
+        headers['Vary'] = '{}, {}'.format(vary, name)
+
+
+class CompressedStream(object):
+    """
+    Proxy of a streaming response that compresses written data.
+
+    Each write is flushed with ``Z_SYNC_FLUSH``, so the client receives
+    compressed data as it is written rather than when the stream ends.
+    """
+    __slots__ = ('response', 'compressor')
+
+    def __init__(self, response, compressor):
+        self.response = response
+        self.compressor = compressor
+
+    def write(self, data):
+        """
+        Compress ``data`` and write the result to the response.
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if not data:
+            return None
+        return self.response.write(self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH))
+
+
+def compress_stream(response, encoding, level=6):
+    """
+    Make streaming ``response`` compress its body with ``encoding``.
+    """
+    streaming_fn = response.streaming_fn
+
+    async def compressed_streaming_fn(target):
+        """
+        Run original streaming function through compressing proxy.
+        """
+        compressor = get_compressor(encoding, level)
+        result = streaming_fn(CompressedStream(target, compressor))
+        if result is not None:
+            await result
+        result = target.write(compressor.flush())
+        if result is not None:
+            await result
+
+    response.streaming_fn = compressed_streaming_fn
+    response.headers['Content-Encoding'] = encoding
@@ -0,0 +1,121 @@
+"""
+Conditional requests logic (``ETag``, ``Last-Modified`` and friends).
+"""
+from calendar import timegm
+from datetime import datetime
+from email.utils import formatdate, parsedate
+from hashlib import sha1
+
+from sanic.response import HTTPResponse
+
+
+def version_etag(version, variant=''):
+    """
+    Return strong ``ETag`` for a model or collection ``version``.
+
+    ``variant`` (for example, query string) distinguishes different
+    representations of the same version.
+    """
+    if variant:
+        return '"{}-{}"'.format(version, sha1(variant.encode('utf-8')).hexdigest()[:16])
+    return '"{}"'.format(version)
+
+
+def body_etag(body):
+    """
+    Return strong ``ETag`` computed from rendered response body.
+    """
+    return '"{}"'.format(sha1(body).hexdigest())
+
+
+def etag_matches(header, etag, weak=True):
+    """
+    Check if ``etag`` matches ``If-Match`` or ``If-None-Match`` header value.
+
+    Weak comparison (used for ``If-None-Match``) ignores ``W/`` prefixes.
+    """
+    if header.strip() == '*':
+        return True
+    if weak:
+        etag = etag[2:] if etag.startswith('W/') else etag
+    elif etag.startswith('W/'):
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def http_date(value):
+    """
+    Format ``datetime`` or timestamp as HTTP date.
+
+    Naive datetimes are treated as UTC.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = timegm(value.timetuple())
+        else:
+            value = value.timestamp()
+    return formatdate(value, usegmt=True)
+
+
+def parse_http_date(value):
+    """
+    Parse HTTP date and return timestamp or ``None`` if it is invalid.
+    """
+    parsed = parsedate(value)
+    if parsed is None:
+        return None
+    return timegm(parsed)
+
+
+def is_not_modified(request_headers, etag=None, last_modified=None):
+    """
+    Check if client already has the representation identified by ``etag``
+    and ``last_modified`` (HTTP date string) according to its
+    ``If-None-Match`` and ``If-Modified-Since`` headers.
+    """
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag is not None and etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get('If-Modified-Since')
+    if if_modified_since is not None and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        modified = parse_http_date(last_modified)
+        return since is not None and modified is not None and modified <= since
+    return False
+
+
+def is_precondition_failed(request_headers, etag=None, last_modified=None):
+    """
+    Check if ``If-Match`` or ``If-Unmodified-Since`` preconditions of
+    a write request fail for current ``etag`` and ``last_modified``.
+
+    Invalid ``If-Unmodified-Since`` dates are ignored (RFC 7232, 3.4).
+    """
+    if_match = request_headers.get('If-Match')
+    if if_match is not None:
+        if if_match.strip() == '*':
+            return False
+        return etag is None or not etag_matches(if_match, etag, weak=False)
+    if_unmodified_since = request_headers.get('If-Unmodified-Since')
+    if if_unmodified_since is not None and last_modified is not None:
+        since = parse_http_date(if_unmodified_since)
+        if since is None:
+            return False
+        modified = parse_http_date(last_modified)
+        return modified is None or modified > since
+    return False
+
+
+def not_modified_response(headers):
+    """
+    Return ``304 Not Modified`` response with validator ``headers``.
+    """
+    return HTTPResponse(status=304, headers=dict(headers))
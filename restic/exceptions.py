@@ -50,9 +50,40 @@ class NotFound(APIException):
     message = 'Not Found'
 
 
+class ModelNotFound(NotFound):
+    """
+    "Not Found" exception for a model looked up by primary key.
+    """
+    message = 'Model with such primary key was not found.'
+
+
 class MethodNotAllowed(APIException):
     """
     "Method Not Allowed" exception.
     """
     status = 405
     message = 'Method Not Allowed'
+
+
+class NotAcceptable(APIException):
+    """
+    "Not Acceptable" exception.
+    """
+    status = 406
+    message = 'Not Acceptable'
+
+
+class PreconditionFailed(APIException):
+    """
+    "Precondition Failed" exception.
+    """
+    status = 412
+    message = 'Precondition Failed'
+
+
+class UnsupportedMediaType(APIException):
+    """
+    "Unsupported Media Type" exception.
+    """
+    status = 415
+    message = 'Unsupported Media Type'
@@ -0,0 +1,604 @@
+"""
+Serializer fields.
+"""
+from collections import Mapping, OrderedDict
+from datetime import datetime, timedelta, timezone
+from inspect import isawaitable, iscoroutinefunction
+from itertools import combinations
+
+
+class ValidationError(Exception):
+    """
+    Field validation error.
+
+    Should be raised by ``to_internal_value`` method of fields
+    if the user input is not valid for this field.
+    """
+    pass
+
+
+class Field(object):
+    """
+    Generic serializer field.
+
+    Represents a top-level field in serializer.
+
+    Two methods can be overrided: :py:meth:`.Field.to_representation`
+    and :py:meth:`.Field.to_internal_value`.
+
+    Example usage:
+
+    .. code-block:: python
+
+        class CatSerializer(Serializer):
+            name = Field()
+            breed = Field()
+    """
+    def __init__(self, required=False, read_only=False):
+        self.required = required
+        self.read_only = read_only
+
+    def get_model_value(self, model, name):
+        """
+        Return model field by name.
+
+        Because model can be either dict-like object or an object,
+        we check if we should use ``getattr`` or ``getitem`` to retrieve it.
+        """
+        if isinstance(model, Mapping):
+            return model[name]
+        return getattr(model, name)
+
+    def set_model_value(self, model, name, value):
+        """
+        Set model field by name.
+
+        Because model can be either dict-like object or an object,
+        we check if we should use ``setattr`` or ``setitem`` to retrieve it.
+        """
+        if isinstance(model, Mapping):
+            model[name] = value
+        return setattr(model, name, value)
+
+    def to_representation(self, serializer, model, name):
+        """
+        Return a representation of data in this field.
+
+        Result should be a JSON-serializable data.
+
+        For example: format ``datetime`` object in ``value``
+        and return it as ``str``.
+        """
+        return self.get_model_value(model, name)
+
+    def to_representation_many(self, serializer, models, name):
+        """
+        Return a list of representations of data in this field
+        for all ``models`` in a list.
+
+        Used when serializing lists column by column. Override it to convert
+        values of many models at once (for example, with NumPy).
+        Default implementation calls ``to_representation`` for each model.
+        """
+        if is_plain(self, 'to_representation'):
+            mappings = are_mappings(models)
+            if mappings:
+                return [model[name] for model in models]
+            if mappings is not None:
+                return [getattr(model, name) for model in models]
+        return [
+            self.to_representation(serializer, model, name)
+            for model
+            in models
+        ]
+
+    def to_internal_value(self, serializer, name, data):
+        """
+        Parse user data and convert it into internal model value.
+
+        For example: parse ``data`` string as timestamp and return it
+        as ``datetime`` object.
+        """
+        return data
+
+    def prefetch(self, serializer, models, name):
+        """
+        Load data needed to represent this field for ``models`` before
+        they are serialized.
+
+        Return an awaitable if loading is asynchronous.
+        Default implementation does nothing.
+        """
+        return None
+
+    def prime(self, serializer, models, name):
+        """
+        Load data needed to represent this field for ``models`` if it can
+        be loaded synchronously.
+
+        Called before lists are serialized model by model.
+        Default implementation does nothing.
+        """
+        return None
+
+
+class SerializerMethodField(Field):
+    """
+    Method field.
+
+    This field allows you to specify custom serialization function for
+    related model. Value represented by this field is read-only.
+
+    Function should be a member of a serializer where this field is defined.
+
+    Default method name is ``'get_' + field_name``.
+
+    Example usage:
+
+    .. code-block:: python
+
+        class ColorSerializer(Serializer):
+            first_name = Field()
+            last_name = Field()
+            full_name = SerializerMethodField()
+
+            def get_full_name(self, instance):
+                return instance.first_name + instance.last_name
+    """
+    def __init__(self, method_name=None, required=False):
+        self.method_name = method_name
+        super(SerializerMethodField, self).__init__(required=required, read_only=True)
+
+    def to_representation(self, serializer, model, name):
+        """
+        Return a result of calling ``method`` for attached instance.
+        """
+        method_name = self.method_name
+        if method_name is None:
+            method_name = 'get_' + name
+        return getattr(serializer, method_name)(model)
+
+    def to_representation_many(self, serializer, models, name):
+        """
+        Return a list of results of calling ``method`` for all ``models``.
+        """
+        method_name = self.method_name
+        if method_name is None:
+            method_name = 'get_' + name
+        method = getattr(serializer, method_name)
+        return [method(model) for model in models]
+
+
+class RelatedField(Field):
+    """
+    Nested representation of related models loaded in batches.
+
+    ``source`` model field (field name by default) contains the key of
+    the related model (or a list of keys if ``many`` is ``True``). Related
+    models are loaded by ``loader_class`` (a
+    :py:class:`~restic.loaders.BatchLoader` subclass) with one call for
+    all serialized models and represented by ``serializer_class``.
+    Missing related models are represented by ``None``.
+
+    Asynchronous loaders are called by
+    :py:meth:`~restic.serializers.Serializer.prefetch`, which model mixins await before
+    serialization. Synchronous loaders are called by
+    :py:meth:`~restic.serializers.Serializer.serialize` once for the whole list if needed.
+
+    Value represented by this field is read-only.
+
+    Example usage:
+
+    .. code-block:: python
+
+        class ItemSerializer(Serializer):
+            owner = RelatedField(OwnerSerializer, OwnerLoader, source='owner_id')
+            tags = RelatedField(TagSerializer, TagLoader, source='tag_ids', many=True)
+    """
+    def __init__(self, serializer_class, loader_class, source=None, many=False):
+        self.serializer_class = serializer_class
+        self.loader_class = loader_class
+        self.source = source
+        self.many = many
+        super(RelatedField, self).__init__(read_only=True)
+
+    def get_keys(self, models, name):
+        """
+        Return a list of keys of related models for each model
+        (lists of keys if ``many`` is ``True``).
+        """
+        source = self.source or name
+        return [self.get_model_value(model, source) for model in models]
+
+    def _flatten(self, keys):
+        if self.many:
+            return [key for item in keys for key in (item or ())]
+        return keys
+
+    def prefetch(self, serializer, models, name):
+        """
+        Load related models of ``models`` and prefetch their own
+        related models.
+        """
+        loader = serializer.get_loader(self.loader_class)
+        keys = self._flatten(self.get_keys(models, name))
+        result = loader.prime(keys)
+        if isawaitable(result):
+            return self._await_prefetch(serializer, loader, keys, result)
+        return self._prefetch_nested(serializer, loader, keys)
+
+    async def _await_prefetch(self, serializer, loader, keys, result):
+        await result
+        result = self._prefetch_nested(serializer, loader, keys)
+        if isawaitable(result):
+            await result
+
+    def _prefetch_nested(self, serializer, loader, keys):
+        related = self._get_related(loader, keys)
+        if not related:
+            return None
+        return self.serializer_class(related, many=True, context=serializer.context).prefetch()
+
+    def prime(self, serializer, models, name):
+        """
+        Load related models of ``models`` and their own related models
+        if ``loader_class`` is synchronous.
+
+        Related models of asynchronous loaders are left to
+        :py:meth:`~restic.serializers.Serializer.prefetch`.
+        """
+        loader = serializer.get_loader(self.loader_class)
+        if iscoroutinefunction(loader.load_many):
+            return
+        keys = self._flatten(self.get_keys(models, name))
+        loader.prime(keys)
+        related = self._get_related(loader, keys)
+        if related:
+            self.serializer_class(related, many=True, context=serializer.context).prime()
+
+    @staticmethod
+    def _get_related(loader, keys):
+        related = [loader.get(key) for key in OrderedDict.fromkeys(keys)]
+        return [model for model in related if model is not None]
+
+    def to_representation(self, serializer, model, name):
+        return self.to_representation_many(serializer, [model], name)[0]
+
+    def to_representation_many(self, serializer, models, name):
+        loader = serializer.get_loader(self.loader_class)
+        keys = self.get_keys(models, name)
+        unique_keys = list(OrderedDict.fromkeys(self._flatten(keys)))
+        if not all(loader.is_loaded(key) for key in unique_keys):
+            if iscoroutinefunction(loader.load_many):
+                raise RuntimeError(
+                    'Related models of asynchronous loader {} must be loaded with prefetch().'.format(
+                        self.loader_class.__name__
+                    )
+                )
+            loader.prime(unique_keys)
+
+        related = OrderedDict()
+        for key in unique_keys:
+            model = loader.get(key)
+            if model is not None:
+                related[key] = model
+        representations = dict(zip(
+            related,
+            self.serializer_class(list(related.values()), many=True, context=serializer.context).serialize()
+        ))
+        if self.many:
+            return [
+                [representations.get(key) for key in item] if item is not None else None
+                for item
+                in keys
+            ]
+        return [representations.get(key) for key in keys]
+
+
+ISO_FORMATS = {
+    '%Y-%m-%dT%H:%M:%S.%f': ('T', 'microseconds'),
+    '%Y-%m-%d %H:%M:%S.%f': (' ', 'microseconds'),
+    '%Y-%m-%dT%H:%M:%S': ('T', 'seconds'),
+    '%Y-%m-%d %H:%M:%S': (' ', 'seconds'),
+    '%Y-%m-%dT%H:%M:%S.%f%z': ('T', 'microseconds'),
+    '%Y-%m-%d %H:%M:%S.%f%z': (' ', 'microseconds'),
+    '%Y-%m-%dT%H:%M:%S%z': ('T', 'seconds'),
+    '%Y-%m-%d %H:%M:%S%z': (' ', 'seconds'),
+}
+
+HAS_FROMISOFORMAT = hasattr(datetime, 'fromisoformat')
+
+# ``strptime`` directives that match digits (and spaces) only.
+NUMERIC_DIRECTIVES = frozenset('dfGHIjmMSuUVwWyY')
+
+
+def _has_stock_formatting(value):
+    """
+    Check if ``value`` is a ``datetime`` whose class does not override
+    ``isoformat`` or ``strftime``, so one can stand in for the other.
+    """
+    cls = type(value)
+    return (
+        issubclass(cls, datetime) and
+        cls.isoformat is datetime.isoformat and
+        cls.strftime is datetime.strftime
+    )
+
+
+def _punctuation(format_str):
+    """
+    Return punctuation characters ``format_str`` matches, in order, or
+    ``None`` if it has directives that can match punctuation.
+    """
+    punctuation = []
+    chars = iter(format_str)
+    for char in chars:
+        if char == '%':
+            directive = next(chars, '')
+            if directive == '%':
+                punctuation.append(directive)
+            elif directive not in NUMERIC_DIRECTIVES:
+                return None
+        elif not char.isalnum() and not char.isspace():
+            punctuation.append(char)
+    return ''.join(punctuation)
+
+
+def _are_exclusive(format_str, other):
+    """
+    Check if no string can be parsed with both ``format_str`` and ``other``.
+    """
+    if format_str in ISO_FORMATS and other in ISO_FORMATS:
+        return format_str != other
+    punctuation = _punctuation(format_str)
+    return punctuation is not None and _punctuation(other) not in (None, punctuation)
+
+
+def parse_iso_datetime(data):
+    """
+    Parse ISO 8601 string like ``'2010-12-31T12:34:56.421337+02:00'``.
+
+    Return a tuple of ``(format_str, value)``, where ``format_str`` is
+    the ``strptime`` format (one of ``ISO_FORMATS``) that describes
+    ``data``, or ``(None, None)`` if ``data`` is not in one of these formats.
+
+    Uses ``datetime.fromisoformat`` where it is available.
+    """
+    if (
+            len(data) < 19 or
+            data[10] not in 'T ' or
+            data[4] + data[7] + data[13] + data[16] != '--::' or
+            not (data[0:4] + data[5:7] + data[8:10] + data[11:13] + data[14:16] + data[17:19]).isdigit()
+    ):
+        return None, None
+
+    format_str = '%Y-%m-%d' + data[10] + '%H:%M:%S'
+    rest = data[19:]
+    fraction = ''
+    if rest[:1] == '.':
+        end = 1
+        while end < len(rest) and rest[end].isdigit():
+            end += 1
+        fraction = rest[1:end]
+        if not fraction or len(fraction) > 6:
+            return None, None
+        format_str += '.%f'
+        rest = rest[end:]
+
+    tzinfo = None
+    if rest:
+        if rest == 'Z':
+            tzinfo = timezone.utc
+        elif (
+                rest[0] in '+-' and
+                (len(rest) == 5 or len(rest) == 6 and rest[3] == ':') and
+                (rest[1:3] + rest[-2:]).isdigit()
+        ):
+            offset = timedelta(hours=int(rest[1:3]), minutes=int(rest[-2:]))
+            tzinfo = timezone(-offset if rest[0] == '-' else offset)
+        else:
+            return None, None
+        format_str += '%z'
+
+    try:
+        if HAS_FROMISOFORMAT:
+            try:
+                return format_str, datetime.fromisoformat(data)  # pylint: disable=no-member
+            except ValueError:
+                pass
+        return format_str, datetime(
+            int(data[0:4]), int(data[5:7]), int(data[8:10]),
+            int(data[11:13]), int(data[14:16]), int(data[17:19]),
+            int(fraction.ljust(6, '0')) if fraction else 0,
+            tzinfo
+        )
+    except ValueError:
+        return None, None
+
+
+class NaiveDateTimeField(Field):
+    """
+    Naive datetime field.
+
+    Provides serializing/deserializing of ``datetime`` objects.
+
+    ``format_str`` can be a string or list/tuple of strings. I this case
+    all formats be used to try to unserialize datetime, but only first
+    will be used to serialize it into string.
+
+    ISO 8601 formats (see ``ISO_FORMATS``) are handled without ``strptime``
+    and ``strftime``. Other formats are tried in order. If no string can
+    match more than one format (e.g. ``%d.%m.%Y`` and ``%d/%m/%Y``), the
+    one that succeeded most recently is tried first. Otherwise ambiguous
+    strings are always parsed with the first declared format matching them.
+    """
+    DEFAULT_FORMATS = (
+        '%Y-%m-%dT%H:%M:%S.%f',
+        '%Y-%m-%d %H:%M:%S.%f',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%d %H:%M:%S'
+    )
+
+    def __init__(self, formats=DEFAULT_FORMATS, required=False, read_only=False):
+        if not isinstance(formats, (list, tuple)):
+            formats = [formats]
+        assert formats, 'At least one datetime format is required!'
+        self.formats = formats
+        self._parse_formats = list(formats)
+        self._adaptive = all(_are_exclusive(format_str, other) for format_str, other in combinations(formats, 2))
+        self._iso_formats = frozenset(
+            format_str
+            for index, format_str
+            in enumerate(formats)
+            if format_str in ISO_FORMATS and all(_are_exclusive(format_str, other) for other in formats[:index])
+        )
+        self._iso_output = ISO_FORMATS.get(formats[0])
+        super(NaiveDateTimeField, self).__init__(required=required, read_only=read_only)
+
+    def to_representation(self, serializer, model, name):
+        """
+        Return the datetime object converted to string.
+        """
+        return self.format(self.get_model_value(model, name))
+
+    def to_representation_many(self, serializer, models, name):
+        """
+        Return a list of representations of this field for all ``models``.
+
+        Batched version of :py:meth:`.NaiveDateTimeField.to_representation`
+        used when serializing lists.
+        """
+        mappings = are_mappings(models)
+        if mappings:
+            values = [model[name] for model in models]
+        elif mappings is not None:
+            values = [getattr(model, name) for model in models]
+        else:
+            values = [self.get_model_value(model, name) for model in models]
+        return self.format_many(values)
+
+    def format(self, value):
+        """
+        Return ``value`` converted to string.
+        """
+        iso_output = self._iso_output
+        if iso_output is not None and _has_stock_formatting(value) and value.tzinfo is None and value.year >= 1000:
+            return value.isoformat(*iso_output)
+        assert isinstance(value, datetime), 'Expected datetime, got {}'.format(repr(value))
+        assert value.tzinfo is None, 'Expected naive datetime, got timezone-aware datetime'
+        return value.strftime(self.formats[0])
+
+    def format_many(self, values):
+        """
+        Return a list of ``values`` converted to strings.
+        """
+        iso_output = self._iso_output
+        if iso_output is None:
+            return [self.format(value) for value in values]
+        separator, timespec = iso_output
+        return [
+            value.isoformat(separator, timespec)
+            if _has_stock_formatting(value) and value.tzinfo is None and value.year >= 1000
+            else self.format(value)
+            for value
+            in values
+        ]
+
+    def to_internal_value(self, serializer, name, data):
+        """
+        Parse string and return datetime object.
+        """
+        if self._iso_formats and isinstance(data, str):
+            format_str, value = parse_iso_datetime(data)
+            if format_str in self._iso_formats:
+                return value
+
+        formats = self._parse_formats
+        for format_str in formats:
+            try:
+                value = datetime.strptime(data, format_str)
+            except (ValueError, TypeError):
+                continue
+            if self._adaptive and format_str is not formats[0]:
+                self._parse_formats = [format_str] + [
+                    other
+                    for other
+                    in formats
+                    if other is not format_str
+                ]
+            return value
+        raise ValidationError('Could not parse {}, formats tried: {}.'.format(
+            repr(data),
+            repr(self.formats)
+        ))
+
+
+class AwareDateTimeField(NaiveDateTimeField):
+    """
+    Timezone-aware datetime field.
+
+    Provides serializing/deserializing of ``datetime`` objects with timezone.
+    """
+    DEFAULT_FORMATS = (
+        '%Y-%m-%dT%H:%M:%S.%f%z',
+        '%Y-%m-%d %H:%M:%S.%f%z',
+        '%Y-%m-%dT%H:%M:%S%z',
+        '%Y-%m-%d %H:%M:%S%z',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(AwareDateTimeField, self).__init__(*args, **kwargs)
+        if not self.formats[0].endswith('%z'):
+            self._iso_output = None
+
+    def format(self, value):
+        """
+        Return ``value`` converted to string.
+        """
+        iso_output = self._iso_output
+        if iso_output is not None and _has_stock_formatting(value) and value.year >= 1000:
+            offset = value.utcoffset()
+            if offset is not None and not offset.microseconds and not offset.seconds % 60:
+                text = value.isoformat(*iso_output)
+                return text[:-3] + text[-2:]
+        assert isinstance(value, datetime), 'Expected datetime, got {}'.format(repr(value))
+        assert value.tzinfo is not None, 'Expected timezone-aware datetime, got naive datetime'
+        return value.strftime(self.formats[0])
+
+    def format_many(self, values):
+        """
+        Return a list of ``values`` converted to strings.
+        """
+        return [self.format(value) for value in values]
+
+
+def is_plain(field, method_name):
+    """
+    Check if ``method_name`` of field (and value access) are not overridden,
+    so field can be inlined into generated code.
+    """
+    field_class = type(field)
+    return (
+        getattr(field_class, method_name) is getattr(Field, method_name) and
+        field_class.get_model_value is Field.get_model_value
+    )
+
+
+def are_mappings(models):
+    """
+    Return ``True`` if all ``models`` are dict-like, ``False`` if none
+    of them are, or ``None`` if the list is mixed.
+    """
+    count = sum(1 for model in models if isinstance(model, Mapping))
+    if count == len(models):
+        return True
+    if not count:
+        return False
+    return None
+
+
+def is_batched(field):
+    """
+    Check if field overrides conversion of values of many models at once.
+    """
+    return type(field).to_representation_many is not Field.to_representation_many
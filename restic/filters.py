@@ -0,0 +1,260 @@
+"""
+Filtering & ordering of lists.
+
+Clients filter lists with query parameters named after model fields,
+optionally with an operator suffix:
+
+* ``?name=Foo`` - field equals the value
+* ``?id__in=1,2,3`` - field equals any of comma-separated values
+* ``?id__gt=1``, ``?id__gte=1``, ``?id__lt=1``, ``?id__lte=1`` - ranges
+
+and order them with ``?ordering=-date_created,id`` (``-`` means descending
+order).
+
+Values of fields with a known type (see ``convert`` argument of
+:py:func:`.parse_query`) are converted when the query is parsed. Other
+values are kept as :py:class:`.Literal` strings and converted to the type
+of the model value they are compared to, so ``?name=123`` matches
+the string ``'123'`` and ``?id=123`` matches the number ``123``.
+
+The parameters are parsed into a :py:class:`.Query` object which is passed
+to ``get_models`` as ``query`` hint, so data source can use its own
+indexes. If ``get_models`` does not accept ``query`` argument, the query
+is applied by :py:meth:`.Query.apply` to the models it returns.
+"""
+import json
+from collections import OrderedDict
+from itertools import chain
+from operator import ge, gt, le, lt
+
+from restic import exceptions
+from restic.utils import get_value
+
+OPERATORS = ('exact', 'in', 'gt', 'gte', 'lt', 'lte')
+SEPARATOR = '__'
+COMPARISONS = {'gt': gt, 'gte': ge, 'lt': lt, 'lte': le}
+
+
+def parse_literal(value):
+    """
+    Convert query parameter value into a number, boolean or ``None``
+    if it is a JSON literal, otherwise return it as is.
+    """
+    try:
+        result = json.loads(value)
+    except ValueError:
+        return value
+    if isinstance(result, (list, dict)):
+        return value
+    return result
+
+
+class Literal(str):
+    """
+    Query parameter value of a field with unknown type.
+    """
+    __slots__ = ()
+
+    def convert_like(self, value):
+        """
+        Return this literal converted to the type of model ``value``
+        (a number, boolean or ``None``), or the literal itself if it
+        does not represent a value of this type.
+        """
+        if value is None or isinstance(value, (bool, int, float)):
+            result = parse_literal(self)
+            if value is None:
+                return None if result is None else self
+            if isinstance(result, bool) == isinstance(value, bool) and isinstance(result, (int, float)):
+                return result
+        return self
+
+
+def _untyped(name, value):
+    return Literal(value)
+
+
+def _sort_key(value):
+    return (value is None, value)
+
+
+def _get_sort_key(name):
+    return lambda model: _sort_key(get_value(model, name))
+
+
+class Filter(object):
+    """
+    Single filter condition: ``name`` field compared by ``operator``
+    to ``value`` (a list of values for ``'in'`` operator).
+
+    :py:class:`.Literal` values are converted to the type of each
+    compared model value.
+    """
+    __slots__ = ('name', 'operator', 'value', '_converted')
+
+    def __init__(self, name, operator, value):
+        self.name = name
+        self.operator = operator
+        self.value = value
+        self._converted = {}
+
+    def __repr__(self):
+        return 'Filter({!r}, {!r}, {!r})'.format(self.name, self.operator, self.value)
+
+    def matches(self, model):
+        """
+        Return ``True`` if ``model`` satisfies this condition.
+        Values that cannot be compared do not match.
+        """
+        value = get_value(model, self.name)
+        expected = self.get_value_like(value)
+        operator = self.operator
+        try:
+            if operator == 'exact':
+                return value == expected
+            if operator == 'in':
+                return value in expected
+            if value is None:
+                return False
+            return COMPARISONS[operator](value, expected)
+        except TypeError:
+            return False
+
+    def get_value_like(self, value):
+        """
+        Return filter value with :py:class:`.Literal` items converted
+        to the type of model ``value``.
+        """
+        key = type(value)
+        if key in self._converted:
+            return self._converted[key]
+        if isinstance(self.value, list):
+            converted = [
+                item.convert_like(value) if isinstance(item, Literal) else item
+                for item
+                in self.value
+            ]
+        elif isinstance(self.value, Literal):
+            converted = self.value.convert_like(value)
+        else:
+            converted = self.value
+        self._converted[key] = converted
+        return converted
+
+
+class Query(object):
+    """
+    Filtering & ordering requested by the client.
+
+    ``filters`` is a list of :py:class:`.Filter` conditions (all of them
+    must match), ``ordering`` is a list of ``(name, descending)`` tuples.
+    """
+    def __init__(self, filters=(), ordering=()):
+        self.filters = list(filters)
+        self.ordering = list(ordering)
+
+    def __repr__(self):
+        return 'Query({!r}, {!r})'.format(self.filters, self.ordering)
+
+    def matches(self, model):
+        """
+        Return ``True`` if ``model`` satisfies all filters.
+        """
+        return all(condition.matches(model) for condition in self.filters)
+
+    def get_candidates(self, store):
+        """
+        Return a list of models from :py:class:`~restic.stores.MemoryStore`
+        that may match filters, looked up by primary key or a secondary
+        index, or ``None`` if no filter can use them.
+        """
+        for condition in self.filters:
+            if condition.operator not in ('exact', 'in'):
+                continue
+            values = [condition.value] if condition.operator == 'exact' else condition.value
+            values = OrderedDict.fromkeys(chain.from_iterable(
+                (value, parse_literal(value)) if isinstance(value, Literal) else (value,)
+                for value
+                in values
+            ))
+            if condition.name == store.pk:
+                return [model for model in store.get_many(values) if model is not None]
+            if condition.name in store.indexes:
+                return list(chain.from_iterable(store.find(condition.name, value) for value in values))
+        return None
+
+    def apply(self, models):
+        """
+        Return models matching filters in requested order.
+
+        Reference implementation for data sources that keep models in
+        memory. If ``models`` is a :py:class:`~restic.stores.MemoryStore`,
+        its indexes are used to narrow the search. Otherwise ``models`` are
+        filtered in a single pass; if no ordering is requested, the result
+        is a lazy iterator.
+        """
+        if hasattr(models, 'find') and hasattr(models, 'indexes'):
+            candidates = self.get_candidates(models)
+            models = models.values() if candidates is None else candidates
+        if self.filters:
+            models = (model for model in models if self.matches(model))
+        for name, descending in reversed(self.ordering):
+            models = sorted(models, key=_get_sort_key(name), reverse=descending)
+        return models
+
+    async def apply_async(self, models):
+        """
+        Asynchronous version of :py:meth:`.Query.apply` for asynchronous
+        iterables of models. Yields matching models.
+        """
+        if self.ordering:
+            for model in self.apply([model async for model in models]):
+                yield model
+            return
+        async for model in models:
+            if self.matches(model):
+                yield model
+
+
+def parse_query(args, filter_fields, ordering_fields, ordering_param='ordering', convert=_untyped):
+    """
+    Parse request query arguments into :py:class:`.Query`.
+
+    Only parameters named after ``filter_fields`` (with an optional operator
+    suffix) are used as filters, others are ignored. ``convert(name, value)``
+    converts each value of field ``name`` (values are kept as
+    :py:class:`.Literal` strings by default).
+
+    Return ``None`` if no filtering or ordering is requested.
+
+    Raise :py:class:`~restic.exceptions.BadRequest` on unknown operators and
+    ordering fields.
+    """
+    filters = []
+    for param, values in args.items():
+        name, _, operator = param.partition(SEPARATOR)
+        if name not in filter_fields:
+            continue
+        operator = operator or 'exact'
+        if operator not in OPERATORS:
+            raise exceptions.BadRequest('Unknown filter operator: {}.'.format(operator), details=list(OPERATORS))
+        for value in values:
+            if operator == 'in':
+                value = [convert(name, item) for item in value.split(',')]
+            else:
+                value = convert(name, value)
+            filters.append(Filter(name, operator, value))
+
+    ordering = []
+    value = args.get(ordering_param)
+    if value:
+        for name in value.split(','):
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name not in ordering_fields:
+                raise exceptions.BadRequest('Unknown ordering field: {}.'.format(name), details=list(ordering_fields))
+            ordering.append((name, descending))
+
+    if not filters and not ordering:
+        return None
+    return Query(filters, ordering)
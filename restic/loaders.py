@@ -0,0 +1,107 @@
+"""
+Batch loading of related models.
+
+A :py:class:`.BatchLoader` collects keys of related models needed to
+serialize a whole list and loads them with a single ``load_many`` call
+instead of one query per model (the "N+1 queries" problem).
+
+Loaders are used by :py:class:`~restic.fields.RelatedField`:
+
+.. code-block:: python
+
+    class OwnerLoader(BatchLoader):
+        async def load_many(self, keys):
+            return await db.fetch_owners(keys)
+
+
+    class OwnerSerializer(Serializer):
+        id = Field()
+        name = Field()
+
+
+    class ItemSerializer(Serializer):
+        id = Field()
+        owner = RelatedField(OwnerSerializer, OwnerLoader, source='owner_id')
+
+Loaded models are cached by the loader. Serializers of the same request
+share loaders through serializer context, so each related model is
+loaded at most once per request.
+"""
+from collections import Mapping, OrderedDict
+from inspect import isawaitable
+
+
+class BatchLoader(object):
+    """
+    Generic batch loader.
+
+    Subclasses must override :py:meth:`.BatchLoader.load_many`.
+
+    ``context`` is the serializer context of the request (see
+    :py:meth:`~restic.serializers.Serializer.get_loader`).
+    """
+    def __init__(self, context=None):
+        self.context = context
+        self._cache = {}
+
+    def load_many(self, keys):  # pragma: no cover
+        """
+        Load models by ``keys``.
+
+        Return either a list of models aligned with ``keys`` (``None`` for
+        missing models) or a dict that maps keys to models.
+
+        Can be a coroutine method.
+        """
+        raise NotImplementedError()
+
+    def prime(self, keys):
+        """
+        Load models for those of ``keys`` that are not loaded yet.
+        ``None`` keys are skipped.
+
+        Return an awaitable if ``load_many`` is a coroutine method.
+        """
+        cache = self._cache
+        missing = list(OrderedDict.fromkeys(
+            key
+            for key
+            in keys
+            if key is not None and key not in cache
+        ))
+        if not missing:
+            return None
+        result = self.load_many(missing)
+        if isawaitable(result):
+            return self._await_prime(missing, result)
+        self._store(missing, result)
+        return None
+
+    async def _await_prime(self, keys, result):
+        self._store(keys, await result)
+
+    def _store(self, keys, result):
+        if isinstance(result, Mapping):
+            for key in keys:
+                self._cache[key] = result.get(key)
+            return
+        result = list(result)
+        if len(result) != len(keys):
+            raise ValueError('load_many() returned {} models for {} keys.'.format(len(result), len(keys)))
+        self._cache.update(zip(keys, result))
+
+    def is_loaded(self, key):
+        """
+        Return ``True`` if model for ``key`` is loaded.
+        """
+        return key is None or key in self._cache
+
+    def get(self, key):
+        """
+        Return loaded model for ``key`` or ``None`` if it does not exist.
+
+        Raise ``KeyError`` if ``key`` is not loaded yet.
+        """
+        if key is None:
+            return None
+        return self._cache[key]
@@ -0,0 +1,277 @@
+"""
+Request metrics.
+
+Set ``METRICS`` attribute of a viewset to a :py:class:`.MetricsSink`
+instance to record duration & status of every request handled by the
+viewset, along with the time spent in each phase of handling:
+
+* ``fetch`` - getting models (``get_models``, ``get_model``, etc.)
+* ``serialize`` - serializing models
+* ``encode`` - encoding response body
+* ``compress`` - compressing response body (see ``COMPRESS_RESPONSES``)
+
+Metrics are keyed by viewset class name and action. Requests that raised
+an unhandled exception are recorded with status ``500``. Streaming
+responses are measured until the response is started.
+
+:py:class:`.PrometheusSink` aggregates metrics in memory and exposes them
+in Prometheus text format:
+
+.. code-block:: python
+
+    METRICS = PrometheusSink()
+
+    class ItemsViewSet(ModelViewSet):
+        METRICS = METRICS
+
+    app.blueprint(METRICS.create_blueprint('metrics'))  # GET /metrics
+
+When ``METRICS`` is ``None`` (default), nothing is measured.
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from time import perf_counter
+
+from sanic.blueprints import Blueprint
+from sanic.response import HTTPResponse
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class NullTimer(object):
+    """
+    Context manager that measures nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class PhaseTimer(object):
+    """
+    Context manager that adds time spent in its block to a phase timing.
+    """
+    __slots__ = ('phases', 'phase', 'start')
+
+    def __init__(self, phases, phase):
+        self.phases = phases
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.phases[self.phase] = self.phases.get(self.phase, 0) + perf_counter() - self.start
+        return False
+
+
+class RequestPhases(object):
+    """
+    Phase timings of a single request.
+    """
+    __slots__ = ('timings',)
+
+    def __init__(self):
+        self.timings = {}
+
+    def measure(self, phase):
+        """
+        Return a context manager that measures ``phase``.
+        """
+        return PhaseTimer(self.timings, phase)
+
+
+class Histogram(object):
+    """
+    Histogram of observed values with fixed bucket upper bounds.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Add ``value`` to histogram.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self):
+        """
+        Return a list of ``(upper_bound, count)`` tuples, where ``count`` is
+        the number of values less than or equal to ``upper_bound``.
+        The last upper bound is ``float('inf')``.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsSink(object):
+    """
+    Base class for metrics sinks.
+
+    Subclasses should override :py:meth:`.MetricsSink.observe`.
+    """
+    async def record(self, viewset, action, awaitable):
+        """
+        Await ``awaitable`` (request handling by ``viewset``) and pass its
+        duration, status & phase timings to :py:meth:`.MetricsSink.observe`.
+        """
+        phases = viewset.request_phases = RequestPhases()
+        start = perf_counter()
+        try:
+            response = await awaitable
+        except Exception:
+            self.observe(type(viewset).__name__, action, 500, perf_counter() - start, phases.timings)
+            raise
+        self.observe(type(viewset).__name__, action, response.status, perf_counter() - start, phases.timings)
+        return response
+
+    def observe(  # pylint: disable=too-many-arguments
+            self, viewset, action, status, duration, phases
+    ):  # pragma: no cover
+        """
+        Record a handled request.
+
+        :param viewset: viewset class name
+        :param action: action name
+        :param status: response status code
+        :param duration: handling time in seconds
+        :param phases: dict of phase name -> time in seconds
+        """
+        raise NotImplementedError()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(
+        '{}="{}"'.format(name, _escape(value))
+        for name, value
+        in zip(names, values)
+    )
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Sink that aggregates metrics in memory and renders them
+    in Prometheus text exposition format.
+
+    Exported metrics:
+
+    * ``restic_request_duration_seconds`` - histogram of request handling time
+      by viewset & action.
+    * ``restic_requests_total`` - counter of requests by viewset, action &
+      status.
+    * ``restic_phase_duration_seconds`` - histogram of time spent in each
+      phase by viewset, action & phase.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, prefix='restic', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.durations = OrderedDict()
+        self.statuses = OrderedDict()
+        self.phases = OrderedDict()
+
+    def observe(self, viewset, action, status, duration, phases):  # pylint: disable=too-many-arguments
+        key = (viewset, action)
+        histogram = self.durations.get(key)
+        if histogram is None:
+            histogram = self.durations[key] = Histogram(self.buckets)
+        histogram.observe(duration)
+
+        key = (viewset, action, status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+        for phase, phase_duration in phases.items():
+            key = (viewset, action, phase)
+            histogram = self.phases.get(key)
+            if histogram is None:
+                histogram = self.phases[key] = Histogram(self.buckets)
+            histogram.observe(phase_duration)
+
+    def reset(self):
+        """
+        Remove all collected metrics.
+        """
+        self.durations.clear()
+        self.statuses.clear()
+        self.phases.clear()
+
+    def _render_histograms(self, name, help_text, label_names, histograms):
+        lines = [
+            '# HELP {} {}'.format(name, help_text),
+            '# TYPE {} histogram'.format(name),
+        ]
+        for key, histogram in histograms.items():
+            labels = _labels(label_names, key)
+            for bound, count in histogram.get_cumulative_counts():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    name,
+                    labels,
+                    '+Inf' if bound == float('inf') else repr(bound),
+                    count
+                ))
+            lines.append('{}_sum{{{}}} {!r}'.format(name, labels, histogram.sum))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, histogram.count))
+        return lines
+
+    def render(self):
+        """
+        Return collected metrics in Prometheus text format.
+        """
+        lines = self._render_histograms(
+            self.prefix + '_request_duration_seconds',
+            'Time spent handling requests.',
+            ('viewset', 'action'),
+            self.durations
+        )
+        name = self.prefix + '_requests_total'
+        lines.append('# HELP {} Number of handled requests.'.format(name))
+        lines.append('# TYPE {} counter'.format(name))
+        for key, count in self.statuses.items():
+            lines.append('{}{{{}}} {}'.format(name, _labels(('viewset', 'action', 'status'), key), count))
+        lines.extend(self._render_histograms(
+            self.prefix + '_phase_duration_seconds',
+            'Time spent in each phase of request handling.',
+            ('viewset', 'action', 'phase'),
+            self.phases
+        ))
+        return '\n'.join(lines) + '\n'
+
+    def create_blueprint(self, name, uri='/metrics'):
+        """
+        Return a blueprint that serves metrics at ``uri``.
+        """
+        blueprint = Blueprint(name)
+
+        async def metrics_view(request):
+            """
+            Render collected metrics.
+            """
+            return HTTPResponse(body_bytes=self.render().encode('utf-8'), content_type=self.content_type)
+
+        blueprint.add_route(metrics_view, uri, methods=['GET'])
+        return blueprint
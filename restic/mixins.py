@@ -0,0 +1,526 @@
+"""
+Model viewset mixins.
+
+Each mixin adds an action to :py:class:`~restic.viewsets.GenericModelViewSet`
+(see :py:class:`~restic.viewsets.ModelViewSet`).
+"""
+# pylint: disable=invalid-name
+from sanic.response import stream
+
+from restic import exceptions
+from restic.codecs import JSONCodec, NDJSONCodec
+from restic.offload import get_executor, serialize_offloaded
+from restic.serializers import Field, ValidationError
+from restic.filters import Literal, parse_query
+from restic.utils import (
+    maybe_await,
+    iterate_chunks,
+    iterate_lines,
+    collect,
+    call_with_hints,
+    accepts_hint
+)
+
+
+class ListModelMixin(object):
+    """
+    A mixin that allows ModelViewSet to list models.
+
+    An example of ``list`` is: ``GET /items/``
+
+    ``get_models`` can return either a regular iterable or an asynchronous
+    iterable.
+
+    If ``STREAM_LIST`` is ``True``, models are pulled from ``get_models``
+    result in chunks of ``STREAM_CHUNK_SIZE`` items, serialized and written
+    to a chunked response one by one, so memory usage does not depend on
+    the size of the collection. Lists are not streamed with codecs that
+    cannot frame them by chunks (see :py:class:`~restic.codecs.Codec`).
+
+    Set ``PAGINATION_CLASS`` to a :py:class:`~restic.pagination.BasePagination`
+    subclass to paginate the list (see :py:mod:`restic.pagination`).
+    Paginated lists are never streamed.
+
+    Clients can request columnar layout with ``GET /items/?layout=columns``:
+    the list is represented as ``{"id": [...], "name": [...]}`` (see
+    :py:meth:`~restic.serializers.Serializer.serialize_columns`).
+    Lists in columnar layout are never streamed.
+
+    If ``OFFLOAD_THRESHOLD`` is set, lists of at least this many models are
+    serialized & encoded in a process pool by chunks of ``OFFLOAD_CHUNK_SIZE``
+    models, so the event loop stays responsive (see :py:mod:`restic.offload`).
+    Offloaded lists are serialized without the serializer context and their
+    related models are loaded in worker processes, so loaders of related
+    models must be synchronous.
+
+    Clients can filter lists by model fields listed in ``FILTER_FIELDS`` and
+    order them by fields listed in ``ORDERING_FIELDS``, for example:
+    ``GET /items/?name=Foo&id__gte=10&ordering=-id``
+    (see :py:mod:`restic.filters`). Keyset paginations always order models
+    by their key.
+    """
+    STREAM_LIST = False
+    STREAM_CHUNK_SIZE = 500
+    PAGINATION_CLASS = None
+    LAYOUT_PARAM = 'layout'
+    LAYOUTS = ('rows', 'columns')
+    OFFLOAD_THRESHOLD = None
+    OFFLOAD_CHUNK_SIZE = 5000
+    FILTER_FIELDS = ()
+    ORDERING_FIELDS = ()
+    ORDERING_PARAM = 'ordering'
+    __slots__ = ()
+
+    def get_pagination_class(self):
+        """
+        Return :py:class:`~restic.pagination.BasePagination` class
+        for this viewset or ``None`` if list should not be paginated.
+        """
+        return self.PAGINATION_CLASS
+
+    def get_layout(self):
+        """
+        Return list layout requested by the client: ``'rows'`` or ``'columns'``.
+        """
+        layout = self.request.args.get(self.LAYOUT_PARAM, self.LAYOUTS[0])
+        if layout not in self.LAYOUTS:
+            raise exceptions.BadRequest('Invalid {} parameter.'.format(self.LAYOUT_PARAM), details=list(self.LAYOUTS))
+        return layout
+
+    def get_query(self):
+        """
+        Return :py:class:`~restic.filters.Query` requested by the client
+        or ``None``.
+        """
+        if not self.FILTER_FIELDS and not self.ORDERING_FIELDS:
+            return None
+        return parse_query(
+            self.request.args,
+            self.FILTER_FIELDS,
+            self.ORDERING_FIELDS,
+            self.ORDERING_PARAM,
+            self.get_filter_value
+        )
+
+    def get_filter_value(self, name, value):
+        """
+        Convert query parameter ``value`` for filtering by field ``name``.
+
+        Values of serializer fields with custom ``to_internal_value``
+        (like datetime fields) are converted by the field, other values
+        are returned as :py:class:`~restic.filters.Literal` strings that
+        take the type of compared model values.
+        """
+        field = self.get_serializer_class().fields.get(name)
+        if field is None or type(field).to_internal_value is Field.to_internal_value:
+            return Literal(value)
+        try:
+            return field.to_internal_value(None, name, value)
+        except ValidationError as error:
+            raise exceptions.BadRequest('Invalid filter value.', details={name: str(error)})
+
+    def get_offload_executor(self):
+        """
+        Return executor for offloaded serialization.
+        """
+        return get_executor()
+
+    async def serialize_list(self, models, fields=None):
+        """
+        Return representation of ``models`` list in the requested layout.
+        """
+        serializer = self.get_serializer(models, many=True, fields=fields)
+        columns = self.get_layout() == 'columns'
+        offload = self.OFFLOAD_THRESHOLD is not None and self.get_codec().supports_offload
+        if not columns and offload and len(models) >= self.OFFLOAD_THRESHOLD:
+            with self.measure('serialize'):
+                return await serialize_offloaded(
+                    self.get_offload_executor(),
+                    serializer,
+                    self.get_codec(),
+                    chunk_size=self.OFFLOAD_CHUNK_SIZE
+                )
+        await self.prefetch(serializer)
+        with self.measure('serialize'):
+            if columns:
+                return serializer.serialize_columns()
+            return serializer.serialize()
+
+    async def list(self):
+        """
+        Get a list of models and return their representation in a
+        json response.
+        """
+        headers, response = await self.check_not_modified()
+        if response is not None:
+            return response
+
+        fields = self.get_selected_fields()
+        query = self.get_query()
+        pagination_class = self.get_pagination_class()
+        if pagination_class is not None:
+            # PAGINATION_CLASS is None by default, pylint cannot see the subclasses that set it.
+            pagination = pagination_class(self.request)  # pylint: disable=not-callable
+            return await self.paginated_list(pagination, headers, fields, query)
+
+        with self.measure('fetch'):
+            models, hints = call_with_hints(self.get_models, fields=fields, query=query)
+            models = await maybe_await(models)
+            if query is not None and 'query' not in hints:
+                if hasattr(models, '__aiter__'):
+                    models = query.apply_async(models)
+                else:
+                    models = query.apply(models)
+        if self.STREAM_LIST and self.get_layout() == 'rows' and self.get_codec().supports_streaming:
+            return self.stream_list(models, headers, fields)
+        with self.measure('fetch'):
+            models = await collect(models)
+            if not isinstance(models, (list, tuple)):
+                models = list(models)
+        return self.render(await self.serialize_list(models, fields), headers=headers)
+
+    async def paginated_list(self, pagination, headers=None, fields=None, query=None):
+        """
+        Get a page of models and return its representation in a
+        json response.
+        """
+        page = pagination.get_page()
+        if page.key is not None and query is not None:
+            query.ordering = []
+        with self.measure('fetch'):
+            hints = dict(page=page, fields=fields, query=query)
+            if query is not None and not accepts_hint(self.get_models, 'query'):
+                # Page must be taken from filtered models.
+                del hints['page']
+            models, hints = call_with_hints(self.get_models, **hints)
+            models = await collect(await maybe_await(models))
+            if query is not None and 'query' not in hints:
+                models = query.apply(models)
+            if 'page' in hints:
+                models = list(models)
+            else:
+                models = page.apply(models)
+            models, next_url, previous_url = pagination.paginate(page, models)
+
+            count = None
+            if pagination.INCLUDE_COUNT:
+                count, _ = call_with_hints(self.count_models, query=query)
+                count = await maybe_await(count)
+
+        return self.render(
+            pagination.get_response_data(await self.serialize_list(models, fields), next_url, previous_url, count),
+            headers=headers
+        )
+
+    def stream_list(self, models, headers=None, fields=None):
+        """
+        Return a streaming response with representation of ``models``.
+        """
+        chunk_size = self.STREAM_CHUNK_SIZE
+        codec = self.get_codec()
+
+        async def streaming_fn(response):
+            """
+            Write encoded list to the response chunk by chunk.
+            """
+            first = True
+            async for chunk in iterate_chunks(models, chunk_size):
+                serializer = self.get_serializer(chunk, many=True, fields=fields)
+                await maybe_await(serializer.prefetch())
+                data = codec.encode_items(serializer.serialize())
+                data = (codec.list_start if first else codec.list_separator) + data
+                if data:
+                    await maybe_await(response.write(data))
+                first = False
+            data = codec.list_start + codec.list_end if first else codec.list_end
+            if data:
+                await maybe_await(response.write(data))
+
+        return stream(streaming_fn, headers=headers, content_type=codec.content_type)
+
+
+class CreateModelMixin(object):
+    """
+    A mixin that allows ModelViewSet to create models.
+
+    An example of ``create`` is: ``POST /items/``
+    """
+    __slots__ = ()
+
+    async def create(self):
+        """
+        Create a new model and return its representation in a json response.
+        """
+        serializer = self.get_serializer()
+        await maybe_await(serializer.do_create(self.get_data()))
+        self.invalidate_cache()
+        await self.prefetch(serializer)
+        with self.measure('serialize'):
+            data = serializer.serialize()
+        return self.render(data, status=201)
+
+
+class RetrieveModelMixin(object):
+    """
+    A mixin that allows ModelViewSet to retrieve models.
+
+    An example of ``retrieve`` is: ``GET /items/5``
+    """
+    __slots__ = ()
+
+    async def retrieve(self, pk):
+        """
+        Get an existing model and return its representation in a
+        json response.
+        """
+        fields = self.get_selected_fields()
+        with self.measure('fetch'):
+            model = await maybe_await(self.get_model_or_404(pk, fields=fields))
+        headers, response = await self.check_not_modified(model)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(model, many=False, fields=fields)
+        await self.prefetch(serializer)
+        with self.measure('serialize'):
+            data = serializer.serialize()
+        return self.render(data, headers=headers)
+
+
+class UpdateModelMixin(object):
+    """
+    A mixin that allows ModelViewSet to update models.
+
+    An example of ``update`` is: ``PUT /items/5`` or ``PATCH /items/5``
+    """
+    __slots__ = ()
+
+    async def update(self, pk):
+        """
+        Update an existing model and return its modified representation in a
+        json response.
+        """
+        with self.measure('fetch'):
+            model = await maybe_await(self.get_model_or_404(pk))
+        await self.check_preconditions(model)
+        serializer = self.get_serializer(model)
+        await maybe_await(serializer.do_update(self.get_data()))
+        self.invalidate_cache()
+        await self.prefetch(serializer)
+        with self.measure('serialize'):
+            data = serializer.serialize()
+        return self.render(data)
+
+    def update_partial(self, pk):
+        """
+        Alias for :py:meth:`~.UpdateModelMixin.update`
+        """
+        return self.update(pk)
+
+
+class DestroyModelMixin(object):
+    """
+    A mixin that allows ModelViewSet to retrieve models.
+
+    An example of ``retrieve`` is: ``DELETE /items/5``
+    """
+    __slots__ = ()
+
+    async def destroy(self, pk):
+        """
+        Delete an existing model and return an empty json response.
+        """
+        with self.measure('fetch'):
+            model = await maybe_await(self.get_model_or_404(pk))
+        await self.check_preconditions(model)
+        serializer = self.get_serializer(model)
+        await maybe_await(serializer.do_destroy())
+        self.invalidate_cache()
+        return self.render(None, status=204)
+
+
+class BulkModelMixin(CreateModelMixin):
+    """
+    A mixin that allows ModelViewSet to create, update and delete many
+    models at once.
+
+    An example of bulk ``create`` is: ``POST /items/`` with a list
+    of objects in request body. A single object is handled as usual.
+
+    An example of ``bulk_update`` is: ``PATCH /items/`` with a list
+    of objects in request body. Each object must contain the primary key
+    of the model it updates in ``PK_FIELD`` key.
+
+    An example of ``bulk_destroy`` is: ``DELETE /items/`` with a list
+    of primary keys in request body.
+    """
+    PK_FIELD = 'id'
+    __slots__ = ()
+
+    async def create(self):
+        """
+        Create a new model or a list of models and return their representation
+        in a json response.
+        """
+        data = self.get_data()
+        serializer = self.get_serializer()
+        if isinstance(data, list):
+            await maybe_await(serializer.do_create_many(data))
+        else:
+            await maybe_await(serializer.do_create(data))
+        self.invalidate_cache()
+        await self.prefetch(serializer)
+        with self.measure('serialize'):
+            data = serializer.serialize()
+        return self.render(data, status=201)
+
+    async def bulk_update(self):
+        """
+        Update existing models and return their modified representation
+        in a json response.
+        """
+        data = self.get_data()
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise exceptions.BadRequest('Expected a list of objects.')
+        try:
+            pks = [item[self.PK_FIELD] for item in data]
+        except KeyError:
+            raise exceptions.BadRequest('Every object must contain "{}" key.'.format(self.PK_FIELD))
+        with self.measure('fetch'):
+            models = await self.get_models_by_pks_or_404(pks)
+        serializer = self.get_serializer(models, many=True)
+        await maybe_await(serializer.do_update_many(data))
+        self.invalidate_cache()
+        await self.prefetch(serializer)
+        with self.measure('serialize'):
+            data = serializer.serialize()
+        return self.render(data)
+
+    async def bulk_destroy(self):
+        """
+        Delete existing models and return an empty json response.
+        """
+        pks = self.get_data()
+        if not isinstance(pks, list):
+            raise exceptions.BadRequest('Expected a list of primary keys.')
+        with self.measure('fetch'):
+            models = await self.get_models_by_pks_or_404(pks)
+        serializer = self.get_serializer(models, many=True)
+        await maybe_await(serializer.do_destroy_many())
+        self.invalidate_cache()
+        return self.render(None, status=204)
+
+
+class ImportModelMixin(object):
+    """
+    A mixin that allows ModelViewSet to import models from newline-delimited
+    JSON (one object per line).
+
+    An example of ``import_models`` is: ``POST /items/import`` with
+    ``Content-Type: application/x-ndjson``.
+
+    Request body is consumed incrementally as it arrives. Each line is
+    validated by the serializer, valid objects are passed to its
+    ``create_many`` in batches of ``IMPORT_BATCH_SIZE``, so memory usage
+    does not depend on body size. Invalid lines (including lines longer
+    than ``IMPORT_MAX_LINE_SIZE`` bytes) are skipped.
+
+    Response is a summary of the import:
+
+    .. code-block:: json
+
+        {
+            "created": 2,
+            "failed": 1,
+            "errors": [
+                {"line": 2, "message": "Model validation failed", "details": {"name": "This field is required."}}
+            ]
+        }
+
+    Only first ``IMPORT_MAX_ERRORS`` errors are listed.
+    """
+    STREAM_ACTIONS = {'/import': dict(POST='import_models')}
+    IMPORT_CONTENT_TYPES = ('application/x-ndjson',)
+    IMPORT_BATCH_SIZE = 1000
+    IMPORT_MAX_ERRORS = 100
+    IMPORT_MAX_LINE_SIZE = 1024 * 1024
+    __slots__ = ()
+
+    def get_import_codec(self):
+        """
+        Return JSON codec that decodes lines of imported bodies:
+        the line codec of negotiated NDJSON codec, the default codec
+        if it is a JSON one, or :py:class:`~restic.codecs.JSONCodec`.
+        """
+        for codec in self.get_codecs():
+            if isinstance(codec, NDJSONCodec):
+                return codec.json_codec
+        default = self.get_default_codec()
+        if isinstance(default, JSONCodec):
+            return default
+        return JSONCodec()
+
+    async def import_models(self):
+        """
+        Create models from request body lines and return import summary.
+        """
+        content_type = self.request.headers.get('Content-Type', '').partition(';')[0].strip().lower()
+        if content_type not in self.IMPORT_CONTENT_TYPES:
+            return exceptions.UnsupportedMediaType(details=list(self.IMPORT_CONTENT_TYPES))
+        codec = self.get_import_codec()
+        serializer = self.get_serializer()
+        summary = dict(created=0, failed=0, errors=[])
+        batch = []
+        async for number, line in self.read_import_lines():
+            validated_data, error = self.validate_import_line(codec, serializer, line)
+            if error is not None:
+                summary['failed'] += 1
+                if len(summary['errors']) < self.IMPORT_MAX_ERRORS:
+                    summary['errors'].append(dict(line=number, message=error.message, details=error.details))
+                continue
+            batch.append(validated_data)
+            if len(batch) >= self.IMPORT_BATCH_SIZE:
+                summary['created'] += await self.import_batch(serializer, batch)
+                batch = []
+        if batch:
+            summary['created'] += await self.import_batch(serializer, batch)
+        return self.render(summary)
+
+    async def read_import_lines(self):
+        """
+        Iterate over ``(number, line)`` tuples of non-empty request body
+        lines. ``line`` is ``None`` if it is longer than ``IMPORT_MAX_LINE_SIZE``.
+        """
+        number = 0
+        async for line in iterate_lines(self.request, self.IMPORT_MAX_LINE_SIZE):
+            number += 1
+            if line is None or line.strip():
+                yield number, line
+
+    def validate_import_line(self, codec, serializer, line):
+        """
+        Decode ``line`` with ``codec`` and validate it with ``serializer``.
+
+        Return a tuple of ``(validated_data, error)``, where ``error`` is
+        :py:class:`~exceptions.BadRequest` if line is invalid or ``None``.
+        """
+        if line is None:
+            return None, exceptions.BadRequest('Line is too long.')
+        try:
+            data = codec.decode(line)
+        except exceptions.BadRequest as error:
+            return None, error
+        if not isinstance(data, dict):
+            return None, exceptions.BadRequest('Expected an object.')
+        validated_data, details = serializer.validate_item(data)
+        if details:
+            return None, exceptions.BadRequest('Model validation failed', details=details)
+        return validated_data, None
+
+    async def import_batch(self, serializer, batch):
+        """
+        Create models from a list of validated data and return the number
+        of created models.
+        """
+        await maybe_await(serializer.create_many(batch))
+        self.invalidate_cache()
+        return len(batch)
@@ -0,0 +1,235 @@
+"""
+Negotiation of viewset responses.
+
+Viewsets (see :py:class:`~restic.viewsets.GenericViewSet`) delegate here:
+
+* Response codec is negotiated with ``Accept`` request header and request
+  body codec is chosen by ``Content-Type`` (see :py:mod:`restic.codecs`).
+* Responses are compressed with encoding negotiated with ``Accept-Encoding``
+  request header (see :py:mod:`restic.compression`).
+* Conditional requests are answered with ``304 Not Modified`` and
+  ``412 Precondition Failed`` (see :py:mod:`restic.conditional`).
+
+Functions take the viewset as their first argument and read its
+configuration (``CODECS``, ``COMPRESS_RESPONSES``, ``USE_ETAGS`` etc.).
+"""
+from sanic.response import HTTPResponse
+
+from restic import exceptions
+from restic.codecs import negotiate, get_codec_by_content_type
+from restic.compression import add_vary, choose_encoding, compress, compress_stream, variant_etag
+from restic.conditional import (
+    version_etag,
+    body_etag,
+    http_date,
+    is_not_modified,
+    is_precondition_failed,
+    not_modified_response
+)
+from restic.utils import maybe_await
+
+
+def get_response_codec(viewset):
+    """
+    Return codec for response negotiated with ``Accept`` request header.
+
+    Raise :py:class:`~exceptions.NotAcceptable` if none of the codecs
+    is acceptable.
+    """
+    default = viewset.get_default_codec()
+    if not is_codec_negotiated(viewset):
+        return default
+    codec = negotiate(viewset.request.headers['Accept'], default, viewset.get_codecs())
+    if codec is None:
+        raise exceptions.NotAcceptable(details=[item.content_type for item in (default,) + viewset.get_codecs()])
+    return codec
+
+
+def is_codec_negotiated(viewset):
+    """
+    Return ``True`` if response codec is chosen by ``Accept`` request
+    header rather than by default.
+    """
+    accept = viewset.request.headers.get('Accept')
+    return bool(accept) and accept != '*/*' and bool(viewset.get_codecs())
+
+
+def get_request_codec(viewset):
+    """
+    Return codec for request body chosen by ``Content-Type`` request
+    header. Bodies of unknown types are decoded with the default codec.
+    """
+    default = viewset.get_default_codec()
+    codecs = viewset.get_codecs()
+    if not codecs:
+        return default
+    return get_codec_by_content_type(viewset.request.headers.get('Content-Type'), default, codecs)
+
+
+def add_etag(viewset, response):
+    """
+    Add ``ETag`` header with a hash of response body to successful
+    ``GET`` responses that do not have one if ``USE_ETAGS`` is enabled.
+    """
+    if (
+            viewset.USE_ETAGS and
+            response.status == 200 and
+            viewset.request.method == 'GET' and
+            isinstance(response, HTTPResponse) and
+            'ETag' not in response.headers
+    ):
+        response.headers['ETag'] = body_etag(response.body)
+    return response
+
+
+def finalize_response(viewset, response, cache_entry=None):
+    """
+    Post-process response before sending it to the client.
+
+    Replaces successful ``GET`` responses with ``304 Not Modified``
+    if the client already has them and compresses responses if
+    ``COMPRESS_RESPONSES`` is enabled.
+
+    ``cache_entry`` is :py:class:`~restic.cache.CachedResponse` of
+    the response, it keeps compressed variants of the body.
+    """
+    if is_codec_negotiated(viewset):
+        add_vary(response.headers, 'Accept')
+    encoding = None
+    if viewset.COMPRESS_RESPONSES and response.status not in (204, 304):
+        add_vary(response.headers)
+        encoding = viewset.get_response_encoding(response)
+    if viewset.USE_ETAGS:
+        response = viewset.add_etag(response)
+        headers = response.headers
+        if encoding is not None and 'ETag' in headers:
+            headers['ETag'] = variant_etag(headers['ETag'], encoding)
+        if response.status == 200 and viewset.request.method == 'GET':
+            if is_not_modified(viewset.request.headers, headers.get('ETag'), headers.get('Last-Modified')):
+                return not_modified_response({
+                    name: value
+                    for name, value
+                    in headers.items()
+                    if name in ('ETag', 'Last-Modified', 'Vary')
+                })
+    if encoding is not None:
+        viewset.compress_response(response, encoding, cache_entry)
+    return response
+
+
+def get_accepted_encoding(viewset):
+    """
+    Return content encoding negotiated with ``Accept-Encoding``
+    request header or ``None``.
+    """
+    return choose_encoding(viewset.request.headers.get('Accept-Encoding'), viewset.COMPRESSION_ENCODINGS)
+
+
+def get_response_encoding(viewset, response):
+    """
+    Return content encoding to compress ``response`` with or ``None``.
+
+    Buffered responses shorter than ``COMPRESSION_MIN_SIZE`` bytes
+    are not compressed.
+    """
+    if 'Content-Encoding' in response.headers:
+        return None
+    if isinstance(response, HTTPResponse) and len(response.body) < viewset.COMPRESSION_MIN_SIZE:
+        return None
+    return viewset.get_accepted_encoding()
+
+
+def compress_response(viewset, response, encoding, cache_entry=None):
+    """
+    Compress ``response`` body with ``encoding``.
+
+    Compressed bodies of buffered responses are stored in
+    ``cache_entry`` (if given) and reused.
+    """
+    if not isinstance(response, HTTPResponse):
+        compress_stream(response, encoding, viewset.COMPRESSION_LEVEL)
+        return
+    body = None
+    if cache_entry is not None:
+        body = cache_entry.variants.get(encoding)
+    if body is None:
+        with viewset.measure('compress'):
+            body = compress(response.body, encoding, viewset.COMPRESSION_LEVEL)
+        if cache_entry is not None:
+            cache_entry.variants[encoding] = body
+    response.body = body
+    response.headers['Content-Encoding'] = encoding
+
+
+async def get_validator_headers(viewset, model=None):
+    """
+    Return a dict with ``ETag`` and ``Last-Modified`` headers for
+    ``model`` (or the whole collection if ``model`` is ``None``)
+    built from version hooks of model ``viewset``.
+    """
+    if model is None:
+        version = await maybe_await(viewset.get_models_version())
+        last_modified = await maybe_await(viewset.get_models_last_modified())
+    else:
+        version = await maybe_await(viewset.get_model_version(model))
+        last_modified = await maybe_await(viewset.get_model_last_modified(model))
+    headers = {}
+    if version is not None:
+        variant = viewset.request.query_string
+        codec = viewset.get_codec()
+        if codec is not viewset.get_default_codec():
+            variant = '{} {}'.format(variant, codec.content_type)
+        headers['ETag'] = version_etag(version, variant)
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+async def check_not_modified(viewset, model=None):
+    """
+    Return a tuple of ``(headers, response)``, where ``headers`` are
+    validator headers for ``model`` (or the whole collection) and
+    ``response`` is ``304 Not Modified`` response if client already has
+    current representation or ``None`` otherwise.
+    """
+    if not viewset.USE_ETAGS:
+        return None, None
+    headers = await viewset.get_validator_headers(model)
+    if not headers:
+        return headers, None
+    request_headers = viewset.request.headers
+    if is_not_modified(request_headers, headers.get('ETag'), headers.get('Last-Modified')):
+        return headers, not_modified_response(headers)
+    encoding = viewset.get_accepted_encoding() if viewset.COMPRESS_RESPONSES else None
+    if encoding is not None and 'ETag' in headers:
+        # Client may have a compressed variant.
+        variant_headers = dict(headers, ETag=variant_etag(headers['ETag'], encoding))
+        if is_not_modified(request_headers, variant_headers['ETag'], headers.get('Last-Modified')):
+            add_vary(variant_headers)
+            return headers, not_modified_response(variant_headers)
+    return headers, None
+
+
+async def check_preconditions(viewset, model):
+    """
+    Raise :py:class:`~exceptions.PreconditionFailed` if ``If-Match``
+    or ``If-Unmodified-Since`` request headers do not match ``model``.
+
+    If no version is provided for ``model``, its ``ETag`` is a hash
+    of its rendered representation.
+    """
+    request_headers = viewset.request.headers
+    if 'If-Match' not in request_headers and 'If-Unmodified-Since' not in request_headers:
+        return
+    headers = await viewset.get_validator_headers(model)
+    etag = headers.get('ETag')
+    if etag is None and 'If-Match' in request_headers:
+        serializer = viewset.get_serializer(model)
+        await viewset.prefetch(serializer)
+        etag = body_etag(viewset.render(serializer.serialize()).body)
+    etags = [etag]
+    if etag is not None and viewset.COMPRESS_RESPONSES:
+        # Client may have an ETag of a compressed variant.
+        etags.extend(variant_etag(etag, encoding) for encoding in viewset.COMPRESSION_ENCODINGS)
+    if all(is_precondition_failed(request_headers, etag, headers.get('Last-Modified')) for etag in etags):
+        raise exceptions.PreconditionFailed()
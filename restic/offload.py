@@ -0,0 +1,108 @@
+"""
+Offloading of list serialization to worker processes.
+
+Serializing & encoding a very large list takes a lot of CPU time, during
+which the event loop cannot handle other requests. Such lists can be split
+into chunks which are serialized and encoded in a process pool, then
+stitched into a single JSON array.
+
+Models must be picklable. Serializer classes are passed to worker processes
+by their dotted path, so they must be importable (defined at module level).
+Codecs are re-created in worker processes from their class.
+
+Worker processes serialize chunks with new instances of the serializer
+class limited to the same fields. They do not get the serializer context
+(fields that read it see an empty dict) and load related models on their
+own, so loaders of related models must be synchronous.
+
+Where supported, worker processes of the default executor are started with
+``forkserver`` method, so they do not inherit listening sockets and other
+state of the server process. Otherwise create the executor (see
+:py:func:`get_executor`) before the server starts.
+"""
+from asyncio import gather, get_event_loop
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from multiprocessing import get_context
+
+from restic.codecs import Fragment
+
+_EXECUTOR = None
+
+
+def get_serializer_path(serializer_class):
+    """
+    Return dotted path (``'module:QualName'``) of a serializer class.
+
+    Raise ``ValueError`` if the class cannot be imported by this path.
+    """
+    path = '{}:{}'.format(serializer_class.__module__, serializer_class.__qualname__)
+    if '<locals>' in path:
+        raise ValueError('Serializer {} is not importable.'.format(path))
+    return path
+
+
+def import_serializer(path):
+    """
+    Import serializer class by its dotted path.
+    """
+    module_name, qualname = path.split(':')
+    obj = import_module(module_name)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def serialize_chunk(serializer_path, models, fields, codec_class):
+    """
+    Serialize & encode a chunk of models.
+
+    Runs in a worker process. Return encoded items separated by commas
+    (a JSON array without brackets).
+    """
+    serializer_class = import_serializer(serializer_path)
+    data = serializer_class(models, many=True, fields=fields).serialize()
+    return codec_class().encode(data)[1:-1]
+
+
+def get_executor():
+    """
+    Return default process pool executor, creating it on first use.
+    """
+    global _EXECUTOR  # pylint: disable=global-statement
+    if _EXECUTOR is None:
+        try:
+            _EXECUTOR = ProcessPoolExecutor(  # pylint: disable=unexpected-keyword-arg
+                mp_context=get_context('forkserver')
+            )
+        except (TypeError, ValueError):
+            # Python < 3.7 or no forkserver support on this platform.
+            _EXECUTOR = ProcessPoolExecutor()
+    return _EXECUTOR
+
+
+async def serialize_offloaded(executor, serializer, codec, chunk_size=5000):
+    """
+    Serialize & encode list of models attached to ``serializer``
+    in ``executor`` by chunks of ``chunk_size`` models.
+
+    Return :py:class:`~restic.codecs.Fragment` with encoded JSON array.
+    """
+    serializer_class = type(serializer)
+    path = get_serializer_path(serializer_class)
+    models = serializer.instance
+    fields = None if serializer.fields is serializer_class.fields else tuple(serializer.fields)
+    loop = get_event_loop()
+    parts = await gather(*[
+        loop.run_in_executor(
+            executor,
+            serialize_chunk,
+            path,
+            models[start:start + chunk_size],
+            fields,
+            type(codec)
+        )
+        for start
+        in range(0, len(models), chunk_size)
+    ])
+    return Fragment(b'[' + b','.join(part for part in parts if part) + b']')
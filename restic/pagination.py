@@ -0,0 +1,273 @@
+"""
+Pagination logic.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from heapq import nlargest, nsmallest
+from itertools import islice
+from json import dumps, loads
+from urllib.parse import urlencode
+
+from restic.exceptions import BadRequest
+from restic.utils import get_value
+
+
+class Page(object):
+    """
+    Page window requested by the client.
+
+    Passed to ``get_models`` as ``page`` keyword argument if it accepts it,
+    so data source can fetch only models that will be returned.
+
+    Data source should return at most ``fetch`` models (which is one more
+    than ``limit``: the extra model tells that there is a next page):
+
+    * For limit/offset pagination (``key`` is ``None``) - models
+      starting at ``offset``.
+    * For keyset pagination - models ordered by ``key`` field whose key
+      is greater than ``after`` (if set), or, if ``before`` is set,
+      models whose key is less than ``before`` in descending order
+      (``reverse`` is ``True`` in this case).
+
+    If ``get_models`` does not accept ``page`` argument, the window is
+    applied by :py:meth:`.Page.apply` to the full list of models.
+    """
+    def __init__(self, limit, offset=0, key=None, after=None, before=None):  # pylint: disable=too-many-arguments
+        self.limit = limit
+        self.offset = offset
+        self.key = key
+        self.after = after
+        self.before = before
+
+    @property
+    def fetch(self):
+        """
+        Number of models to fetch for this page.
+        """
+        return self.limit + 1
+
+    @property
+    def reverse(self):
+        """
+        ``True`` if models should be fetched in descending key order.
+        """
+        return self.before is not None
+
+    def apply(self, models):
+        """
+        Return models of this page from an iterable of all models.
+
+        Reference implementation that can also be used by data sources
+        which keep models in memory. Makes a single pass over ``models``.
+
+        Raise :py:class:`~restic.exceptions.BadRequest` if cursor key cannot
+        be compared with model keys.
+        """
+        if self.key is None:
+            return list(islice(models, self.offset, self.offset + self.fetch))
+        if self.after is None and self.before is None:
+            return self._apply_keyset(models)
+        try:
+            return self._apply_keyset(models)
+        except TypeError:
+            raise BadRequest('Invalid cursor.')
+
+    def _apply_keyset(self, models):
+        key = self.key
+        if self.before is not None:
+            before = self.before
+            return nlargest(
+                self.fetch,
+                (model for model in models if get_value(model, key) < before),
+                key=lambda model: get_value(model, key)
+            )
+        if self.after is not None:
+            after = self.after
+            models = (model for model in models if get_value(model, key) > after)
+        return nsmallest(self.fetch, models, key=lambda model: get_value(model, key))
+
+
+class BasePagination(object):
+    """
+    Generic pagination.
+
+    Pagination parses page window from request and builds
+    paginated response data.
+
+    Paginated response looks like this:
+
+    .. code-block:: json
+
+        {"results": [...], "next": "?page=...", "previous": null}
+
+    ``count`` key with total number of models is added if
+    ``INCLUDE_COUNT`` is ``True``.
+    """
+    INCLUDE_COUNT = False
+    LIMIT_PARAM = 'limit'
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def __init__(self, request):
+        self.request = request
+
+    def get_page(self):
+        """
+        Return :py:class:`.Page` requested by the client.
+        """
+        raise NotImplementedError()
+
+    def paginate(self, page, models):
+        """
+        Return a tuple of ``(models, next_url, previous_url)`` for ``models``
+        fetched for ``page``.
+        """
+        raise NotImplementedError()
+
+    def get_response_data(self, results, next_url, previous_url, count=None):
+        """
+        Return paginated response data.
+        """
+        data = dict(
+            results=results,
+            next=next_url,
+            previous=previous_url
+        )
+        if self.INCLUDE_COUNT:
+            data['count'] = count
+        return data
+
+    def get_limit(self):
+        """
+        Parse page size from request.
+        """
+        return self.get_int_param(self.LIMIT_PARAM, self.DEFAULT_LIMIT, minimum=1, maximum=self.MAX_LIMIT)
+
+    def get_int_param(self, name, default, minimum=0, maximum=None):
+        """
+        Parse integer query parameter.
+        """
+        value = self.request.args.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise BadRequest('Invalid {} parameter.'.format(name))
+        if value < minimum:
+            raise BadRequest('Invalid {} parameter.'.format(name))
+        if maximum is not None:
+            value = min(value, maximum)
+        return value
+
+    def get_url(self, **params):
+        """
+        Return URL of current request with replaced query parameters.
+
+        Parameters with ``None`` value are removed from the query.
+        """
+        args = {
+            name: value
+            for name, value
+            in self.request.args.items()
+            if name not in params
+        }
+        args.update({
+            name: value
+            for name, value
+            in params.items()
+            if value is not None
+        })
+        if not args:
+            return self.request.path
+        return self.request.path + '?' + urlencode(sorted(args.items()), doseq=True)
+
+
+class LimitOffsetPagination(BasePagination):
+    """
+    Limit/offset pagination.
+
+    Example: ``GET /items/?limit=10&offset=20``
+    """
+    OFFSET_PARAM = 'offset'
+
+    def get_page(self):
+        return Page(self.get_limit(), offset=self.get_int_param(self.OFFSET_PARAM, 0))
+
+    def paginate(self, page, models):
+        next_url = previous_url = None
+        if len(models) > page.limit:
+            next_url = self.get_url(**{self.OFFSET_PARAM: page.offset + page.limit})
+        if page.offset:
+            previous_url = self.get_url(**{self.OFFSET_PARAM: max(page.offset - page.limit, 0) or None})
+        return models[:page.limit], next_url, previous_url
+
+
+class CursorPagination(BasePagination):
+    """
+    Keyset pagination with opaque cursors.
+
+    Models are ordered by ``KEY`` field, which must be unique.
+    A cursor encodes the key of a boundary model, so fetching any page costs
+    the same regardless of how deep it is.
+
+    Example: ``GET /items/?cursor=eyJhIjogMTB9``
+    """
+    KEY = 'id'
+    CURSOR_PARAM = 'cursor'
+
+    def get_page(self):
+        after = before = None
+        cursor = self.request.args.get(self.CURSOR_PARAM)
+        if cursor is not None:
+            after, before = self.decode_cursor(cursor)
+        return Page(self.get_limit(), key=self.KEY, after=after, before=before)
+
+    def paginate(self, page, models):
+        has_more = len(models) > page.limit
+        models = models[:page.limit]
+        if page.reverse:
+            models.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, page.after is not None
+
+        next_url = previous_url = None
+        if models and has_next:
+            last = get_value(models[-1], self.KEY)
+            next_url = self.get_url(**{self.CURSOR_PARAM: self.encode_cursor(after=last)})
+        if models and has_previous:
+            first = get_value(models[0], self.KEY)
+            previous_url = self.get_url(**{self.CURSOR_PARAM: self.encode_cursor(before=first)})
+        return models, next_url, previous_url
+
+    @staticmethod
+    def encode_cursor(after=None, before=None):
+        """
+        Return opaque cursor string.
+        """
+        if before is not None:
+            data = dict(b=before)
+        else:
+            data = dict(a=after)
+        return urlsafe_b64encode(dumps(data).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Parse cursor string and return ``(after, before)`` tuple.
+
+        Raise :py:class:`~restic.exceptions.BadRequest` if cursor is
+        malformed or its keys are not scalar values.
+        """
+        try:
+            data = loads(urlsafe_b64decode(cursor.encode()).decode())
+        except (BinasciiError, ValueError):
+            raise BadRequest('Invalid cursor.')
+        if not isinstance(data, dict) or not set(data) <= {'a', 'b'}:
+            raise BadRequest('Invalid cursor.')
+        after, before = data.get('a'), data.get('b')
+        for value in (after, before):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+                raise BadRequest('Invalid cursor.')
+        return after, before
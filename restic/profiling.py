@@ -0,0 +1,323 @@
+"""
+Per-request profiling.
+
+Set ``PROFILER`` attribute of a viewset to a :py:class:`.Profiler` instance
+to profile a part of requests handled by the viewset. A request is profiled
+if it is picked by ``sample_rate`` (a fraction of requests between 0 and 1)
+or if it has ``header`` request header equal to ``token``.
+
+Only the steps of the profiled request itself are measured: profiling is
+switched on while its coroutine runs and off while it waits, so concurrent
+requests do not pollute the profile.
+
+Profiles are aggregated by viewset & action. Two modes are supported:
+
+* ``'cprofile'`` - deterministic profiling with :py:mod:`cProfile`,
+  reported as :py:mod:`pstats` text or raw ``marshal``-ed stats (the
+  format of :py:meth:`pstats.Stats.dump_stats`).
+* ``'sample'`` - wall-clock stack sampling with ``SIGALRM`` timer, reported
+  as collapsed stacks (``frame;frame;frame count`` lines) suitable for
+  flame graph tools. Available on Unix in the main thread only; do not use
+  it if your application uses ``SIGALRM`` for something else.
+
+Profiles are exposed by a debug blueprint:
+
+.. code-block:: python
+
+    PROFILER = Profiler(sample_rate=0.01, token='secret')
+
+    class ItemsViewSet(ModelViewSet):
+        PROFILER = PROFILER
+
+    app.blueprint(PROFILER.create_blueprint('profiles'), url_prefix='/debug/profiles')
+
+    # GET /debug/profiles/ - list of profiled actions
+    # GET /debug/profiles/ItemsViewSet/list - profile of ItemsViewSet.list
+"""
+import marshal
+import signal
+from collections import Counter, OrderedDict
+from cProfile import Profile
+from io import StringIO
+from pstats import Stats
+from random import random
+from types import coroutine
+
+from sanic.blueprints import Blueprint
+from sanic.response import HTTPResponse
+
+from restic import exceptions
+
+
+@coroutine
+def run_steps(awaitable, before_step, after_step):
+    """
+    Await ``awaitable``, calling ``before_step`` before and ``after_step``
+    after each step of its execution (between suspensions).
+    """
+    iterator = awaitable.__await__()
+    value, error = None, None
+    while True:
+        before_step()
+        try:
+            if error is None:
+                future = iterator.send(value)
+            else:
+                future = iterator.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            after_step()
+        try:
+            value, error = (yield future), None
+        except BaseException as thrown:  # pylint: disable=broad-except
+            value, error = None, thrown
+
+
+def get_stack(frame):
+    """
+    Return collapsed stack (``root;...;leaf``) of ``frame`` up to the
+    profiled request coroutine.
+    """
+    names = []
+    while frame is not None and frame.f_code is not run_steps.__code__:
+        names.append('{}.{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profiler(object):
+    """
+    Sampled per-request profiler.
+
+    :param sample_rate: fraction of requests to profile
+    :param token: value of ``header`` that triggers profiling of a request
+        and grants access to the debug blueprint (header trigger is disabled
+        if ``None``)
+    :param header: name of the request header
+    :param mode: ``'cprofile'`` or ``'sample'``
+    :param interval: sampling interval in seconds for ``'sample'`` mode
+
+    In ``'sample'`` mode ``SIGALRM`` handler is installed only while
+    profiled requests are handled, so they must be handled in the main thread.
+    """
+    MODES = ('cprofile', 'sample')
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, sample_rate=0.0, token=None, header='X-Restic-Profile', mode='cprofile', interval=0.001
+    ):
+        if mode not in self.MODES:
+            raise ValueError('Unknown profiling mode: {}.'.format(mode))
+        self.sample_rate = sample_rate
+        self.token = token
+        self.header = header
+        self.mode = mode
+        self.interval = interval
+        self.counts = Counter()
+        self.stats = OrderedDict()
+        self.stacks = OrderedDict()
+        self._current = None
+        self._sampling = 0
+        self._previous_handler = None
+
+    def should_profile(self, request):
+        """
+        Return ``True`` if ``request`` should be profiled.
+        """
+        if self.token is not None and request.headers.get(self.header) == self.token:
+            return True
+        return self.sample_rate > 0 and random() < self.sample_rate
+
+    async def profile(self, viewset, action, awaitable):
+        """
+        Await ``awaitable`` (request handling by ``viewset``) with profiling
+        enabled and add its profile to the profile of ``action``.
+        """
+        key = (type(viewset).__name__, action)
+        self.counts[key] += 1
+        if self.mode == 'sample':
+            stacks = self.stacks.setdefault(key, Counter())
+
+            def before_step():
+                """
+                Start sampling into stacks of this action.
+                """
+                self._current = stacks
+                signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+            def after_step():
+                """
+                Stop sampling while other coroutines run.
+                """
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                self._current = None
+
+            self.enable_sampling()
+            try:
+                return await run_steps(awaitable, before_step, after_step)
+            finally:
+                self.disable_sampling()
+
+        profile = Profile()
+        try:
+            return await run_steps(awaitable, profile.enable, profile.disable)
+        finally:
+            self._add_profile(key, profile)
+
+    def _add_profile(self, key, profile):
+        stats = self.stats.get(key)
+        try:
+            if stats is None:
+                self.stats[key] = Stats(profile)
+            else:
+                stats.add(profile)
+        except TypeError:
+            # Nothing was recorded.
+            pass
+
+    def enable_sampling(self):
+        """
+        Install ``SIGALRM`` handler that takes stack samples unless it is
+        installed already.
+        """
+        if not self._sampling:
+            self._previous_handler = signal.signal(signal.SIGALRM, self._take_sample)
+        self._sampling += 1
+
+    def disable_sampling(self):
+        """
+        Restore previous ``SIGALRM`` handler when the last profiled request
+        is handled.
+        """
+        self._sampling -= 1
+        if not self._sampling:
+            previous = self._previous_handler
+            signal.signal(signal.SIGALRM, signal.SIG_DFL if previous is None else previous)
+            self._previous_handler = None
+
+    def _take_sample(self, signum, frame):  # pylint: disable=unused-argument
+        stacks = self._current
+        if stacks is not None:
+            stacks[get_stack(frame)] += 1
+
+    def reset(self):
+        """
+        Remove all collected profiles.
+        """
+        self.counts.clear()
+        self.stats.clear()
+        self.stacks.clear()
+
+    def get_pstats(self, viewset, action, sort='cumulative', limit=50):
+        """
+        Return aggregated profile of ``action`` as :py:mod:`pstats` report
+        or ``None`` if there is no such profile.
+        """
+        stats = self.stats.get((viewset, action))
+        if stats is None:
+            return None
+        stats.stream = StringIO()
+        stats.sort_stats(sort).print_stats(limit)
+        return stats.stream.getvalue()
+
+    def get_raw_pstats(self, viewset, action):
+        """
+        Return aggregated profile of ``action`` in the binary format of
+        :py:meth:`pstats.Stats.dump_stats` or ``None`` if there is no such
+        profile.
+        """
+        stats = self.stats.get((viewset, action))
+        if stats is None:
+            return None
+        return marshal.dumps(stats.stats)
+
+    def get_collapsed(self, viewset, action):
+        """
+        Return collected stack samples of ``action`` as collapsed stacks
+        or ``None`` if there are no samples.
+        """
+        stacks = self.stacks.get((viewset, action))
+        if stacks is None:
+            return None
+        return ''.join(
+            '{} {}\n'.format(stack, count)
+            for stack, count
+            in sorted(stacks.items())
+        )
+
+    def create_blueprint(self, name):
+        """
+        Return a blueprint that exposes collected profiles.
+
+        If ``token`` is set, requests must have ``header`` equal to it.
+
+        ``GET /<viewset>/<action>`` returns collapsed stacks in ``'sample'``
+        mode and :py:mod:`pstats` report in ``'cprofile'`` mode (``sort`` and
+        ``limit`` query parameters are supported, ``format=raw`` returns
+        binary stats).
+        """
+        blueprint = Blueprint(name)
+
+        def text_response(text, status=200):
+            """
+            Return plain text response.
+            """
+            return HTTPResponse(
+                body_bytes=text.encode('utf-8'),
+                status=status,
+                content_type='text/plain; charset=utf-8'
+            )
+
+        def debug_view(view):
+            """
+            Check access & render API exceptions as plain text.
+            """
+            async def wrapper(request, *args, **kwargs):
+                """
+                Call ``view`` if access is allowed.
+                """
+                try:
+                    if self.token is not None and request.headers.get(self.header) != self.token:
+                        raise exceptions.Forbidden()
+                    return view(request, *args, **kwargs)
+                except exceptions.APIException as error:
+                    return text_response(error.message, error.status)
+            return wrapper
+
+        def index_view(request):  # pylint: disable=unused-argument
+            """
+            List profiled actions.
+            """
+            return text_response(''.join(
+                '{}/{} {}\n'.format(viewset, action, count)
+                for (viewset, action), count
+                in sorted(self.counts.items())
+            ))
+
+        def profile_view(request, viewset, action):
+            """
+            Render profile of an action.
+            """
+            if self.mode == 'sample':
+                text = self.get_collapsed(viewset, action)
+            elif request.args.get('format') == 'raw':
+                data = self.get_raw_pstats(viewset, action)
+                if data is not None:
+                    return HTTPResponse(body_bytes=data, content_type='application/octet-stream')
+                text = None
+            else:
+                try:
+                    limit = int(request.args.get('limit', 50))
+                except ValueError:
+                    raise exceptions.BadRequest('Invalid limit parameter.')
+                try:
+                    text = self.get_pstats(viewset, action, request.args.get('sort', 'cumulative'), limit)
+                except KeyError:
+                    raise exceptions.BadRequest('Invalid sort parameter.')
+            if text is None:
+                raise exceptions.NotFound('No profile for this action.')
+            return text_response(text)
+
+        blueprint.add_route(debug_view(index_view), '/', methods=['GET'])
+        blueprint.add_route(debug_view(profile_view), '/<viewset>/<action>', methods=['GET'])
+        return blueprint
@@ -1,195 +1,142 @@
 """
 Serializers logic.
 """
-from collections import Mapping
-from datetime import datetime
+from collections import OrderedDict
+from inspect import isawaitable
+from types import MappingProxyType
 
+from restic.compiler import compile_fields
 from restic.exceptions import BadRequest
-
-
-class ValidationError(Exception):
+from restic.fields import (
+    ValidationError,
+    Field,
+    SerializerMethodField,
+    RelatedField,
+    NaiveDateTimeField,
+    AwareDateTimeField,
+    are_mappings
+)
+
+__all__ = (
+    'ValidationError',
+    'Field',
+    'SerializerMethodField',
+    'RelatedField',
+    'NaiveDateTimeField',
+    'AwareDateTimeField',
+    'select_fields',
+    'SerializerMeta',
+    'Serializer'
+)
+
+
+def select_fields(fields, include=None, exclude=None):
     """
-    Field validation error.
-
-    Should be raised by ``to_internal_value`` method of fields
-    if the user input is not valid for this field.
-    """
-    pass
-
+    Return an ordered dict with a subset of ``fields``: only those
+    whose names are in ``include`` (if it is not ``None``) and not
+    in ``exclude``.
 
-class Field(object):
+    Raise :py:class:`~restic.exceptions.BadRequest` if any
+    of the names is not a known field.
     """
-    Generic serializer field.
-
-    Represents a top-level field in serializer.
-
-    Two methods can be overrided: :py:meth:`.Field.to_representation`
-    and :py:meth:`.Field.to_internal_value`.
-
-    Example usage:
+    unknown = [
+        name
+        for name
+        in list(include or ()) + list(exclude or ())
+        if name not in fields
+    ]
+    if unknown:
+        raise BadRequest(message='Unknown fields.', details=unknown)
+    return OrderedDict(
+        (name, field)
+        for name, field
+        in fields.items()
+        if (include is None or name in include) and (not exclude or name not in exclude)
+    )
 
-    .. code-block:: python
 
-        class CatSerializer(Serializer):
-            name = Field()
-            breed = Field()
+def _collect_fields(cls):
     """
-    def __init__(self, required=False, read_only=False):
-        self.required = required
-        self.read_only = read_only
-
-    def get_model_value(self, model, name):
-        """
-        Return model field by name.
-
-        Because model can be either dict-like object or an object,
-        we check if we should use ``getattr`` or ``getitem`` to retrieve it.
-        """
-        if isinstance(model, Mapping):
-            return model[name]
-        return getattr(model, name)
-
-    def set_model_value(self, model, name, value):
-        """
-        Set model field by name.
-
-        Because model can be either dict-like object or an object,
-        we check if we should use ``setattr`` or ``setitem`` to retrieve it.
-        """
-        if isinstance(model, Mapping):
-            model[name] = value
-        return setattr(model, name, value)
-
-    def to_representation(self, serializer, model, name):
-        """
-        Return a representation of data in this field.
-
-        Result should be a JSON-serializable data.
-
-        For example: format ``datetime`` object in ``value``
-        and return it as ``str``.
-        """
-        return self.get_model_value(model, name)
-
-    def to_internal_value(self, serializer, name, data):
-        """
-        Parse user data and convert it into internal model value.
-
-        For example: parse ``data`` string as timestamp and return it
-        as ``datetime`` object.
-        """
-        return data
-
-
-class SerializerMethodField(Field):
+    Build the field table of serializer class ``cls`` from its MRO.
     """
-    Method field.
-
-    This field allows you to specify custom serialization function for
-    related model. Value represented by this field is read-only.
-
-    Function should be a member of a serializer where this field is defined.
-
-    Default method name is ``'get_' + field_name``.
-
-    Example usage:
-
-    .. code-block:: python
-
-        class ColorSerializer(Serializer):
-            first_name = Field()
-            last_name = Field()
-            full_name = SerializerMethodField()
-
-            def get_full_name(self, instance):
-                return instance.first_name + instance.last_name
+    fields = OrderedDict()
+    for klass in reversed(cls.__mro__):
+        for name, value in vars(klass).items():
+            if isinstance(value, Field):
+                fields[name] = value
+            elif name in fields:
+                del fields[name]
+    type.__setattr__(cls, 'fields', MappingProxyType(fields))
+    type.__setattr__(cls, '_compiled', {})
+    type.__setattr__(cls, '_has_prefetch', any(
+        type(field).prefetch is not Field.prefetch or type(field).prime is not Field.prime
+        for field
+        in fields.values()
+    ))
+
+
+def _refresh_fields(cls):
     """
-    def __init__(self, method_name=None, required=False):
-        self.method_name = method_name
-        super(SerializerMethodField, self).__init__(required=required, read_only=True)
-
-    def to_representation(self, serializer, model, name):
-        """
-        Return a result of calling ``method`` for attached instance.
-        """
-        method_name = self.method_name
-        if method_name is None:
-            method_name = 'get_' + name
-        return getattr(serializer, method_name)(model)
+    Rebuild field tables of serializer class ``cls`` and all of its subclasses.
 
-
-class NaiveDateTimeField(Field):
+    Called when fields are attached to or removed from a class
+    after it was created.
     """
-    Naive datetime field.
+    _collect_fields(cls)
+    for subclass in type.__subclasses__(cls):
+        _refresh_fields(subclass)
 
-    Provides serializing/deserializing of ``datetime`` objects.
 
-    ``format_str`` can be a string or list/tuple of strings. I this case
-    all formats be used to try to unserialize datetime, but only first
-    will be used to serialize it into string.
+class SerializerMeta(type):
     """
-    DEFAULT_FORMATS = (
-        '%Y-%m-%dT%H:%M:%S.%f',
-        '%Y-%m-%d %H:%M:%S.%f',
-        '%Y-%m-%dT%H:%M:%S',
-        '%Y-%m-%d %H:%M:%S'
-    )
-
-    def __init__(self, formats=DEFAULT_FORMATS, required=False, read_only=False):
-        if not isinstance(formats, (list, tuple)):
-            formats = [formats]
-        assert formats, 'At least one datetime format is required!'
-        self.formats = formats
-        super(NaiveDateTimeField, self).__init__(required=required, read_only=read_only)
-
-    def to_representation(self, serializer, model, name):
-        """
-        Return the datetime object converted to string.
-        """
-        value = self.get_model_value(model, name)
-        assert isinstance(value, datetime), 'Expected datetime, got {}'.format(repr(value))
-        assert value.tzinfo is None, 'Expected naive datetime, got timezone-aware datetime'
-        return value.strftime(self.formats[0])
+    Serializer metaclass.
 
-    def to_internal_value(self, serializer, name, data):
-        """
-        Parse string and return datetime object.
-        """
-        for format_str in self.formats:
-            try:
-                return datetime.strptime(data, format_str)
-            except (ValueError, TypeError):
-                continue
-        raise ValidationError('Could not parse {}, formats tried: {}.'.format(
-            repr(data),
-            repr(self.formats)
-        ))
+    Collects declared fields once per serializer class into an ordered,
+    read-only ``fields`` table, so instantiating a serializer does not
+    need to reflect over its attributes.
 
-
-class AwareDateTimeField(NaiveDateTimeField):
-    """
-    Timezone-aware datetime field.
-
-    Provides serializing/deserializing of ``datetime`` objects with timezone.
+    Fields are ordered by declaration, base classes first. A subclass can
+    override an inherited field with another field (which keeps its original
+    position) or remove it by assigning any non-field value to its name.
     """
-    DEFAULT_FORMATS = (
-        '%Y-%m-%dT%H:%M:%S.%f%z',
-        '%Y-%m-%d %H:%M:%S.%f%z',
-        '%Y-%m-%dT%H:%M:%S%z',
-        '%Y-%m-%d %H:%M:%S%z',
-    )
-
-    def to_representation(self, serializer, model, name):
-        """
-        Return the datetime object converted to string.
-        """
-        value = self.get_model_value(model, name)
-        assert isinstance(value, datetime), 'Expected datetime, got {}'.format(repr(value))
-        assert value.tzinfo is not None, 'Expected timezone-aware datetime, got naive datetime'
-        return value.strftime(self.formats[0])
-
-
-class Serializer(object):
+    def __new__(mcs, name, bases, namespace):
+        cls = super(SerializerMeta, mcs).__new__(mcs, name, bases, namespace)
+        _collect_fields(cls)
+        return cls
+
+    def __setattr__(cls, name, value):
+        super(SerializerMeta, cls).__setattr__(name, value)
+        if isinstance(value, Field) or name in cls.fields:
+            _refresh_fields(cls)
+
+    def __delattr__(cls, name):
+        super(SerializerMeta, cls).__delattr__(name)
+        if name in cls.fields:
+            _refresh_fields(cls)
+
+    def get_compiled(cls, fields=None):
+        """
+        Return :py:class:`~restic.compiler.CompiledSerializer` for ``fields``
+        (a subset of fields of this class, all fields by default).
+
+        Compiled functions are generated on first use and cached until
+        the field table changes. At most ``MAX_COMPILED`` field subsets
+        are cached.
+        """
+        if fields is None:
+            fields = cls.fields
+        key = tuple(fields)
+        cache = cls.__dict__['_compiled']
+        compiled = cache.get(key)
+        if compiled is None:
+            compiled = compile_fields(fields)
+            if len(cache) >= cls.MAX_COMPILED:
+                cache.clear()
+            cache[key] = compiled
+        return compiled
+
+
+class Serializer(object, metaclass=SerializerMeta):
     """
     Generic serializer.
 
@@ -213,20 +160,51 @@ class Serializer(object):
     * ``destroy()`` - should delete the model that is located
       in ``self.instance`` from your database, file etc.
 
+    Bulk operations use ``create_many``, ``update_many`` and ``destroy_many``
+    methods, which call the methods above for each model by default.
+
+    Any of these methods can also be a coroutine function. In this case
+    ``do_create``, ``do_update`` and ``do_destroy`` return an awaitable
+    which must be awaited to complete the operation (model mixins
+    do this automatically).
+
     You can also override ``serialize`` method to perform custom serialization
     logic on the entire instance.
+
+    ``fields`` and ``exclude`` arguments limit serializer to a subset of its
+    fields. Fields that are not selected are never evaluated.
+
+    ``context`` is a dict shared by serializers of the same request (viewsets
+    pass it automatically). Batch loaders of related models
+    (see :py:class:`~restic.fields.RelatedField`) are cached in it.
+
+    Set ``COMPILED`` to ``True`` to serialize & validate models through
+    functions generated specifically for this serializer class
+    (see :py:func:`~restic.compiler.compile_fields`). This is much faster for large lists,
+    but requires all models in a list to be of the same kind
+    (either all dict-like or all objects). Custom ``_serialize`` and
+    ``_validate`` methods are bypassed in this mode.
+
+    Set ``COLUMNAR`` to ``True`` to serialize lists field by field through
+    ``to_representation_many`` (see :py:meth:`~restic.fields.Field.to_representation_many`).
+    Lists that mix dict-like models with objects, and serializers that
+    override ``_serialize``, are still serialized model by model.
     """
+    COMPILED = False
+    MAX_COMPILED = 64
+    COLUMNAR = False
+    _has_prefetch = False
+
     # TODO: Implement model serializers
     # TODO: Implement serializer fields & validation
-    def __init__(self, instance=None, many=False):
+    def __init__(  # pylint: disable=too-many-arguments
+            self, instance=None, many=False, fields=None, exclude=None, context=None
+    ):
         self.instance = instance
         self.many = many
-
-        self.fields = {}
-        for name in dir(self):
-            field = getattr(self, name)
-            if isinstance(field, Field):
-                self.fields[name] = field
+        self.context = {} if context is None else context
+        if fields is not None or exclude is not None:
+            self.fields = MappingProxyType(select_fields(self.fields, fields, exclude))
 
     def serialize(self):
         """
@@ -234,17 +212,44 @@ class Serializer(object):
         or model list.
         """
         if self.many:
+            if self.COMPILED:
+                return type(self).get_compiled(self.fields).serialize_many(self, self._get_model_list())
+            models = self.instance
+            if self.COLUMNAR and type(self)._serialize is Serializer._serialize:
+                models = self._get_model_list()
+                if are_mappings(models) is not None:
+                    return self._serialize_batch(models)
+            if self._has_prefetch:
+                models = self._get_model_list()
+                self._prime(models)
             return [
                 self._serialize(model)
                 for model
-                in self.instance
+                in models
             ]
         return self._serialize(self.instance)
 
     def _validate(self, data, allow_partial=False):
         """
         Process data through all the fields and return validated data.
+
+        Raise :py:class:`~restic.exceptions.BadRequest` with a dict of field
+        errors as details if data is invalid.
         """
+        validated_data, errors = self._try_validate(data, allow_partial)
+        if errors:
+            raise BadRequest(message='Model validation failed', details=errors)
+        return validated_data
+
+    def _try_validate(self, data, allow_partial=False):
+        """
+        Process data through all the fields and return a tuple of
+        ``(validated_data, errors)``, where ``errors`` is a dict of field
+        errors (empty if data is valid).
+        """
+        if self.COMPILED:
+            return type(self).get_compiled(self.fields).validate(self, data, allow_partial)
+
         validated_data = {}
         errors = {}
         for name, field in self.fields.items():
@@ -268,15 +273,142 @@ class Serializer(object):
             except ValidationError as error:
                 errors[name] = str(error)
 
-        if errors:
+        return validated_data, errors
+
+    def validate_item(self, data, allow_partial=False):
+        """
+        Process data through all the fields and return a tuple of
+        ``(validated_data, errors)`` without raising on invalid data.
+
+        Used to validate items of lists. If a subclass overrides
+        :py:meth:`.Serializer._validate`, it is called for each item
+        and errors of :py:class:`~restic.exceptions.BadRequest` it raises
+        are returned.
+        """
+        if type(self)._validate is Serializer._validate:
+            return self._try_validate(data, allow_partial)
+        try:
+            return self._validate(data, allow_partial), {}
+        except BadRequest as error:
+            return None, error.details or {'non_field_errors': error.message}
+
+    def _validate_many(self, data, allow_partial=False):
+        """
+        Process a list of items through :py:meth:`.Serializer.validate_item`
+        and return a list of validated data.
+
+        If any item is invalid, :py:class:`~restic.exceptions.BadRequest`
+        is raised. Its details is a list with an entry for each item:
+        ``None`` for valid items and errors dict for invalid ones.
+        """
+        if not isinstance(data, list):
+            raise BadRequest(message='Expected a list of objects.')
+        validated_data = []
+        errors = []
+        for item in data:
+            if not isinstance(item, dict):
+                errors.append({'non_field_errors': 'Expected an object.'})
+                continue
+            item_data, item_errors = self.validate_item(item, allow_partial)
+            validated_data.append(item_data)
+            errors.append(item_errors or None)
+
+        if any(error is not None for error in errors):
             raise BadRequest(message='Model validation failed', details=errors)
 
         return validated_data
 
+    def serialize_columns(self):
+        """
+        Return JSON-serializable representation of the attached model list
+        in columnar layout: a dict that maps each field name to a list of
+        values of this field for all models.
+        """
+        models = self._get_model_list()
+        return OrderedDict(
+            (name, field.to_representation_many(self, models, name))
+            for name, field
+            in self.fields.items()
+        )
+
+    def get_loader(self, loader_class):
+        """
+        Return instance of :py:class:`~restic.loaders.BatchLoader` subclass
+        ``loader_class`` shared through serializer context.
+        """
+        loaders = self.context.setdefault('loaders', {})
+        loader = loaders.get(loader_class)
+        if loader is None:
+            loader = loaders[loader_class] = loader_class(self.context)
+        return loader
+
+    def prefetch(self):
+        """
+        Load related models of attached models for fields that need them
+        (like :py:class:`~restic.fields.RelatedField`) in batches.
+
+        Return an awaitable if any loading is asynchronous.
+        """
+        if not self._has_prefetch or self.instance is None:
+            return None
+        models = self._get_model_list() if self.many else [self.instance]
+        results = [
+            field.prefetch(self, models, name)
+            for name, field
+            in self.fields.items()
+            if type(field).prefetch is not Field.prefetch
+        ]
+        if any(isawaitable(result) for result in results):
+            return _await_results(results)
+        return None
+
+    def prime(self):
+        """
+        Load related models of attached models for fields that can load
+        them synchronously (see :py:meth:`~restic.fields.Field.prime`).
+
+        Lists are primed by :py:meth:`.Serializer.serialize`, so related
+        models of all models in a list are loaded at once rather than
+        model by model.
+        """
+        if not self._has_prefetch or self.instance is None:
+            return
+        self._prime(self._get_model_list() if self.many else [self.instance])
+
+    def _prime(self, models):
+        for name, field in self.fields.items():
+            if type(field).prime is not Field.prime:
+                field.prime(self, models, name)
+
+    def _get_model_list(self):
+        """
+        Return attached models as a list.
+        """
+        models = self.instance
+        if not isinstance(models, (list, tuple)):
+            models = list(models)
+        return models
+
+    def _serialize_batch(self, models):
+        """
+        Serialize a list of models field by field.
+        """
+        if not self.fields:
+            return [{} for _ in models]
+        names = list(self.fields)
+        columns = [
+            field.to_representation_many(self, models, name)
+            for name, field
+            in self.fields.items()
+        ]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
     def _serialize(self, instance):
         """
         Serialize a single model.
         """
+        if self.COMPILED:
+            return type(self).get_compiled(self.fields).serialize(self, instance)
         return {
             name: field.to_representation(self, instance, name)
             for name, field
@@ -301,23 +433,148 @@ class Serializer(object):
         """
         raise NotImplementedError()
 
+    def create_many(self, validated_data):
+        """
+        Perform create logic for a list of models and return created models.
+
+        Default implementation calls ``create`` for each item, override it
+        to write all models to your database at once.
+        """
+        return _collect_results([
+            self.create(item)
+            for item
+            in validated_data
+        ])
+
+    def update_many(self, validated_data):
+        """
+        Perform update logic for models in ``self.instance`` list.
+
+        ``validated_data`` is a list of the same length as ``self.instance``.
+
+        Default implementation calls ``update`` for each model,
+        override it to update all models at once.
+        """
+        return _collect_results([
+            type(self)(instance, context=self.context).update(item)
+            for instance, item
+            in zip(self.instance, validated_data)
+        ])
+
+    def destroy_many(self):
+        """
+        Perform destroy logic for models in ``self.instance`` list.
+
+        Default implementation calls ``destroy`` for each model,
+        override it to delete all models at once.
+        """
+        return _collect_results([
+            type(self)(instance, context=self.context).destroy()
+            for instance
+            in self.instance
+        ])
+
     def do_create(self, data):
         """
         Create a model and update instance value.
+
+        Return an awaitable if ``create`` is a coroutine function.
         """
         validated_data = self._validate(data)
-        self.instance = self.create(validated_data)
+        instance = self.create(validated_data)
+        if isawaitable(instance):
+            return self._await_create(instance)
+        self.instance = instance
+        return None
+
+    async def _await_create(self, instance):
+        self.instance = await instance
 
     def do_update(self, data):
         """
         Update a model.
+
+        Return an awaitable if ``update`` is a coroutine function.
         """
         validated_data = self._validate(data, allow_partial=True)
-        self.update(validated_data)
+        result = self.update(validated_data)
+        if isawaitable(result):
+            return result
+        return None
 
     def do_destroy(self):
         """
         Destroy a model and set instance value to ``None``.
+
+        Return an awaitable if ``destroy`` is a coroutine function.
         """
-        self.destroy()
+        result = self.destroy()
+        if isawaitable(result):
+            return self._await_destroy(result)
+        self.instance = None
+        return None
+
+    async def _await_destroy(self, result):
+        await result
         self.instance = None
+
+    def do_create_many(self, data):
+        """
+        Create models from a list of items and update instance value.
+
+        Return an awaitable if ``create_many`` is asynchronous.
+        """
+        validated_data = self._validate_many(data)
+        self.many = True
+        instances = self.create_many(validated_data)
+        if isawaitable(instances):
+            return self._await_create(instances)
+        self.instance = instances
+        return None
+
+    def do_update_many(self, data):
+        """
+        Update models in ``self.instance`` list from a list of items.
+
+        Return an awaitable if ``update_many`` is asynchronous.
+        """
+        validated_data = self._validate_many(data, allow_partial=True)
+        result = self.update_many(validated_data)
+        if isawaitable(result):
+            return result
+        return None
+
+    def do_destroy_many(self):
+        """
+        Destroy models in ``self.instance`` list and set instance value
+        to an empty list.
+
+        Return an awaitable if ``destroy_many`` is asynchronous.
+        """
+        result = self.destroy_many()
+        if isawaitable(result):
+            return self._await_destroy_many(result)
+        self.instance = []
+        return None
+
+    async def _await_destroy_many(self, result):
+        await result
+        self.instance = []
+
+
+def _collect_results(results):
+    """
+    Return ``results`` list or, if it contains awaitables,
+    an awaitable that resolves into list of their results.
+    """
+    if any(isawaitable(result) for result in results):
+        return _await_results(results)
+    return results
+
+
+async def _await_results(results):
+    return [
+        await result if isawaitable(result) else result
+        for result
+        in results
+    ]
@@ -0,0 +1,289 @@
+"""
+In-memory model store.
+
+:py:class:`.MemoryStore` keeps models in memory with a hash index by primary
+key and optional secondary indexes, so lookups take constant time instead of
+scanning a list. Models can be dicts or objects.
+
+:py:class:`.StoreViewSetMixin` and :py:class:`.StoreSerializerMixin` plug a
+store into viewsets and serializers:
+
+.. code-block:: python
+
+    STORE = MemoryStore(indexes=['name'])
+
+
+    class ItemSerializer(StoreSerializerMixin, Serializer):
+        STORE = STORE
+
+        id = Field(read_only=True)
+        name = Field(required=True)
+
+
+    class ItemsViewSet(StoreViewSetMixin, ModelViewSet):
+        STORE = STORE
+
+        def get_serializer_class(self):
+            return ItemSerializer
+"""
+# pylint: disable=invalid-name
+from collections import Mapping, OrderedDict
+from threading import RLock
+
+from restic.utils import get_value
+
+
+def set_value(model, name, value):
+    """
+    Set model field by name for both dict-like and object models.
+    """
+    if isinstance(model, Mapping):
+        model[name] = value
+    else:
+        setattr(model, name, value)
+
+
+class MemoryStore(object):
+    """
+    In-memory model store.
+
+    :param models: initial models
+    :param pk: name of primary key field
+    :param indexes: names of fields to build secondary indexes for
+        (their values must be hashable)
+
+    Models are iterated in insertion order. Models without primary key
+    (or with ``None`` primary key) get the next integer ID when they are
+    added. IDs are never reused, even after models are removed.
+
+    ``version`` is incremented on every change, so it can be used
+    as collection version for conditional requests.
+
+    All changes are made under a lock, so a store can be safely shared
+    with threads (for example, executor workers).
+    """
+    def __init__(self, models=(), pk='id', indexes=()):
+        self.pk = pk
+        self.version = 0
+        self._models = OrderedDict()
+        self._indexes = {name: {} for name in indexes}
+        self._next_id = 1
+        self._lock = RLock()
+        for model in models:
+            self.add(model)
+
+    def __len__(self):
+        return len(self._models)
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __contains__(self, pk):
+        return pk in self._models
+
+    @property
+    def indexes(self):
+        """
+        Names of indexed fields.
+        """
+        return tuple(self._indexes)
+
+    def values(self):
+        """
+        Return a list of all models in insertion order.
+        """
+        return list(self._models.values())
+
+    def get(self, pk):
+        """
+        Return model with primary key ``pk`` or ``None``.
+        """
+        return self._models.get(pk)
+
+    def get_many(self, pks):
+        """
+        Return a list of models with primary keys from ``pks``.
+        Missing models are represented by ``None``.
+        """
+        models = self._models
+        return [models.get(pk) for pk in pks]
+
+    def find(self, name, value):
+        """
+        Return a list of models whose indexed field ``name`` equals ``value``.
+
+        Raise ``KeyError`` if ``name`` is not indexed.
+        """
+        return list(self._indexes[name].get(value, {}).values())
+
+    def add(self, model):
+        """
+        Add ``model`` to the store and return it.
+
+        Raise ``ValueError`` if a model with the same primary key exists
+        and ``TypeError`` if a value of an indexed field is not hashable.
+        """
+        with self._lock:
+            pk = self._get_pk(model)
+            if pk is not None and pk in self._models:
+                raise ValueError('Model with primary key {!r} already exists.'.format(pk))
+            for name in self._indexes:
+                hash(get_value(model, name))
+            if pk is None:
+                pk = self._next_id
+                set_value(model, self.pk, pk)
+            if isinstance(pk, int) and pk >= self._next_id:
+                self._next_id = pk + 1
+            self._models[pk] = model
+            for name, index in self._indexes.items():
+                index.setdefault(get_value(model, name), OrderedDict())[pk] = model
+            self.version += 1
+        return model
+
+    def update(self, model, data):
+        """
+        Set fields of ``model`` from ``data`` dict and update indexes.
+
+        Primary key cannot be changed. Raise ``TypeError`` if a value of
+        an indexed field is not hashable (``model`` is left unchanged).
+        """
+        with self._lock:
+            for name, value in data.items():
+                if name in self._indexes:
+                    hash(value)
+            pk = self._get_pk(model)
+            for name, value in data.items():
+                if name == self.pk:
+                    continue
+                index = self._indexes.get(name)
+                if index is not None:
+                    self._unindex(index, get_value(model, name), pk)
+                    index.setdefault(value, OrderedDict())[pk] = model
+                set_value(model, name, value)
+            self.version += 1
+        return model
+
+    def remove(self, model):
+        """
+        Remove ``model`` from the store.
+
+        Raise ``KeyError`` if the model is not in the store.
+        """
+        with self._lock:
+            pk = self._get_pk(model)
+            del self._models[pk]
+            for name, index in self._indexes.items():
+                self._unindex(index, get_value(model, name), pk)
+            self.version += 1
+
+    def clear(self):
+        """
+        Remove all models. IDs are not reused after that.
+        """
+        with self._lock:
+            self._models.clear()
+            for index in self._indexes.values():
+                index.clear()
+            self.version += 1
+
+    def _get_pk(self, model):
+        if isinstance(model, Mapping):
+            return model.get(self.pk)
+        return getattr(model, self.pk, None)
+
+    @staticmethod
+    def _unindex(index, value, pk):
+        models = index.get(value)
+        if models is not None:
+            models.pop(pk, None)
+            if not models:
+                del index[value]
+
+
+class StoreViewSetMixin(object):
+    """
+    A mixin for :py:class:`~restic.viewsets.GenericModelViewSet` that gets
+    models from :py:class:`.MemoryStore` in ``STORE`` attribute.
+
+    Filtering & ordering queries (see :py:mod:`restic.filters`) use store
+    indexes. Collection version for conditional requests is the version
+    of the store.
+    """
+    STORE = None
+    __slots__ = ()
+
+    def get_store(self):
+        """
+        Return :py:class:`.MemoryStore` for this viewset.
+        """
+        return self.STORE
+
+    def get_models(self, query=None):
+        """
+        Return all models of the store, or models matched by ``query``.
+        """
+        if query is None:
+            return self.get_store().values()
+        return list(query.apply(self.get_store()))
+
+    def get_model(self, pk):
+        """
+        Return model with primary key ``pk`` from the store or ``None``.
+        """
+        return self.get_store().get(pk)
+
+    def get_models_by_pks(self, pks):
+        """
+        Return models with primary keys from ``pks`` list in one lookup.
+
+        ``pks`` are checked by ``get_models_by_pks_or_404`` before they
+        are hashed.
+        """
+        return self.get_store().get_many(pks)
+
+    def count_models(self, query=None):
+        """
+        Return number of all models of the store, or of models matched by ``query``.
+        """
+        if query is None:
+            return len(self.get_store())
+        return sum(1 for _ in query.apply(self.get_store()))
+
+    def get_models_version(self):
+        """
+        Return store version.
+        """
+        return self.get_store().version
+
+
+class StoreSerializerMixin(object):
+    """
+    A mixin for :py:class:`~restic.serializers.Serializer` that creates,
+    updates & destroys models in :py:class:`.MemoryStore` in ``STORE``
+    attribute. New models are dicts.
+    """
+    STORE = None
+
+    def get_store(self):
+        """
+        Return :py:class:`.MemoryStore` for this serializer.
+        """
+        return self.STORE
+
+    def create(self, validated_data):
+        """
+        Add a new dict model to the store.
+        """
+        return self.get_store().add(dict(validated_data))
+
+    def update(self, validated_data):
+        """
+        Update attached model in the store.
+        """
+        self.get_store().update(self.instance, validated_data)
+
+    def destroy(self):
+        """
+        Remove attached model from the store.
+        """
+        self.get_store().remove(self.instance)
@@ -1,15 +1,26 @@
+from asyncio import sleep
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from multiprocessing import get_context
 
 from sanic import Sanic
 from sanic.response import json
 
 from restic import exceptions
-from restic.viewsets import ModelViewSet
+from restic.cache import ResponseCache
+from restic.coalescing import SingleFlight
+from restic.metrics import PrometheusSink
+from restic.profiling import Profiler
+from restic.loaders import BatchLoader
+from restic.stores import MemoryStore, StoreViewSetMixin, StoreSerializerMixin
+from restic.viewsets import ModelViewSet, BulkModelViewSet, ImportModelMixin
+from restic.pagination import LimitOffsetPagination, CursorPagination
 from restic.serializers import (
     Serializer,
     Field,
     SerializerMethodField,
-    NaiveDateTimeField
+    NaiveDateTimeField,
+    RelatedField
 )
 
 MODELS = []
@@ -61,13 +72,310 @@ class ItemsViewSet(ModelViewSet):
         return MODELS
 
     def get_model(self, pk):
-        matches = [model for model in self.get_models() if model['id'] == pk]
+        matches = [model for model in MODELS if model['id'] == pk]
         if matches:
             return matches[0]
 
 
+class AsyncItemSerializer(ItemSerializer):
+    async def create(self, validated_data):
+        return super(AsyncItemSerializer, self).create(validated_data)
+
+    async def update(self, validated_data):
+        super(AsyncItemSerializer, self).update(validated_data)
+
+    async def destroy(self):
+        super(AsyncItemSerializer, self).destroy()
+
+
+class AsyncItemsViewSet(ItemsViewSet):
+    def get_serializer_class(self):
+        return AsyncItemSerializer
+
+    async def get_models(self):
+        return MODELS
+
+    async def get_model(self, pk):
+        matches = [model for model in MODELS if model['id'] == pk]
+        if matches:
+            return matches[0]
+
+
+class StreamingItemsViewSet(ItemsViewSet):
+    STREAM_LIST = True
+    STREAM_CHUNK_SIZE = 1
+
+    async def get_models(self):
+        async def iterate():
+            for model in MODELS:
+                yield model
+        return iterate()
+
+
+class BulkItemsViewSet(BulkModelViewSet, ItemsViewSet):
+    pass
+
+
+class CachedItemsViewSet(ItemsViewSet):
+    RESPONSE_CACHE = ResponseCache(max_size=2, ttl=60)
+
+
+class CachedUpperItemsViewSet(CachedItemsViewSet):
+    def get_model(self, pk):
+        model = super(CachedUpperItemsViewSet, self).get_model(pk)
+        if model is not None:
+            return dict(model, name=model['name'].upper())
+
+
+class SlowCachedItemsViewSet(CachedItemsViewSet):
+    async def get_model(self, pk):
+        model = super(SlowCachedItemsViewSet, self).get_model(pk)
+        if model is not None:
+            model = dict(model)
+            await sleep(0.05)
+            return model
+
+
+class ETagItemsViewSet(ItemsViewSet):
+    USE_ETAGS = True
+
+
+class VersionedItemsViewSet(ETagItemsViewSet):
+    def get_model_version(self, model):
+        return int(model['date_created'].timestamp() * 1000000)
+
+    def get_model_last_modified(self, model):
+        return model['date_created']
+
+
+HINTS = []
+
+
+class SparseItemsViewSet(ItemsViewSet):
+    def get_models(self, fields=None):
+        HINTS.append(fields)
+        return MODELS
+
+    def get_model(self, pk, fields=None):
+        HINTS.append(fields)
+        return super(SparseItemsViewSet, self).get_model(pk)
+
+
+class OffloadItemsViewSet(ItemsViewSet):
+    OFFLOAD_THRESHOLD = 2
+    OFFLOAD_CHUNK_SIZE = 1
+    EXECUTOR = None
+
+    def get_offload_executor(self):
+        # Workers are started by a fork server, so they don't inherit the server socket.
+        if OffloadItemsViewSet.EXECUTOR is None:
+            OffloadItemsViewSet.EXECUTOR = ProcessPoolExecutor(2, mp_context=get_context('forkserver'))
+        return OffloadItemsViewSet.EXECUTOR
+
+
+class ContextItemSerializer(ItemSerializer):
+    path = SerializerMethodField()
+
+    def get_path(self, model):
+        request = self.context.get('request')
+        return request.path if request is not None else None
+
+
+class ItemsPagination(LimitOffsetPagination):
+    DEFAULT_LIMIT = 2
+    INCLUDE_COUNT = True
+
+
+class PaginatedItemsViewSet(ItemsViewSet):
+    PAGINATION_CLASS = ItemsPagination
+
+
+class ItemsCursorPagination(CursorPagination):
+    DEFAULT_LIMIT = 2
+
+
+class CursorItemsViewSet(ItemsViewSet):
+    PAGINATION_CLASS = ItemsCursorPagination
+
+    def get_models(self, page=None):
+        if page is None:
+            return MODELS
+        return page.apply(MODELS)
+
+
+METRICS = PrometheusSink()
+
+
+class MetricsItemsViewSet(ItemsViewSet):
+    METRICS = METRICS
+
+
+PROFILER = Profiler(token='secret')
+
+
+class ProfiledItemsViewSet(ItemsViewSet):
+    PROFILER = PROFILER
+
+
+STORE = MemoryStore(indexes=['name'])
+
+
+class StoreItemSerializer(StoreSerializerMixin, ItemSerializer):
+    STORE = STORE
+
+
+class StoreItemsViewSet(StoreViewSetMixin, BulkModelViewSet):
+    STORE = STORE
+
+    def get_serializer_class(self):
+        return StoreItemSerializer
+
+
+class FilteredItemsViewSet(StoreItemsViewSet):
+    FILTER_FIELDS = ('id', 'name', 'date_created')
+    ORDERING_FIELDS = ('id', 'name')
+
+
+class FilteredPaginatedItemsViewSet(PaginatedItemsViewSet):
+    FILTER_FIELDS = ('id', 'name')
+    ORDERING_FIELDS = ('id', 'name')
+
+
+class CoalescedItemsViewSet(ItemsViewSet):
+    SINGLE_FLIGHT = SingleFlight()
+    CALLS = []
+
+    async def get_model(self, pk):
+        self.CALLS.append(pk)
+        await sleep(0.01)
+        if pk < 0:
+            raise RuntimeError('Broken model.')
+        return super(CoalescedItemsViewSet, self).get_model(pk)
+
+
+class CoalescedUpperItemsViewSet(CoalescedItemsViewSet):
+    async def get_model(self, pk):
+        model = await super(CoalescedUpperItemsViewSet, self).get_model(pk)
+        if model is not None:
+            return dict(model, name=model['name'].upper())
+
+
+OWNERS = {1: {'id': 1, 'name': 'Alice'}, 2: {'id': 2, 'name': 'Bob'}}
+TAGS = {'a': {'name': 'a'}, 'b': {'name': 'b'}}
+LOADS = []
+
+
+class TagLoader(BatchLoader):
+    def load_many(self, keys):
+        LOADS.append(('tags', keys))
+        return {key: TAGS.get(key) for key in keys}
+
+
+class OwnerLoader(BatchLoader):
+    async def load_many(self, keys):
+        LOADS.append(('owners', keys))
+        await sleep(0)
+        return [OWNERS.get(key) for key in keys]
+
+
+class TagSerializer(Serializer):
+    name = Field()
+
+
+class OwnerSerializer(Serializer):
+    id = Field()
+    name = Field()
+
+
+class RelatedItemSerializer(ItemSerializer):
+    owner = RelatedField(OwnerSerializer, OwnerLoader, source='owner_id')
+    tags = RelatedField(TagSerializer, TagLoader, many=True)
+
+
+class RelatedItemsViewSet(ItemsViewSet):
+    def get_serializer_class(self):
+        return RelatedItemSerializer
+
+    def get_models(self):
+        return [
+            dict(model, owner_id=model['id'] % 3, tags=['a', 'b'][:model['id']])
+            for model
+            in MODELS
+        ]
+
+    def get_model(self, pk):
+        models = [model for model in self.get_models() if model['id'] == pk]
+        if models:
+            return models[0]
+
+
+class DynamicItemsViewSet(ItemsViewSet):
+    def get_handler(self, action):
+        if action == 'list' and 'deny' in self.request.args:
+            return None
+        return super(DynamicItemsViewSet, self).get_handler(action)
+
+
+class ErrorItemsViewSet(ItemsViewSet):
+    def retrieve(self, pk):
+        if pk >= 100:
+            return exceptions.Forbidden()
+        return super(ErrorItemsViewSet, self).retrieve(pk)
+
+
+class ImportItemSerializer(StoreItemSerializer):
+    BATCHES = []
+
+    def create_many(self, validated_data):
+        self.BATCHES.append(len(validated_data))
+        return super(ImportItemSerializer, self).create_many(validated_data)
+
+
+class ImportItemsViewSet(ImportModelMixin, StoreItemsViewSet):
+    IMPORT_BATCH_SIZE = 2
+    IMPORT_MAX_ERRORS = 2
+    IMPORT_MAX_LINE_SIZE = 100
+
+    def get_serializer_class(self):
+        return ImportItemSerializer
+
+
+class CompressedItemsViewSet(VersionedItemsViewSet):
+    RESPONSE_CACHE = ResponseCache(max_size=2, ttl=60)
+    COMPRESS_RESPONSES = True
+    COMPRESSION_MIN_SIZE = 100
+
+
+class CompressedStreamingItemsViewSet(StreamingItemsViewSet):
+    COMPRESS_RESPONSES = True
+
+
 app = Sanic('my_app')
 app.blueprint(ItemsViewSet.create_blueprint('items'), url_prefix='/items')
+app.blueprint(AsyncItemsViewSet.create_blueprint('async_items'), url_prefix='/async-items')
+app.blueprint(BulkItemsViewSet.create_blueprint('bulk_items'), url_prefix='/bulk-items')
+app.blueprint(CachedItemsViewSet.create_blueprint('cached_items'), url_prefix='/cached-items')
+app.blueprint(CachedUpperItemsViewSet.create_blueprint('cached_upper_items'), url_prefix='/cached-upper-items')
+app.blueprint(ETagItemsViewSet.create_blueprint('etag_items'), url_prefix='/etag-items')
+app.blueprint(VersionedItemsViewSet.create_blueprint('versioned_items'), url_prefix='/versioned-items')
+app.blueprint(SparseItemsViewSet.create_blueprint('sparse_items'), url_prefix='/sparse-items')
+app.blueprint(OffloadItemsViewSet.create_blueprint('offload_items'), url_prefix='/offload-items')
+app.blueprint(PaginatedItemsViewSet.create_blueprint('paginated_items'), url_prefix='/paginated-items')
+app.blueprint(CursorItemsViewSet.create_blueprint('cursor_items'), url_prefix='/cursor-items')
+app.blueprint(StreamingItemsViewSet.create_blueprint('streaming_items'), url_prefix='/streaming-items')
+app.blueprint(MetricsItemsViewSet.create_blueprint('metrics_items'), url_prefix='/metrics-items')
+app.blueprint(METRICS.create_blueprint('metrics'))
+app.blueprint(ProfiledItemsViewSet.create_blueprint('profiled_items'), url_prefix='/profiled-items')
+app.blueprint(PROFILER.create_blueprint('profiles'), url_prefix='/debug/profiles')
+app.blueprint(StoreItemsViewSet.create_blueprint('store_items'), url_prefix='/store-items')
+app.blueprint(FilteredItemsViewSet.create_blueprint('filtered_items'), url_prefix='/filtered-items')
+app.blueprint(CoalescedItemsViewSet.create_blueprint('coalesced_items'), url_prefix='/coalesced-items')
+app.blueprint(RelatedItemsViewSet.create_blueprint('related_items'), url_prefix='/related-items')
+app.blueprint(FilteredPaginatedItemsViewSet.create_blueprint('filtered_paginated_items'), url_prefix='/filtered-paginated-items')
+app.blueprint(CompressedItemsViewSet.create_blueprint('compressed_items'), url_prefix='/compressed-items')
+app.blueprint(CompressedStreamingItemsViewSet.create_blueprint('compressed_streaming_items'), url_prefix='/compressed-streaming-items')
+app.blueprint(DynamicItemsViewSet.create_blueprint('dynamic_items'), url_prefix='/dynamic-items')
+app.blueprint(ImportItemsViewSet.create_blueprint('import_items'), url_prefix='/import-items')
 for route in app.router.routes_all:
     print(route)  # Display all routes
 
@@ -1,5 +1,68 @@
-from unittest import TestCase
-from restic.tests.app import app, reset
+import marshal
+import signal
+import zlib
+from asyncio import new_event_loop, gather, sleep, Queue
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from unittest import TestCase, skipIf
+from sanic.response import stream
+from restic.tests.app import (
+    app,
+    reset,
+    HINTS,
+    LOADS,
+    METRICS,
+    MODELS,
+    PROFILER,
+    STORE,
+    CachedItemsViewSet,
+    CoalescedItemsViewSet,
+    CoalescedUpperItemsViewSet,
+    CompressedItemsViewSet,
+    ContextItemSerializer,
+    DynamicItemsViewSet,
+    ErrorItemsViewSet,
+    ImportItemSerializer,
+    ImportItemsViewSet,
+    ItemSerializer,
+    ItemsViewSet,
+    OffloadItemsViewSet,
+    OwnerLoader,
+    OwnerSerializer,
+    SlowCachedItemsViewSet,
+    TagLoader,
+    TagSerializer
+)
+from restic import exceptions
+from restic.benchmarks import micro, runner
+from restic.benchmarks.micro import make_request
+from restic.codecs import JSONCodec, UJSONCodec, ORJSONCodec, NDJSONCodec, MessagePackCodec, Fragment, negotiate
+from restic.compression import choose_encoding, compress_stream, variant_etag
+from restic.exceptions import BadRequest
+from restic.filters import Filter, Literal, Query
+from restic.offload import serialize_offloaded
+from restic.profiling import Profiler
+from restic.stores import MemoryStore
+from restic.utils import iterate_lines
+from restic.viewsets import ModelViewSet
+from restic.serializers import (
+    Serializer,
+    Field,
+    NaiveDateTimeField,
+    AwareDateTimeField,
+    RelatedField,
+    ValidationError
+)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class GenericAPITest(TestCase):
@@ -48,3 +111,1284 @@ class GenericAPITest(TestCase):
         self.assertEqual(response.status, 204)
         _, response = app.test_client.get('/items/2')
         self.assertEqual(response.status, 404)
+
+
+class CodecTest(TestCase):
+    def test_malformed_body(self):
+        _, response = app.test_client.post('/items/', data='{"name": ')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.json['message'], 'Malformed JSON.')
+
+    def test_codecs(self):
+        for codec in (JSONCodec(), UJSONCodec()):
+            data = {'a': [1, 'b/c', None], 'd': 'é'}
+            self.assertEqual(codec.decode(codec.encode(data)), data)
+            self.assertEqual(codec.encode([Fragment('{"x":1}'), 2]), b'[{"x":1},2]')
+            self.assertEqual(codec.decode(codec.encode({'a': Fragment(b'[1]')})), {'a': [1]})
+            with self.assertRaises(BadRequest):
+                codec.decode(b'[')
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_codec(self):
+        codec = ORJSONCodec()
+        self.assertEqual(codec.dumps({1: 'a', 'b': None}), JSONCodec().dumps({1: 'a', 'b': None}))
+        self.assertEqual(codec.dumps([2 ** 70]), b'[1180591620717411303424]')
+
+
+class AsyncAPITest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_crud(self):
+        _, response = app.test_client.get('/async-items')
+        self.assertEqual(len(response.json), 2)
+        _, response = app.test_client.get('/async-items/3')
+        self.assertEqual(response.status, 404)
+        _, response = app.test_client.post('/async-items/', data='{"name": "Bar"}')
+        self.assertEqual(response.status, 201)
+        self.assertEqual(response.json['id'], 3)
+        _, response = app.test_client.patch('/async-items/3', data='{"name": "Baz"}')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.json['name'], 'Baz')
+        _, response = app.test_client.delete('/async-items/3')
+        self.assertEqual(response.status, 204)
+        self.assertEqual(len(MODELS), 2)
+
+
+class StreamingAPITest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_list(self):
+        _, expected = app.test_client.get('/items')
+        _, response = app.test_client.get('/streaming-items')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(response.json, expected.json)
+
+    def test_empty_list(self):
+        MODELS[:] = []
+        _, response = app.test_client.get('/streaming-items')
+        self.assertEqual(response.json, [])
+
+
+class BulkAPITest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_bulk_create(self):
+        _, response = app.test_client.post('/bulk-items/', data='[{"name": "Bar"}, {}, {"name": "Baz"}]')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.json['details'], [None, {'name': 'This field is required.'}, None])
+        self.assertEqual(len(MODELS), 2)
+        _, response = app.test_client.post('/bulk-items/', data='[{"name": "Bar"}, {"name": "Baz"}]')
+        self.assertEqual(response.status, 201)
+        self.assertEqual([item['id'] for item in response.json], [3, 4])
+        _, response = app.test_client.post('/bulk-items/', data='{"name": "Qux"}')
+        self.assertEqual(response.json['id'], 5)
+        _, response = app.test_client.post('/items/', data='[{"name": "Bar"}]')
+        self.assertEqual(response.status, 400)
+
+    def test_bulk_update(self):
+        _, response = app.test_client.patch('/bulk-items/', data='[{"id": 1, "name": "Bar"}, {"id": 3}]')
+        self.assertEqual(response.status, 404)
+        self.assertEqual(response.json['details'], [3])
+        _, response = app.test_client.patch('/bulk-items/', data='[{"name": "Bar"}]')
+        self.assertEqual(response.status, 400)
+        _, response = app.test_client.patch('/bulk-items/', data='[{"id": 1, "name": "Bar"}, {"id": 2, "name": "Baz"}]')
+        self.assertEqual(response.status, 200)
+        self.assertEqual([model['name'] for model in MODELS], ['Bar', 'Baz'])
+        _, response = app.test_client.patch('/items/', data='[]')
+        self.assertEqual(response.status, 405)
+
+    def test_bulk_destroy(self):
+        _, response = app.test_client.delete('/bulk-items/', data='[1, 3]')
+        self.assertEqual(response.status, 404)
+        _, response = app.test_client.delete('/bulk-items/', data='[1, 2]')
+        self.assertEqual(response.status, 204)
+        self.assertEqual(MODELS, [])
+
+    def test_invalid_pks(self):
+        _, response = app.test_client.delete('/bulk-items/', data='[1, 1]')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.json['message'], 'Primary keys must be unique.')
+        _, response = app.test_client.delete('/bulk-items/', data='[{"a": 1}]')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.json['message'], 'Primary keys must be strings or numbers.')
+        _, response = app.test_client.patch('/bulk-items/', data='[{"id": 1, "name": "Bar"}, {"id": 1, "name": "Baz"}]')
+        self.assertEqual(response.status, 400)
+        self.assertEqual([model['name'] for model in MODELS], ['Foo', 'Foo'])
+
+
+class CacheAPITest(TestCase):
+    def setUp(self):
+        reset()
+        self.cache = CachedItemsViewSet.RESPONSE_CACHE
+        self.cache.invalidate()
+        self.cache.hits = self.cache.misses = 0
+
+    def test_cache(self):
+        _, response = app.test_client.get('/cached-items/1')
+        MODELS[0]['name'] = 'Changed'
+        _, response = app.test_client.get('/cached-items/1')
+        self.assertEqual(response.json['name'], 'Foo')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        _, response = app.test_client.get('/cached-items/3')
+        self.assertEqual(response.status, 404)
+        self.assertEqual(len(self.cache), 1)
+
+        _, response = app.test_client.patch('/cached-items/2', data='{"name": "Bar"}')
+        self.assertEqual(len(self.cache), 0)
+        _, response = app.test_client.get('/cached-items/1')
+        self.assertEqual(response.json['name'], 'Changed')
+
+    def test_eviction(self):
+        for path in ('/cached-items', '/cached-items/1', '/cached-items/2', '/cached-items?foo=bar'):
+            app.test_client.get(path)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get_stats()['misses'], 4)
+
+    def test_shared_cache(self):
+        _, response = app.test_client.get('/cached-items/1')
+        self.assertEqual(response.json['name'], 'Foo')
+        _, response = app.test_client.get('/cached-upper-items/1')
+        self.assertEqual(response.json['name'], 'FOO')
+        self.assertEqual(len(self.cache), 2)
+
+    def test_write_during_read(self):
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        retrieve = SlowCachedItemsViewSet._create_dispatcher('retrieve')
+        update = CachedItemsViewSet._create_dispatcher('update_partial')
+
+        async def write():
+            await sleep(0.01)
+            return await update(make_request('PATCH', '/cached-items/1', b'{"name": "Written"}'), pk=1)
+
+        read, written = loop.run_until_complete(gather(
+            retrieve(make_request('GET', '/cached-items/1'), pk=1),
+            write(),
+            loop=loop
+        ))
+        self.assertEqual(written.status, 200)
+        self.assertIn(b'"Foo"', read.body)
+        self.assertEqual(len(self.cache), 0)
+        _, response = app.test_client.get('/cached-items/1')
+        self.assertEqual(response.json['name'], 'Written')
+
+
+class ConditionalAPITest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_body_etag(self):
+        for path in ('/etag-items/1', '/etag-items'):
+            _, response = app.test_client.get(path)
+            etag = response.headers['ETag']
+            _, response = app.test_client.get(path, headers={'If-None-Match': etag})
+            self.assertEqual(response.status, 304)
+            self.assertEqual(response.headers['ETag'], etag)
+            _, response = app.test_client.get(path, headers={'If-None-Match': '"other"'})
+            self.assertEqual(response.status, 200)
+        _, response = app.test_client.get('/items/1')
+        self.assertNotIn('ETag', response.headers)
+
+    def test_if_match(self):
+        _, response = app.test_client.get('/etag-items/1')
+        etag = response.headers['ETag']
+        _, response = app.test_client.patch('/etag-items/1', data='{"name": "Bar"}', headers={'If-Match': '"other"'})
+        self.assertEqual(response.status, 412)
+        _, response = app.test_client.patch('/etag-items/1', data='{"name": "Bar"}', headers={'If-Match': etag})
+        self.assertEqual(response.status, 200)
+        _, response = app.test_client.delete('/etag-items/1', headers={'If-Match': etag})
+        self.assertEqual(response.status, 412)
+
+    def test_versions(self):
+        _, response = app.test_client.get('/versioned-items/1')
+        version = int(MODELS[0]['date_created'].timestamp() * 1000000)
+        self.assertEqual(response.headers['ETag'], '"{}"'.format(version))
+        _, response = app.test_client.get('/versioned-items/1', headers={
+            'If-Modified-Since': response.headers['Last-Modified']
+        })
+        self.assertEqual(response.status, 304)
+        _, response = app.test_client.get('/versioned-items/1', headers={
+            'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'
+        })
+        self.assertEqual(response.status, 200)
+
+    def test_if_unmodified_since(self):
+        for since, status in (('Sat, 01 Jan 2000 00:00:00 GMT', 412), ('garbage', 200)):
+            _, response = app.test_client.patch('/versioned-items/1', data='{"name": "Bar"}', headers={
+                'If-Unmodified-Since': since
+            })
+            self.assertEqual(response.status, status)
+
+
+class ColumnarAPITest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_columns(self):
+        _, rows = app.test_client.get('/items')
+        for path in ('/items?layout=columns', '/streaming-items?layout=columns'):
+            _, response = app.test_client.get(path)
+            self.assertEqual(list(response.json), ['id', 'name', 'title', 'date_created'])
+            self.assertEqual(response.json['id'], [1, 2])
+            self.assertEqual(response.json['date_created'], [row['date_created'] for row in rows.json])
+        _, response = app.test_client.get('/paginated-items?layout=columns&fields=id')
+        self.assertEqual(response.json['results'], {'id': [1, 2]})
+        _, response = app.test_client.get('/items?layout=foo')
+        self.assertEqual(response.status, 400)
+
+    def test_columnar_serializer(self):
+        class CustomField(Field):
+            def to_representation_many(self, serializer, models, name):
+                return [model[name] * 2 for model in models]
+
+        class ColumnarSerializer(ItemSerializer):
+            COLUMNAR = True
+            id = CustomField()
+
+        expected = ItemSerializer(MODELS, many=True).serialize()
+        for row in expected:
+            row['id'] *= 2
+        self.assertEqual(ColumnarSerializer(MODELS, many=True).serialize(), expected)
+        self.assertEqual(ColumnarSerializer(iter(MODELS), many=True).serialize_columns()['id'], [2, 4])
+        ColumnarSerializer.COMPILED = True
+        self.assertEqual(ColumnarSerializer(MODELS, many=True).serialize(), expected)
+
+    def test_columnar_fallback(self):
+        class Model(object):
+            def __init__(self, **kwargs):
+                self.__dict__.update(kwargs)
+
+        class ColumnarSerializer(ItemSerializer):
+            COLUMNAR = True
+
+        class CustomSerializer(ItemSerializer):
+            COLUMNAR = True
+
+            def _serialize(self, instance):
+                return dict(super(CustomSerializer, self)._serialize(instance), custom=True)
+
+        models = [MODELS[0], Model(**MODELS[1])]
+        fields = ('id', 'name', 'date_created')
+        expected = [ItemSerializer(model, fields=fields).serialize() for model in models]
+        self.assertEqual(ColumnarSerializer(models, many=True, fields=fields).serialize(), expected)
+        self.assertEqual(ColumnarSerializer(iter(models), many=True, fields=fields).serialize(), expected)
+        self.assertEqual(ColumnarSerializer(models, many=True, fields=fields).serialize_columns()['name'], ['Foo', 'Foo'])
+        self.assertEqual(ItemSerializer(models, many=True, fields=fields).serialize(), expected)
+        self.assertTrue(all(row['custom'] for row in CustomSerializer(MODELS, many=True).serialize()))
+
+
+class OffloadAPITest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_list(self):
+        _, expected = app.test_client.get('/items?fields=id,title')
+        _, response = app.test_client.get('/offload-items?fields=id,title')
+        self.assertEqual(response.json, expected.json)
+        MODELS[:] = []
+        _, response = app.test_client.get('/offload-items')
+        self.assertEqual(response.json, [])
+
+    def test_context(self):
+        context = {'request': make_request('GET', '/items')}
+        serializer = ContextItemSerializer(MODELS, many=True, fields=['id', 'path'], context=context)
+        self.assertEqual(serializer.serialize()[0], {'id': 1, 'path': '/items'})
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        fragment = loop.run_until_complete(serialize_offloaded(
+            OffloadItemsViewSet(None).get_offload_executor(),
+            serializer,
+            JSONCodec(),
+            chunk_size=1
+        ))
+        # Worker processes don't get the serializer context.
+        self.assertEqual(
+            JSONCodec().decode(fragment.data),
+            [{'id': 1, 'path': None}, {'id': 2, 'path': None}]
+        )
+
+
+class SparseFieldsAPITest(TestCase):
+    def setUp(self):
+        reset()
+        HINTS[:] = []
+
+    def test_fields(self):
+        _, response = app.test_client.get('/sparse-items?fields=id,name')
+        self.assertEqual(response.json, [{'id': 1, 'name': 'Foo'}, {'id': 2, 'name': 'Foo'}])
+        _, response = app.test_client.get('/sparse-items/1?exclude=title,date_created')
+        self.assertEqual(response.json, {'id': 1, 'name': 'Foo'})
+        self.assertEqual(HINTS, [('id', 'name'), ('id', 'name')])
+        _, response = app.test_client.get('/sparse-items/1')
+        self.assertEqual(len(response.json), 4)
+        self.assertEqual(HINTS[-1], None)
+        _, response = app.test_client.get('/sparse-items?fields=id,foo')
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.json['details'], ['foo'])
+
+    def test_unselected_fields_are_not_evaluated(self):
+        class StrictSerializer(ItemSerializer):
+            def get_title(self, model):
+                raise AssertionError('Should not be called')
+
+        serializer = StrictSerializer(MODELS, many=True, fields=['id'])
+        self.assertEqual(serializer.serialize(), [{'id': 1}, {'id': 2}])
+        StrictSerializer.COMPILED = True
+        self.assertEqual(serializer.serialize(), [{'id': 1}, {'id': 2}])
+
+
+class PaginationAPITest(TestCase):
+    def setUp(self):
+        reset()
+        for _ in range(3):
+            app.test_client.post('/items/', data='{"name": "Bar"}')
+
+    def test_limit_offset(self):
+        _, response = app.test_client.get('/paginated-items')
+        self.assertEqual([item['id'] for item in response.json['results']], [1, 2])
+        self.assertEqual(response.json['count'], 5)
+        self.assertIsNone(response.json['previous'])
+        _, response = app.test_client.get(response.json['next'])
+        self.assertEqual([item['id'] for item in response.json['results']], [3, 4])
+        self.assertEqual(response.json['previous'], '/paginated-items')
+        _, response = app.test_client.get('/paginated-items?offset=4&limit=5')
+        self.assertEqual([item['id'] for item in response.json['results']], [5])
+        self.assertIsNone(response.json['next'])
+        _, response = app.test_client.get('/paginated-items?limit=foo')
+        self.assertEqual(response.status, 400)
+
+    def test_cursor(self):
+        _, response = app.test_client.get('/cursor-items')
+        self.assertEqual([item['id'] for item in response.json['results']], [1, 2])
+        self.assertNotIn('count', response.json)
+        self.assertIsNone(response.json['previous'])
+        _, response = app.test_client.get(response.json['next'])
+        self.assertEqual([item['id'] for item in response.json['results']], [3, 4])
+        _, last = app.test_client.get(response.json['next'])
+        self.assertEqual([item['id'] for item in last.json['results']], [5])
+        self.assertIsNone(last.json['next'])
+        _, response = app.test_client.get(last.json['previous'])
+        self.assertEqual([item['id'] for item in response.json['results']], [3, 4])
+        _, response = app.test_client.get(response.json['previous'])
+        self.assertEqual([item['id'] for item in response.json['results']], [1, 2])
+        self.assertIsNone(response.json['previous'])
+        _, response = app.test_client.get('/cursor-items?cursor=garbage')
+        self.assertEqual(response.status, 400)
+
+    def test_tampered_cursor(self):
+        for data in ('{"a":"x"}', '{"b":"x"}', '{"a":[1]}', '{"a":{"x":1}}', '[1]', '"x"', '{"a":true}'):
+            cursor = urlsafe_b64encode(data.encode()).decode()
+            _, response = app.test_client.get('/cursor-items?cursor=' + cursor)
+            self.assertEqual(response.status, 400, data)
+            self.assertEqual(response.json['message'], 'Invalid cursor.')
+
+
+class MetricsAPITest(TestCase):
+    def setUp(self):
+        reset()
+        METRICS.reset()
+
+    def test_metrics(self):
+        app.test_client.get('/metrics-items')
+        app.test_client.get('/metrics-items/1')
+        app.test_client.get('/metrics-items/3')
+        app.test_client.patch('/metrics-items/1', data='{"date_created": "garbage"}')
+        self.assertEqual(METRICS.durations[('MetricsItemsViewSet', 'list')].count, 1)
+        self.assertEqual(METRICS.statuses, {
+            ('MetricsItemsViewSet', 'list', 200): 1,
+            ('MetricsItemsViewSet', 'retrieve', 200): 1,
+            ('MetricsItemsViewSet', 'retrieve', 404): 1,
+            ('MetricsItemsViewSet', 'update_partial', 400): 1,
+        })
+        self.assertEqual(
+            set(phase for viewset, action, phase in METRICS.phases if action == 'list'),
+            {'fetch', 'serialize', 'encode'}
+        )
+
+        _, response = app.test_client.get('/metrics')
+        self.assertEqual(response.status, 200)
+        self.assertIn('text/plain', response.headers['Content-Type'])
+        self.assertIn(
+            'restic_requests_total{viewset="MetricsItemsViewSet",action="retrieve",status="404"} 1',
+            response.text
+        )
+        self.assertIn(
+            'restic_request_duration_seconds_bucket{viewset="MetricsItemsViewSet",action="list",le="+Inf"} 1',
+            response.text
+        )
+        self.assertIn('restic_phase_duration_seconds_count{viewset="MetricsItemsViewSet",action="list",phase="fetch"} 1', response.text)
+
+    def test_disabled(self):
+        app.test_client.get('/items/1')
+        self.assertEqual(len(METRICS.statuses), 0)
+
+
+class ProfilingAPITest(TestCase):
+    def setUp(self):
+        reset()
+        PROFILER.reset()
+
+    def test_profile(self):
+        app.test_client.get('/profiled-items/1')
+        app.test_client.get('/profiled-items/1', headers={'X-Restic-Profile': 'wrong'})
+        self.assertEqual(len(PROFILER.counts), 0)
+        _, response = app.test_client.get('/profiled-items/1', headers={'X-Restic-Profile': 'secret'})
+        self.assertEqual(response.json['id'], 1)
+
+        _, response = app.test_client.get('/debug/profiles/')
+        self.assertEqual(response.status, 403)
+        headers = {'X-Restic-Profile': 'secret'}
+        _, response = app.test_client.get('/debug/profiles/', headers=headers)
+        self.assertEqual(response.text, 'ProfiledItemsViewSet/retrieve 1\n')
+        _, response = app.test_client.get('/debug/profiles/ProfiledItemsViewSet/retrieve', headers=headers)
+        self.assertIn('function calls', response.text)
+        self.assertIn('get_model', response.text)
+        _, response = app.test_client.get('/debug/profiles/ProfiledItemsViewSet/retrieve?format=raw', headers=headers)
+        self.assertIsInstance(marshal.loads(response.body), dict)
+        _, response = app.test_client.get('/debug/profiles/ProfiledItemsViewSet/list', headers=headers)
+        self.assertEqual(response.status, 404)
+
+    def test_sample(self):
+        handler = signal.getsignal(signal.SIGALRM)
+        profiler = Profiler(mode='sample', interval=0.001)
+        self.assertIs(signal.getsignal(signal.SIGALRM), handler)
+
+        def busy():
+            deadline = perf_counter() + 0.02
+            while perf_counter() < deadline:
+                pass
+
+        async def handle():
+            await sleep(0)
+            busy()
+            return 'response'
+
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        result = loop.run_until_complete(profiler.profile(ItemSerializer(), 'list', handle()))
+        self.assertEqual(result, 'response')
+        collapsed = profiler.get_collapsed('ItemSerializer', 'list')
+        self.assertRegex(collapsed, r'^\S*tests\.handle;\S*tests\.busy \d+$')
+        self.assertNotIn('run_until_complete', collapsed)
+        self.assertIs(signal.getsignal(signal.SIGALRM), handler)
+
+
+class MemoryStoreTest(TestCase):
+    def test_store(self):
+        store = MemoryStore([{'name': 'Foo'}, {'id': 5, 'name': 'Bar'}], indexes=['name'])
+        self.assertEqual([model['id'] for model in store], [1, 5])
+        self.assertEqual(store.add({'name': 'Foo'})['id'], 6)
+        with self.assertRaises(ValueError):
+            store.add({'id': 5})
+        self.assertEqual(store.get(5)['name'], 'Bar')
+        self.assertIsNone(store.get(2))
+        self.assertEqual(store.get_many([6, 2]), [store.get(6), None])
+        self.assertEqual([model['id'] for model in store.find('name', 'Foo')], [1, 6])
+
+        version = store.version
+        store.update(store.get(1), {'id': 10, 'name': 'Bar'})
+        self.assertEqual(store.get(1)['name'], 'Bar')
+        self.assertEqual([model['id'] for model in store.find('name', 'Bar')], [5, 1])
+        self.assertEqual([model['id'] for model in store.find('name', 'Foo')], [6])
+        self.assertGreater(store.version, version)
+        with self.assertRaises(TypeError):
+            store.update(store.get(1), {'name': ['Foo']})
+        self.assertEqual(store.find('name', 'Bar'), [store.get(5), store.get(1)])
+        with self.assertRaises(TypeError):
+            store.add({'name': ['Foo']})
+        self.assertEqual(len(store), 3)
+
+        store.remove(store.get(6))
+        self.assertEqual(store.find('name', 'Foo'), [])
+        self.assertNotIn(6, store)
+        self.assertEqual(len(store), 2)
+        store.clear()
+        self.assertEqual(store.add({'name': 'Baz'})['id'], 7)
+        with self.assertRaises(KeyError):
+            store.find('id', 7)
+
+    def test_objects(self):
+        class Model(object):
+            def __init__(self, name, id=None):
+                self.id = id
+                self.name = name
+
+        store = MemoryStore([Model('Foo'), Model('Bar')], indexes=['name'])
+        self.assertEqual(store.get(2).name, 'Bar')
+        store.update(store.get(2), {'name': 'Baz'})
+        self.assertEqual(store.find('name', 'Baz'), [store.get(2)])
+
+
+class StoreAPITest(TestCase):
+    def setUp(self):
+        STORE.clear()
+        self.pk = STORE.add({'name': 'Foo', 'date_created': datetime(2010, 12, 31)})['id']
+
+    def test_crud(self):
+        _, response = app.test_client.get('/store-items/{}'.format(self.pk))
+        self.assertEqual(response.json['name'], 'Foo')
+        _, response = app.test_client.get('/store-items/{}'.format(self.pk + 100))
+        self.assertEqual(response.status, 404)
+
+        _, response = app.test_client.post('/store-items/', data='{"name": "Bar", "date_created": "2010-12-31 12:00:00"}')
+        self.assertEqual(response.status, 201)
+        pk = response.json['id']
+        self.assertGreater(pk, self.pk)
+        self.assertEqual(STORE.find('name', 'Bar'), [STORE.get(pk)])
+
+        _, response = app.test_client.patch('/store-items/{}'.format(pk), data='{"name": "Baz"}')
+        self.assertEqual(response.json['name'], 'Baz')
+        self.assertEqual(STORE.find('name', 'Bar'), [])
+
+        _, response = app.test_client.get('/store-items/')
+        self.assertEqual([item['id'] for item in response.json], [self.pk, pk])
+
+        _, response = app.test_client.delete('/store-items/', data='[{}]'.format(pk))
+        self.assertEqual(response.status, 204)
+        self.assertEqual(len(STORE), 1)
+
+    def test_invalid_pks(self):
+        for data in ('[{0}, {0}]', '[{{"a": {0}}}]', '[[{0}]]'):
+            _, response = app.test_client.delete('/store-items/', data=data.format(self.pk))
+            self.assertEqual(response.status, 400)
+        _, response = app.test_client.patch('/store-items/', data='[{{"id": {0}}}, {{"id": {0}}}]'.format(self.pk))
+        self.assertEqual(response.status, 400)
+        self.assertEqual(len(STORE), 1)
+
+
+class FilterAPITest(TestCase):
+    def setUp(self):
+        reset()
+        STORE.clear()
+        for index, name in enumerate(['Foo', 'Bar', 'Foo', 'Baz']):
+            STORE.add({'name': name, 'date_created': datetime(2010, 12, 31 - index)})
+        self.pks = [model['id'] for model in STORE]
+
+    def get_ids(self, url):
+        _, response = app.test_client.get(url)
+        self.assertEqual(response.status, 200)
+        return [item['id'] for item in response.json]
+
+    def test_filter(self):
+        pks = self.pks
+        self.assertEqual(self.get_ids('/filtered-items/?name=Foo'), [pks[0], pks[2]])
+        self.assertEqual(self.get_ids('/filtered-items/?name=Foo&id__gt={}'.format(pks[0])), [pks[2]])
+        self.assertEqual(self.get_ids('/filtered-items/?id__in={},{},1000'.format(pks[3], pks[1])), [pks[3], pks[1]])
+        self.assertEqual(self.get_ids('/filtered-items/?date_created__lte=2010-12-29T00:00:00'), [pks[2], pks[3]])
+        self.assertEqual(self.get_ids('/filtered-items/?name=Qux'), [])
+        self.assertEqual(self.get_ids('/filtered-items/?unknown=1'), pks)
+
+    def test_untyped_values(self):
+        pk = STORE.add({'name': '123', 'date_created': datetime(2010, 12, 1)})['id']
+        self.assertEqual(self.get_ids('/filtered-items/?name=123'), [pk])
+        self.assertEqual(self.get_ids('/filtered-items/?name__in=123,Bar'), [pk, self.pks[1]])
+        self.assertEqual(self.get_ids('/filtered-items/?id={}'.format(pk)), [pk])
+        self.assertEqual(self.get_ids('/filtered-items/?id=abc'), [])
+        self.assertEqual(Filter('flag', 'exact', Literal('true')).matches({'flag': True}), True)
+        self.assertEqual(Filter('flag', 'exact', Literal('1')).matches({'flag': True}), False)
+        self.assertEqual(Filter('flag', 'exact', Literal('null')).matches({'flag': None}), True)
+
+    def test_ordering(self):
+        pks = self.pks
+        self.assertEqual(self.get_ids('/filtered-items/?ordering=-id'), pks[::-1])
+        self.assertEqual(self.get_ids('/filtered-items/?ordering=name,-id'), [pks[1], pks[3], pks[2], pks[0]])
+
+    def test_errors(self):
+        for url in (
+                '/filtered-items/?id__foo=1',
+                '/filtered-items/?ordering=date_created',
+                '/filtered-items/?date_created=garbage',
+        ):
+            _, response = app.test_client.get(url)
+            self.assertEqual(response.status, 400)
+
+    def test_paginated(self):
+        MODELS.append({'id': 3, 'name': 'Bar', 'date_created': datetime.now()})
+        MODELS.append({'id': 4, 'name': 'Foo', 'date_created': datetime.now()})
+        _, response = app.test_client.get('/filtered-paginated-items/?name=Foo&ordering=-id')
+        self.assertEqual([item['id'] for item in response.json['results']], [4, 2])
+        self.assertEqual(response.json['count'], 3)
+        _, response = app.test_client.get('/filtered-paginated-items/' + response.json['next'].split('/')[-1])
+        self.assertEqual([item['id'] for item in response.json['results']], [1])
+
+    def test_indexes(self):
+        store = MemoryStore([{'name': 'Foo'}, {'name': 'Bar'}, {'name': 'Foo'}], indexes=['name'])
+        query = Query([Filter('name', 'exact', 'Foo'), Filter('id', 'gt', 1)])
+        self.assertEqual(query.get_candidates(store), store.find('name', 'Foo'))
+        self.assertEqual(list(query.apply(store)), [store.get(3)])
+        query = Query([Filter('id', 'in', [3, 1, 3])], [('id', False)])
+        self.assertEqual(query.get_candidates(store), [store.get(3), store.get(1)])
+        self.assertEqual(query.apply(store), [store.get(1), store.get(3)])
+        self.assertIsNone(Query([Filter('name', 'lt', 'Foo')]).get_candidates(store))
+
+
+class CoalescingTest(TestCase):
+    def setUp(self):
+        reset()
+        CoalescedItemsViewSet.CALLS[:] = []
+        self.loop = new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.dispatcher = CoalescedItemsViewSet._create_dispatcher('retrieve')
+
+    def retrieve(self, *pks):
+        return self.loop.run_until_complete(gather(*[
+            self.dispatcher(make_request('GET', '/coalesced-items/{}'.format(pk)), pk=pk)
+            for pk
+            in pks
+        ], loop=self.loop, return_exceptions=True))
+
+    def test_coalesce(self):
+        responses = self.retrieve(1, 1, 1, 2)
+        self.assertEqual(sorted(CoalescedItemsViewSet.CALLS), [1, 2])
+        self.assertEqual(len(set(map(id, responses))), 4)
+        self.assertEqual(responses[0].body, responses[2].body)
+        self.assertEqual(responses[3].status, 200)
+        self.assertEqual(len(CoalescedItemsViewSet.SINGLE_FLIGHT), 0)
+
+        self.retrieve(1)
+        self.assertEqual(sorted(CoalescedItemsViewSet.CALLS), [1, 1, 2])
+
+    def test_errors(self):
+        responses = self.retrieve(3, 3, -1, -1)
+        self.assertEqual(sorted(CoalescedItemsViewSet.CALLS), [-1, 3])
+        self.assertEqual([response.status for response in responses[:2]], [404, 404])
+        self.assertIsInstance(responses[2], RuntimeError)
+        self.assertIs(responses[2], responses[3])
+
+    def test_shared_single_flight(self):
+        dispatcher = CoalescedUpperItemsViewSet._create_dispatcher('retrieve')
+        responses = self.loop.run_until_complete(gather(
+            self.dispatcher(make_request('GET', '/coalesced-items/1'), pk=1),
+            dispatcher(make_request('GET', '/coalesced-items/1'), pk=1),
+            loop=self.loop
+        ))
+        self.assertEqual(CoalescedItemsViewSet.CALLS, [1, 1])
+        self.assertIn(b'"Foo"', responses[0].body)
+        self.assertIn(b'"FOO"', responses[1].body)
+
+    def test_http(self):
+        _, response = app.test_client.get('/coalesced-items/1')
+        self.assertEqual(response.json['id'], 1)
+
+
+class RelatedFieldTest(TestCase):
+    def setUp(self):
+        reset()
+        LOADS[:] = []
+
+    def test_list(self):
+        MODELS.append({'id': 3, 'name': 'Bar', 'date_created': datetime.now()})
+        MODELS.append({'id': 4, 'name': 'Bar', 'date_created': datetime.now()})
+        _, response = app.test_client.get('/related-items/')
+        self.assertEqual(
+            [(item['owner'], item['tags']) for item in response.json],
+            [
+                ({'id': 1, 'name': 'Alice'}, [{'name': 'a'}]),
+                ({'id': 2, 'name': 'Bob'}, [{'name': 'a'}, {'name': 'b'}]),
+                (None, [{'name': 'a'}, {'name': 'b'}]),
+                ({'id': 1, 'name': 'Alice'}, [{'name': 'a'}, {'name': 'b'}]),
+            ]
+        )
+        self.assertEqual(sorted(LOADS), [('owners', [1, 2, 0]), ('tags', ['a', 'b'])])
+
+    def test_retrieve(self):
+        _, response = app.test_client.get('/related-items/2?fields=id,owner')
+        self.assertEqual(response.json, {'id': 2, 'owner': {'id': 2, 'name': 'Bob'}})
+        self.assertEqual(LOADS, [('owners', [2])])
+
+    def test_serializer(self):
+        class ItemSerializer(Serializer):
+            COMPILED = True
+            tags = RelatedField(TagSerializer, TagLoader, many=True)
+            owner = RelatedField(OwnerSerializer, OwnerLoader)
+
+        models = [{'tags': ['a', 'c'], 'owner': 1}, {'tags': None, 'owner': 1}]
+        context = {}
+        serializer = ItemSerializer(models, many=True, exclude=['owner'], context=context)
+        self.assertEqual(serializer.serialize(), [{'tags': [{'name': 'a'}, None]}, {'tags': None}])
+        self.assertEqual(ItemSerializer(models[0], fields=['tags'], context=context).serialize(), {'tags': [{'name': 'a'}, None]})
+        self.assertEqual(LOADS, [('tags', ['a', 'c'])])
+
+        serializer = ItemSerializer(models, many=True)
+        with self.assertRaises(RuntimeError):
+            serializer.serialize()
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        loop.run_until_complete(serializer.prefetch())
+        self.assertEqual(serializer.serialize()[1], {'tags': None, 'owner': {'id': 1, 'name': 'Alice'}})
+        self.assertIsInstance(serializer.get_loader(OwnerLoader), OwnerLoader)
+
+    def test_serialize_rows(self):
+        class ItemSerializer(Serializer):
+            id = Field()
+            tags = RelatedField(TagSerializer, TagLoader, many=True)
+
+        models = [{'id': index, 'tags': [index]} for index in range(5)]
+        serializer = ItemSerializer((model for model in models), many=True)
+        self.assertEqual(serializer.serialize()[0], {'id': 0, 'tags': [None]})
+        self.assertEqual(LOADS, [('tags', [0, 1, 2, 3, 4])])
+
+
+class SerializerFieldsTest(TestCase):
+    def test_fields_are_collected_per_class(self):
+        class BaseSerializer(Serializer):
+            id = Field(read_only=True)
+            name = Field()
+            extra = Field()
+
+        class ChildSerializer(BaseSerializer):
+            name = NaiveDateTimeField()
+            extra = None
+            created = Field()
+
+        self.assertEqual(list(BaseSerializer.fields), ['id', 'name', 'extra'])
+        self.assertEqual(list(ChildSerializer.fields), ['id', 'name', 'created'])
+        self.assertIsInstance(ChildSerializer.fields['name'], NaiveDateTimeField)
+        self.assertIs(ChildSerializer().fields, ChildSerializer.fields)
+        with self.assertRaises(TypeError):
+            ChildSerializer.fields['foo'] = Field()
+
+    def test_fields_attached_later(self):
+        class BaseSerializer(Serializer):
+            id = Field()
+
+        class ChildSerializer(BaseSerializer):
+            pass
+
+        BaseSerializer.name = Field()
+        self.assertEqual(list(ChildSerializer.fields), ['id', 'name'])
+        del BaseSerializer.name
+        self.assertEqual(list(ChildSerializer.fields), ['id'])
+
+
+class CompiledSerializerTest(TestCase):
+    class CompiledItemSerializer(ItemSerializer):
+        COMPILED = True
+
+    class Model(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    def setUp(self):
+        reset()
+
+    def test_serialize(self):
+        expected = ItemSerializer(MODELS, many=True).serialize()
+        self.assertEqual(self.CompiledItemSerializer(MODELS, many=True).serialize(), expected)
+        self.assertEqual(self.CompiledItemSerializer(iter(MODELS), many=True).serialize(), expected)
+        self.assertEqual(self.CompiledItemSerializer(MODELS[0]).serialize(), expected[0])
+        self.assertEqual(self.CompiledItemSerializer([], many=True).serialize(), [])
+
+    def test_serialize_objects(self):
+        class ObjectSerializer(Serializer):
+            COMPILED = True
+            id = Field()
+            date_created = NaiveDateTimeField()
+
+        models = [self.Model(**model) for model in MODELS]
+        self.assertEqual(
+            ObjectSerializer(models, many=True).serialize(),
+            [
+                {'id': model['id'], 'date_created': model['date_created'].strftime(NaiveDateTimeField.DEFAULT_FORMATS[0])}
+                for model in MODELS
+            ]
+        )
+
+    def test_validate(self):
+        serializer = self.CompiledItemSerializer()
+        for data, allow_partial in (
+                ({}, False),
+                ({}, True),
+                ({'id': 5, 'name': 'Foo', 'date_created': '2010-12-31 12:34:56'}, False),
+                ({'date_created': 'garbage'}, True),
+        ):
+            try:
+                expected = ItemSerializer()._validate(data, allow_partial)
+            except BadRequest as error:
+                with self.assertRaises(BadRequest) as context:
+                    serializer._validate(data, allow_partial)
+                self.assertEqual(context.exception.details, error.details)
+            else:
+                self.assertEqual(serializer._validate(data, allow_partial), expected)
+
+    def test_try_validate(self):
+        for serializer in (ItemSerializer(), self.CompiledItemSerializer()):
+            self.assertEqual(serializer._try_validate({'name': 'Foo'}, True), ({'name': 'Foo'}, {}))
+            _, errors = serializer._try_validate({'date_created': 'garbage'}, False)
+            self.assertEqual(sorted(errors), ['date_created', 'name'])
+            with self.assertRaises(BadRequest) as context:
+                serializer._validate_many([{'name': 'Foo'}, {}, 1])
+            self.assertEqual(context.exception.details, [None, {'name': 'This field is required.'}, {'non_field_errors': 'Expected an object.'}])
+
+    def test_validate_override(self):
+        class CustomSerializer(ItemSerializer):
+            def _validate(self, data, allow_partial=False):
+                validated_data = super(CustomSerializer, self)._validate(data, allow_partial)
+                if validated_data['name'] == 'Bad':
+                    raise BadRequest('Bad name.')
+                return dict(validated_data, custom=True)
+
+        serializer = CustomSerializer()
+        self.assertEqual(serializer.validate_item({'name': 'Foo'}), ({'name': 'Foo', 'custom': True}, {}))
+        self.assertEqual(serializer._validate_many([{'name': 'Foo'}]), [{'name': 'Foo', 'custom': True}])
+        with self.assertRaises(BadRequest) as context:
+            serializer._validate_many([{'name': 'Bad'}, {}])
+        self.assertEqual(context.exception.details, [
+            {'non_field_errors': 'Bad name.'},
+            {'name': 'This field is required.'},
+        ])
+
+
+class DateTimeFieldTest(TestCase):
+    def parse_slow(self, field, data):
+        for format_str in field.formats:
+            try:
+                return datetime.strptime(data, format_str)
+            except ValueError:
+                continue
+
+    def test_naive_parse(self):
+        field = NaiveDateTimeField()
+        for data in (
+                '2010-12-31 12:34:56.421337',
+                '2010-12-31T12:34:56.4',
+                '2010-12-31T12:34:56',
+                '2010-1-31 12:34:56',
+                '2010-12-31 12:34:56+0200',
+                '2010-12-31',
+                '2010-13-31 12:34:56',
+                '2010-12-31 12:34:56.',
+        ):
+            expected = self.parse_slow(field, data)
+            if expected is None:
+                with self.assertRaises(ValidationError):
+                    field.to_internal_value(None, 'date', data)
+            else:
+                self.assertEqual(field.to_internal_value(None, 'date', data), expected)
+
+    def test_aware_parse(self):
+        field = AwareDateTimeField(formats=AwareDateTimeField.DEFAULT_FORMATS)
+        value = field.to_internal_value(None, 'date', '2010-12-31 12:34:56.42-0230')
+        self.assertEqual(value, datetime(2010, 12, 31, 12, 34, 56, 420000, timezone(-timedelta(hours=2, minutes=30))))
+        self.assertEqual(value.utcoffset(), -timedelta(hours=2, minutes=30))
+        with self.assertRaises(ValidationError):
+            field.to_internal_value(None, 'date', '2010-12-31 12:34:56')
+
+    def test_adaptive_formats(self):
+        field = NaiveDateTimeField(formats=['%d.%m.%Y', '%d/%m/%Y'])
+        self.assertEqual(field.to_internal_value(None, 'date', '31/12/2010'), datetime(2010, 12, 31))
+        self.assertEqual(field._parse_formats, ['%d/%m/%Y', '%d.%m.%Y'])
+        self.assertEqual(field.to_internal_value(None, 'date', '31.12.2010'), datetime(2010, 12, 31))
+
+    def test_ambiguous_formats(self):
+        field = NaiveDateTimeField(formats=['%d/%m/%Y', '%m/%d/%Y'])
+        self.assertEqual(field.to_internal_value(None, 'date', '01/02/2010'), datetime(2010, 2, 1))
+        self.assertEqual(field.to_internal_value(None, 'date', '01/13/2010'), datetime(2010, 1, 13))
+        self.assertEqual(field.to_internal_value(None, 'date', '01/02/2010'), datetime(2010, 2, 1))
+
+        field = NaiveDateTimeField(formats=['%Y-%d-%m %H:%M:%S', '%Y-%m-%d %H:%M:%S'])
+        self.assertEqual(field.to_internal_value(None, 'date', '2010-01-02 00:00:00'), datetime(2010, 2, 1))
+        self.assertEqual(field.to_internal_value(None, 'date', '2010-01-13 00:00:00'), datetime(2010, 1, 13))
+
+    def test_representation(self):
+        values = [
+            datetime(2010, 12, 31, 12, 34, 56, 421337),
+            datetime(2010, 12, 31, 12, 34, 56),
+            datetime(999, 1, 1),
+        ]
+        for format_str in NaiveDateTimeField.DEFAULT_FORMATS + ('%d.%m.%Y',):
+            field = NaiveDateTimeField(formats=format_str)
+            expected = [value.strftime(format_str) for value in values]
+            self.assertEqual([field.format(value) for value in values], expected)
+            self.assertEqual(field.format_many(values), expected)
+            self.assertEqual(field.to_representation_many(None, [{'d': value} for value in values], 'd'), expected)
+
+        values = [
+            datetime(2010, 12, 31, 12, 34, 56, tzinfo=timezone.utc),
+            datetime(2010, 12, 31, 12, 34, 56, tzinfo=timezone(-timedelta(hours=2, minutes=30))),
+            datetime(2010, 12, 31, 12, 34, 56, tzinfo=timezone(timedelta(hours=5, minutes=45))),
+        ]
+        for format_str in AwareDateTimeField.DEFAULT_FORMATS + ('%Y-%m-%d %H:%M',):
+            field = AwareDateTimeField(formats=format_str)
+            self.assertEqual(field.format_many(values), [value.strftime(format_str) for value in values])
+        with self.assertRaises(AssertionError):
+            NaiveDateTimeField().format(values[0])
+
+
+class BenchmarkTest(TestCase):
+    def test_run(self):
+        results = runner.run(micro.get_benchmarks(sizes=(10,)), repeat=1, min_time=0, output=None)
+        self.assertIn('serialize.plain.10', results)
+        self.assertIn('dispatch.retrieve', results)
+        self.assertEqual(results['serialize.plain.10']['rows'], 10)
+        self.assertGreater(results['validate.datetime.invalid']['rows_per_second'], 0)
+
+    def test_compare(self):
+        baseline = {'a': {'rows_per_second': 100.0}, 'b': {'rows_per_second': 100.0}}
+        results = {'a': {'rows_per_second': 95.0}, 'b': {'rows_per_second': 50.0}, 'c': {'rows_per_second': 1.0}}
+        comparison = runner.compare(baseline, results, threshold=0.1)
+        self.assertEqual([(name, regressed) for name, _, _, _, regressed in comparison], [('a', False), ('b', True)])
+        self.assertIn('REGRESSION', runner.format_comparison(comparison))
+
+
+class CompressionTest(TestCase):
+    def setUp(self):
+        reset()
+        CompressedItemsViewSet.RESPONSE_CACHE.invalidate()
+
+    def get(self, path, encoding='identity', **headers):
+        headers['Accept-Encoding'] = encoding
+        return app.test_client.get(path, headers=headers, allow_redirects=False)[1]
+
+    def test_choose_encoding(self):
+        self.assertIsNone(choose_encoding(None))
+        self.assertIsNone(choose_encoding('br'))
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0.5, deflate'), 'deflate')
+        self.assertEqual(choose_encoding('*'), 'gzip')
+        self.assertIsNone(choose_encoding('gzip;q=0, *;q=0'))
+        self.assertEqual(variant_etag('W/"1"', 'gzip'), 'W/"1-gzip"')
+
+    def test_compress(self):
+        _, expected = app.test_client.get('/items')
+        for encoding in ('gzip', 'deflate'):
+            response = self.get('/compressed-items', encoding)
+            self.assertEqual(response.headers['Content-Encoding'], encoding)
+            self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(response.json, expected.json)
+
+        response = self.get('/compressed-items')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.json, expected.json)
+
+        response = self.get('/compressed-items', 'gzip;q=0')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_threshold(self):
+        response = self.get('/compressed-items/1', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json['id'], 1)
+
+    def test_cached_variants(self):
+        response = self.get('/compressed-items', 'gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        entries = list(CompressedItemsViewSet.RESPONSE_CACHE._entries.values())
+        self.assertEqual(len(entries), 1)
+        _, entry = entries[0]
+        self.assertEqual(list(entry.variants), ['gzip'])
+        self.assertEqual(zlib.decompress(entry.variants['gzip'], 16 + zlib.MAX_WBITS), entry.body)
+
+        self.get('/compressed-items', 'deflate')
+        self.assertEqual(sorted(entry.variants), ['deflate', 'gzip'])
+        cached = self.get('/compressed-items', 'gzip')
+        self.assertEqual(cached.json, response.json)
+
+    def test_etags(self):
+        identity = self.get('/compressed-items')
+        response = self.get('/compressed-items', 'gzip')
+        self.assertEqual(response.headers['ETag'], variant_etag(identity.headers['ETag'], 'gzip'))
+
+        response = self.get('/compressed-items', 'gzip', **{'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        response = self.get('/compressed-items', 'deflate', **{'If-None-Match': variant_etag(identity.headers['ETag'], 'gzip')})
+        self.assertEqual(response.status, 200)
+
+        response = self.get('/compressed-items/2', 'gzip', **{'If-None-Match': identity.headers['ETag']})
+        self.assertEqual(response.status, 200)
+
+    def test_if_match(self):
+        MODELS[0]['name'] = 'Foo' * 50
+        etag = self.get('/compressed-items/1', 'gzip').headers['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        for if_match, status in (('"other-gzip"', 412), (etag, 200), (etag.replace('gzip', 'deflate'), 200)):
+            _, response = app.test_client.patch(
+                '/compressed-items/1',
+                data='{"name": "Bar"}',
+                headers={'If-Match': if_match, 'Accept-Encoding': 'identity'}
+            )
+            self.assertEqual(response.status, status)
+
+    def test_streaming(self):
+        _, expected = app.test_client.get('/items')
+        response = self.get('/compressed-streaming-items', 'gzip')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.json, expected.json)
+
+    def test_streaming_flush(self):
+        written = []
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        async def streaming_fn(response):
+            await response.write(b'[1,')
+            self.assertEqual(decompressor.decompress(b''.join(written)), b'[1,')
+            await response.write(b'2]')
+
+        class Target(object):
+            async def write(self, data):
+                written.append(data)
+
+        response = stream(streaming_fn)
+        compress_stream(response, 'gzip')
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        loop.run_until_complete(response.streaming_fn(Target()))
+        self.assertEqual(zlib.decompress(b''.join(written), 16 + zlib.MAX_WBITS), b'[1,2]')
+
+
+class DispatchTest(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_handlers(self):
+        handlers = ItemsViewSet.get_handlers()
+        self.assertEqual(sorted(handlers), ['create', 'destroy', 'list', 'retrieve', 'update', 'update_partial'])
+        self.assertIs(handlers['list'], ItemsViewSet.list)
+        self.assertIs(ItemsViewSet.get_handlers(), handlers)
+        self.assertIsNone(DynamicItemsViewSet.get_handlers())
+
+    def test_static_handlers(self):
+        class StaticViewSet(ModelViewSet):
+            @staticmethod
+            def list():
+                return exceptions.NotFound()
+
+            @classmethod
+            def retrieve(cls, pk):
+                return exceptions.Forbidden()
+
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        viewset = StaticViewSet(make_request('GET', '/items'))
+        self.assertEqual(loop.run_until_complete(viewset.dispatch('list')).status, 404)
+        self.assertEqual(loop.run_until_complete(viewset.dispatch('retrieve', pk=1)).status, 403)
+
+    def test_slots(self):
+        viewset = ModelViewSet(make_request('GET', '/items'))
+        self.assertFalse(hasattr(viewset, '__dict__'))
+        self.assertIsNone(viewset.serializer_context)
+
+    def test_not_allowed(self):
+        for method, path, allow in (('patch', '/items/', 'GET, POST'), ('delete', '/items/', 'GET, POST')):
+            _, response = getattr(app.test_client, method)(path)
+            self.assertEqual(response.status, 405)
+            self.assertEqual(response.headers['Allow'], allow)
+            self.assertEqual(response.json, dict(message='Method Not Allowed', details=None))
+        _, response = app.test_client.patch('/bulk-items/', data='[]')
+        self.assertNotEqual(response.status, 405)
+
+    def test_dynamic_handler(self):
+        _, response = app.test_client.get('/dynamic-items')
+        self.assertEqual(response.status, 200)
+        _, response = app.test_client.get('/dynamic-items?deny=1')
+        self.assertEqual(response.status, 405)
+        self.assertEqual(response.headers['Allow'], 'POST')
+        self.assertEqual(response.json['message'], 'Method Not Allowed')
+        _, response = app.test_client.patch('/dynamic-items/')
+        self.assertEqual(response.status, 405)
+        self.assertEqual(response.headers['Allow'], 'GET, POST')
+
+    def test_errors(self):
+        codec = JSONCodec()
+        body = codec.encode_error(exceptions.NotFound())
+        self.assertEqual(codec.decode(body), dict(message='Not Found', details=None))
+        self.assertIs(codec.encode_error(exceptions.NotFound()), body)
+        self.assertIsNot(codec.encode_error(exceptions.ModelNotFound()), body)
+        body = codec.encode_error(exceptions.NotFound('Cat not found', details=[1]))
+        self.assertEqual(codec.decode(body), dict(message='Cat not found', details=[1]))
+
+        dispatcher = ErrorItemsViewSet._create_dispatcher('retrieve')
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        response = loop.run_until_complete(dispatcher(make_request('GET', '/items/100'), pk=100))
+        self.assertEqual(response.status, 403)
+        self.assertEqual(codec.decode(response.body), dict(message='Forbidden', details=None))
+        response = loop.run_until_complete(dispatcher(make_request('GET', '/items/5'), pk=5))
+        self.assertEqual(response.status, 404)
+        self.assertEqual(codec.decode(response.body)['message'], exceptions.ModelNotFound.message)
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        STORE.clear()
+        ImportItemSerializer.BATCHES[:] = []
+
+    def post(self, body, content_type='application/x-ndjson'):
+        _, response = app.test_client.post('/import-items/import', data=body, headers={'Content-Type': content_type})
+        return response
+
+    def test_import(self):
+        lines = ['{{"name": "Item {}", "date_created": "2010-12-31 12:00:00"}}'.format(index) for index in range(5)]
+        response = self.post('\n'.join(lines) + '\n')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.json, dict(created=5, failed=0, errors=[]))
+        self.assertEqual(ImportItemSerializer.BATCHES, [2, 2, 1])
+        self.assertEqual(sorted(model['name'] for model in STORE.values()), ['Item {}'.format(index) for index in range(5)])
+
+    def test_errors(self):
+        body = '\n'.join([
+            '{"name": "Foo"}',
+            '',
+            '{"date_created": "garbage"}',
+            '{"name": ',
+            '[1]',
+            '{"name": "' + 'x' * 100 + '"}',
+            '{"name": "Bar"}',
+        ])
+        response = self.post(body)
+        self.assertEqual(response.json['created'], 2)
+        self.assertEqual(response.json['failed'], 4)
+        self.assertEqual(response.json['errors'], [
+            dict(line=3, message='Model validation failed', details={
+                'name': 'This field is required.',
+                'date_created': response.json['errors'][0]['details']['date_created']
+            }),
+            dict(line=4, message='Malformed JSON.', details=response.json['errors'][1]['details']),
+        ])
+        self.assertEqual(sorted(model['name'] for model in STORE.values()), ['Bar', 'Foo'])
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_import_codec(self):
+        class MessagePackImportItemsViewSet(ImportItemsViewSet):
+            CODEC = MessagePackCodec()
+            CODECS = ()
+
+        json_codec = UJSONCodec()
+        request = make_request('POST', '/import-items/import')
+        self.assertIs(type(MessagePackImportItemsViewSet(request).get_import_codec()), JSONCodec)
+        MessagePackImportItemsViewSet.CODECS = (NDJSONCodec(json_codec),)
+        self.assertIs(MessagePackImportItemsViewSet(request).get_import_codec(), json_codec)
+        MessagePackImportItemsViewSet.CODEC = json_codec
+        MessagePackImportItemsViewSet.CODECS = ()
+        self.assertIs(MessagePackImportItemsViewSet(request).get_import_codec(), json_codec)
+
+    def test_content_type(self):
+        response = self.post('{"name": "Foo"}', 'application/json')
+        self.assertEqual(response.status, 415)
+        self.assertEqual(response.json['details'], ['application/x-ndjson'])
+        self.assertEqual(len(STORE), 0)
+
+    def test_iterate_lines(self):
+        class StreamingRequest(object):
+            def __init__(self, chunks):
+                self.stream = Queue()
+                for chunk in chunks:
+                    self.stream.put_nowait(chunk)
+                self.stream.put_nowait(None)
+
+        async def collect_lines(request):
+            return [line async for line in iterate_lines(request, 5)]
+
+        loop = new_event_loop()
+        self.addCleanup(loop.close)
+        chunks = [b'ab', b'c\nde', b'\n\nfghijk', b'lmn\nxy', b'z\nuvwxyz']
+        self.assertEqual(
+            loop.run_until_complete(collect_lines(StreamingRequest(chunks))),
+            [b'abc', b'de', b'', None, b'xyz', None]
+        )
+        self.assertEqual(
+            loop.run_until_complete(collect_lines(make_request('POST', '/', b'abc\nabcdef\n'))),
+            [b'abc', None, b'']
+        )
+
+
+class NegotiationTest(TestCase):
+    def setUp(self):
+        reset()
+        CachedItemsViewSet.RESPONSE_CACHE.invalidate()
+
+    def get(self, path, accept):
+        _, response = app.test_client.get(path, headers={'Accept': accept})
+        return response
+
+    def test_negotiate(self):
+        json_codec, ndjson_codec = JSONCodec(), NDJSONCodec()
+        codecs = (ndjson_codec,)
+        for header, expected in (
+                (None, json_codec),
+                ('*/*', json_codec),
+                ('application/x-ndjson', ndjson_codec),
+                ('application/json;q=0.5, application/x-ndjson', ndjson_codec),
+                ('application/*', json_codec),
+                ('text/html, */*;q=0.1', json_codec),
+                ('text/html', None),
+                ('application/json;q=0, */*', ndjson_codec),
+        ):
+            self.assertIs(negotiate(header, json_codec, codecs), expected, header)
+
+    def test_ndjson(self):
+        _, expected = app.test_client.get('/items')
+        response = self.get('/items', 'application/x-ndjson')
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        lines = response.body.decode('utf-8').split('\n')
+        self.assertEqual(lines[-1], '')
+        self.assertEqual([JSONCodec().loads(line.encode('utf-8')) for line in lines[:-1]], expected.json)
+
+        response = self.get('/streaming-items', 'application/x-ndjson')
+        self.assertEqual(response.body.decode('utf-8').split('\n')[:-1], lines[:-1])
+
+        _, response = app.test_client.post(
+            '/bulk-items/',
+            data='{"name": "Bar"}\n{"name": "Baz"}\n',
+            headers={'Content-Type': 'application/x-ndjson'}
+        )
+        self.assertEqual(response.status, 201)
+        self.assertEqual([model['name'] for model in MODELS[-2:]], ['Bar', 'Baz'])
+
+        response = self.get('/items/5', 'application/x-ndjson')
+        self.assertEqual(response.status, 404)
+        self.assertEqual(response.body, b'{"message":"Model with such primary key was not found.","details":null}\n')
+
+    def test_not_acceptable(self):
+        response = self.get('/items', 'text/html')
+        self.assertEqual(response.status, 406)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(response.json['message'], 'Not Acceptable')
+        self.assertIn('application/json', response.json['details'])
+        _, response = app.test_client.post('/items/', data='{"name": "Bar"}', headers={'Accept': 'text/html'})
+        self.assertEqual(response.status, 406)
+        self.assertEqual(len(MODELS), 2)
+
+    def test_variants(self):
+        response = self.get('/cached-items', 'application/json')
+        self.assertIn('Accept', response.headers['Vary'])
+        self.assertNotIn('Vary', self.get('/cached-items', '*/*').headers)
+        ndjson = self.get('/cached-items', 'application/x-ndjson')
+        self.assertEqual(ndjson.headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(self.get('/cached-items', 'application/json').body, response.body)
+
+        response = self.get('/versioned-items/1', 'application/json')
+        ndjson = self.get('/versioned-items/1', 'application/x-ndjson')
+        self.assertNotEqual(response.headers['ETag'], ndjson.headers['ETag'])
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        _, expected = app.test_client.get('/items')
+        response = self.get('/items', 'application/msgpack')
+        self.assertEqual(response.headers['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.body, raw=False), expected.json)
+
+        self.assertEqual(self.get('/streaming-items', 'application/json').headers['Transfer-Encoding'], 'chunked')
+        response = self.get('/streaming-items', 'application/x-msgpack')
+        self.assertNotIn('Transfer-Encoding', response.headers)
+        self.assertEqual(msgpack.unpackb(response.body, raw=False), expected.json)
+
+        _, response = app.test_client.post(
+            '/items/',
+            data=msgpack.packb({'name': 'Bar'}, use_bin_type=True),
+            headers={'Content-Type': 'application/msgpack', 'Accept': 'application/msgpack'}
+        )
+        self.assertEqual(response.status, 201)
+        self.assertEqual(msgpack.unpackb(response.body, raw=False)['name'], 'Bar')
+
+        _, response = app.test_client.post('/items/', data=b'\xc1', headers={'Content-Type': 'application/msgpack'})
+        self.assertEqual(response.status, 400)
+        self.assertEqual(response.json['message'], 'Malformed MessagePack.')
+
+        codec = MessagePackCodec()
+        self.assertEqual(codec.decode(codec.encode({'a': Fragment(b'[1,{"b":null}]')})), {'a': [1, {'b': None}]})
@@ -0,0 +1,154 @@
+"""
+Helpers shared by serializers and viewsets.
+"""
+from collections import Mapping
+from functools import lru_cache
+from inspect import isawaitable, signature, Parameter
+
+
+async def maybe_await(value):
+    """
+    Await ``value`` if it is awaitable, otherwise return it as is.
+
+    Allows the same code path to call both regular functions
+    and coroutine functions.
+    """
+    if isawaitable(value):
+        return await value
+    return value
+
+
+async def iterate_chunks(models, size):
+    """
+    Iterate over ``models`` in lists of at most ``size`` items.
+
+    ``models`` can be either a regular iterable or an asynchronous iterable.
+    Only one chunk is kept in memory at a time.
+    """
+    chunk = []
+    if hasattr(models, '__aiter__'):
+        async for model in models:
+            chunk.append(model)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for model in models:
+            chunk.append(model)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+async def iterate_lines(request, max_line_size=1024 * 1024):
+    """
+    Iterate over lines of ``request`` body (without line breaks).
+
+    If request body is streamed (see ``stream`` argument of Sanic routes),
+    it is consumed chunk by chunk from ``request.stream``, so only one chunk
+    and one incomplete line are kept in memory. Otherwise the buffered body
+    is split.
+
+    ``None`` is yielded in place of lines longer than ``max_line_size``
+    bytes, the rest of such lines is skipped.
+    """
+    stream = request.stream
+    if stream is None:
+        for line in request.body.split(b'\n'):
+            yield line if len(line) <= max_line_size else None
+        return
+    pending = b''
+    skipping = False
+    while True:
+        chunk = await stream.get()
+        if chunk is None:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield line if len(line) <= max_line_size else None
+        if not skipping and len(pending) > max_line_size:
+            yield None
+            skipping = True
+        if skipping:
+            pending = b''
+    if pending and not skipping:
+        yield pending
+
+
+async def collect(models):
+    """
+    Return ``models`` as a list if it is an asynchronous iterable,
+    otherwise return it as is.
+    """
+    if hasattr(models, '__aiter__'):
+        return [model async for model in models]
+    return models
+
+
+@lru_cache(maxsize=None)
+def _accepted_arguments(func):
+    """
+    Return names of keyword arguments accepted by ``func`` or ``None``
+    if it accepts any keyword arguments.
+    """
+    names = set()
+    for parameter in signature(func).parameters.values():
+        if parameter.kind == Parameter.VAR_KEYWORD:
+            return None
+        if parameter.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY):
+            names.add(parameter.name)
+    return frozenset(names)
+
+
+def call_with_hints(func, *args, **hints):
+    """
+    Call ``func`` passing only those of keyword ``hints`` it accepts.
+
+    Return a tuple of ``(result, hints)``, where ``hints`` is a dict of
+    hints that were actually passed.
+
+    This allows framework to pass optional information (like requested page)
+    to user-defined methods whose signatures do not mention it.
+    """
+    accepted = _accepted_arguments(getattr(func, '__func__', func))
+    if accepted is not None:
+        hints = {
+            name: value
+            for name, value
+            in hints.items()
+            if name in accepted
+        }
+    return func(*args, **hints), hints
+
+
+def accepts_hint(func, name):
+    """
+    Return ``True`` if :py:func:`.call_with_hints` would pass hint
+    ``name`` to ``func``.
+    """
+    accepted = _accepted_arguments(getattr(func, '__func__', func))
+    return accepted is None or name in accepted
+
+
+@lru_cache(maxsize=None)
+def accepts_context(serializer_class):
+    """
+    Return ``True`` if ``serializer_class`` accepts ``context`` argument
+    (custom serializers may override ``__init__`` without it).
+    """
+    return accepts_hint(serializer_class, 'context')
+
+
+def get_value(model, name):
+    """
+    Return model field by name for both dict-like and object models.
+    """
+    if isinstance(model, Mapping):
+        return model[name]
+    return getattr(model, name)
@@ -3,12 +3,42 @@ Viewsets logic.
 """
 # pylint: disable=invalid-name
 # pylint: disable=abstract-method
-from json import loads
+from inspect import isawaitable
+from itertools import chain
 
-from sanic.response import json
+from sanic.response import HTTPResponse
 from sanic.blueprints import Blueprint
 
-from restic import exceptions
+from restic import exceptions, negotiation
+from restic.cache import CachedResponse
+from restic.codecs import DEFAULT_CODEC, DEFAULT_CODECS
+from restic.metrics import NULL_TIMER
+from restic.mixins import (
+    ListModelMixin,
+    CreateModelMixin,
+    RetrieveModelMixin,
+    UpdateModelMixin,
+    DestroyModelMixin,
+    BulkModelMixin,
+    ImportModelMixin
+)
+from restic.serializers import select_fields
+from restic.utils import maybe_await, collect, call_with_hints, accepts_context
+
+__all__ = (
+    'GenericViewSet',
+    'GenericModelViewSet',
+    'ListModelMixin',
+    'CreateModelMixin',
+    'RetrieveModelMixin',
+    'UpdateModelMixin',
+    'DestroyModelMixin',
+    'BulkModelMixin',
+    'ImportModelMixin',
+    'ReadOnlyModelViewSet',
+    'ModelViewSet',
+    'BulkModelViewSet'
+)
 
 
 class GenericViewSet(object):
@@ -22,6 +52,8 @@ class GenericViewSet(object):
 
     * ``GET /.../`` - list
     * ``POST /.../`` - create
+    * ``PATCH /.../`` - bulk_update
+    * ``DELETE /.../`` - bulk_destroy
     * ``GET /.../<pk>`` - retrieve
     * ``PUT /.../<pk>`` - update
     * ``PATCH /.../<pk>`` - update_partial
@@ -38,14 +70,69 @@ class GenericViewSet(object):
 
     If a view that inherits this class does not define some methods, they will
     be disallowed. If someone will attempt to call them, a
-    ``405 Method Not Allowed`` response will be returned.
+    ``405 Method Not Allowed`` response with ``Allow`` header will be
+    returned.
+
+    ``STREAM_ACTIONS`` maps extra paths to dicts of HTTP method -> action,
+    like ``LIST_ACTIONS``. Request bodies of these routes are not buffered,
+    handler functions read them from ``self.request.stream``
+    (see :py:class:`.ImportModelMixin`).
+
+    Handler functions are resolved once per viewset class (see
+    :py:meth:`.GenericViewSet.get_handlers`), and routes are only
+    registered for implemented ones. Override
+    :py:meth:`.GenericViewSet.get_handler` to resolve them per request.
+
+    Handler functions can be either regular functions or coroutine functions.
+
+    Request bodies are decoded and responses are encoded by a codec
+    (see :py:mod:`restic.codecs`). The default one can be set for a viewset
+    with ``CODEC`` attribute or for the whole app with ``RESTIC_CODEC``
+    config value. By default the fastest available JSON codec is used.
+    Other codecs the client can choose with ``Accept`` & ``Content-Type``
+    request headers are set with ``CODECS`` attribute or ``RESTIC_CODECS``
+    config value (newline-delimited JSON and MessagePack by default, set
+    it to an empty tuple to disable negotiation). If none of the codecs is
+    acceptable, ``406 Not Acceptable`` response is returned.
+
+    Set ``RESPONSE_CACHE`` to a :py:class:`~restic.cache.ResponseCache`
+    instance to cache rendered responses of ``CACHED_ACTIONS`` by path
+    arguments and query string. Model mixins invalidate the cache after
+    any successful write. Each viewset class should have its own cache.
+
+    Set ``SINGLE_FLIGHT`` to a :py:class:`~restic.coalescing.SingleFlight`
+    instance to coalesce identical concurrent requests of
+    ``COALESCED_ACTIONS`` (same path arguments and query string): only
+    one of them is handled, the others get a copy of its response.
+    Each viewset class should have its own instance.
+
+    If ``USE_ETAGS`` is ``True``, successful ``GET`` responses get an ``ETag``
+    header (a hash of the response body unless the handler sets one) and
+    ``If-None-Match`` requests are answered with ``304 Not Modified``.
 
     If you need to define CRUD for your models, see :class:`.ModelViewSet` and
     :class:`.ReadOnlyModelViewSet` classes.
+
+    If ``COMPRESS_RESPONSES`` is ``True``, responses are compressed with
+    an encoding from ``COMPRESSION_ENCODINGS`` negotiated with
+    ``Accept-Encoding`` request header at ``COMPRESSION_LEVEL``. Buffered
+    responses shorter than ``COMPRESSION_MIN_SIZE`` bytes are sent as is,
+    streaming responses are always compressed. Compressed variants of
+    cached responses are cached too. ``ETag`` of a compressed response
+    has encoding name appended.
+
+    Set ``METRICS`` to a :py:class:`~restic.metrics.MetricsSink` instance to
+    record latency, status & phase timings of requests
+    (see :py:mod:`restic.metrics`).
+
+    Set ``PROFILER`` to a :py:class:`~restic.profiling.Profiler` instance to
+    profile sampled requests (see :py:mod:`restic.profiling`).
     """
     LIST_ACTIONS = dict(
         GET='list',
-        POST='create'
+        POST='create',
+        PATCH='bulk_update',
+        DELETE='bulk_destroy'
     )
     ITEM_ACTIONS = dict(
         GET='retrieve',
@@ -53,17 +140,91 @@ class GenericViewSet(object):
         PATCH='update_partial',
         DELETE='destroy'
     )
+    STREAM_ACTIONS = dict()
     PK_PATTERN = '<pk:int>'
+    CODEC = None
+    CODECS = None
+    RESPONSE_CACHE = None
+    CACHED_ACTIONS = ('list', 'retrieve')
+    USE_ETAGS = False
+    SINGLE_FLIGHT = None
+    COALESCED_ACTIONS = ('list', 'retrieve')
+    COMPRESS_RESPONSES = False
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_ENCODINGS = ('gzip', 'deflate')
+    METRICS = None
+    PROFILER = None
+    __slots__ = ('request', 'request_phases', 'response_codec')
 
     def __init__(self, request):
         self.request = request
+        self.request_phases = None
+        self.response_codec = None
+
+    def get_default_codec(self):
+        """
+        Return default codec for this viewset.
+        """
+        if self.CODEC is not None:
+            return self.CODEC
+        app = getattr(self.request, 'app', None)
+        if app is not None:
+            return app.config.get('RESTIC_CODEC', DEFAULT_CODEC)
+        return DEFAULT_CODEC
+
+    def get_codecs(self):
+        """
+        Return a tuple of codecs negotiated with the client besides
+        the default one.
+        """
+        if self.CODECS is not None:
+            return tuple(self.CODECS)
+        app = getattr(self.request, 'app', None)
+        if app is not None:
+            return tuple(app.config.get('RESTIC_CODECS', DEFAULT_CODECS))
+        return DEFAULT_CODECS
+
+    def get_codec(self):
+        """
+        Return codec for response negotiated with ``Accept`` request header.
+
+        Raise :py:class:`~exceptions.NotAcceptable` if none of the codecs
+        is acceptable.
+        """
+        codec = self.response_codec
+        if codec is None:
+            codec = self.response_codec = negotiation.get_response_codec(self)
+        return codec
+
+    def get_request_codec(self):
+        """
+        Return codec for request body chosen by ``Content-Type`` request
+        header. Bodies of unknown types are decoded with the default codec.
+        """
+        return negotiation.get_request_codec(self)
 
     def get_data(self):
         """
-        Parse request JSON data.
+        Parse request data.
+
+        Raise :py:class:`~exceptions.BadRequest` if data is malformed.
+        """
+        return self.get_request_codec().decode(self.request.body)
+
+    def render(self, data, status=200, headers=None):
+        """
+        Encode ``data`` with viewset codec and return a response.
         """
-        # TODO: Handle parse errors.
-        return loads(self.request.body)
+        codec = self.get_codec()
+        with self.measure('encode'):
+            body = codec.encode(data)
+        return HTTPResponse(
+            body_bytes=body,
+            status=status,
+            headers=headers,
+            content_type=codec.content_type
+        )
 
     @classmethod
     def create_blueprint(cls, name):
@@ -104,171 +265,555 @@ class GenericViewSet(object):
             app.run(host='0.0.0.0', port=8000, debug=True)
         """
         blueprint = Blueprint(name)
-        for list_method, list_action in cls.LIST_ACTIONS.items():
-            blueprint.add_route(
-                cls._create_dispatcher(list_action),
-                '/',
-                methods=[list_method]
-            )
-        for item_method, item_action in cls.ITEM_ACTIONS.items():
-            blueprint.add_route(
-                cls._create_dispatcher(item_action),
-                '/' + cls.PK_PATTERN,
-                methods=[item_method]
-            )
+        blueprint.add_route(cls._create_router(cls.LIST_ACTIONS), '/', methods=list(cls.LIST_ACTIONS))
+        blueprint.add_route(
+            cls._create_router(cls.ITEM_ACTIONS),
+            '/' + cls.PK_PATTERN,
+            methods=list(cls.ITEM_ACTIONS)
+        )
+        for uri, actions in cls.STREAM_ACTIONS.items():
+            blueprint.route(uri, methods=list(actions), stream=True)(cls._create_router(actions))
         return blueprint
 
+    def get_cache_key(self, action, args, kwargs):
+        """
+        Return response cache key for current request.
+
+        The key includes the viewset class, so subclasses that share
+        their parent's ``RESPONSE_CACHE`` or ``SINGLE_FLIGHT`` don't collide.
+        """
+        return (
+            type(self),
+            action,
+            args,
+            tuple(sorted(kwargs.items())),
+            self.request.query_string,
+            self.request.headers.get('Accept')
+        )
+
+    def invalidate_cache(self):
+        """
+        Remove all cached responses of this viewset.
+        """
+        if self.RESPONSE_CACHE is not None:
+            self.RESPONSE_CACHE.invalidate()
+
+    async def dispatch(self, action, *args, **kwargs):
+        """
+        Call handler function for ``action`` and return its response.
+
+        :py:class:`~exceptions.APIException` errors are rendered
+        into error responses. Handlers can also return an exception instance
+        instead of raising it, which is cheaper.
+        """
+        headers = None
+        try:
+            self.get_codec()
+            handlers = self.get_handlers()
+            if handlers is not None:
+                handler = handlers.get(action)
+                if handler is not None:
+                    handler = handler.__get__(self, type(self))
+            else:
+                handler = self.get_handler(action)
+            if handler is not None:
+                response = await maybe_await(handler(*args, **kwargs))
+            else:
+                response = exceptions.MethodNotAllowed()
+                headers = {'Allow': ', '.join(self.get_allowed_methods(action))}
+        except exceptions.APIException as error:
+            response = error
+        if isinstance(response, exceptions.APIException):
+            return self.render_error(response, headers)
+        return response
+
+    def render_error(self, error, headers=None):
+        """
+        Return error response for :py:class:`~exceptions.APIException`.
+
+        Errors are encoded with the default codec if none of the codecs
+        is acceptable.
+        """
+        try:
+            codec = self.get_codec()
+        except exceptions.NotAcceptable:
+            codec = self.get_default_codec()
+        with self.measure('encode'):
+            body = codec.encode_error(error)
+        return HTTPResponse(
+            body_bytes=body,
+            status=error.status,
+            headers=headers,
+            content_type=codec.content_type
+        )
+
     def get_handler(self, action):
         """
         Return a handler function for this action or ``None`` if no handler
         is defined.
+
+        Only called if overridden, otherwise handlers are looked up in
+        :py:meth:`.GenericViewSet.get_handlers`.
         """
         return getattr(self, action, None)
 
+    def get_allowed_methods(self, action):
+        """
+        Return a sorted list of HTTP methods of the route of ``action``
+        that have handler functions for the current request.
+        """
+        for actions in chain((self.LIST_ACTIONS, self.ITEM_ACTIONS), self.STREAM_ACTIONS.values()):
+            if action in actions.values():
+                return sorted(method for method, name in actions.items() if self.get_handler(name) is not None)
+        return []
+
+    @classmethod
+    def get_handlers(cls):
+        """
+        Return a dict that maps actions to handler functions defined by
+        this viewset class.
+
+        Handlers are stored as found in class dicts (functions, static or
+        class methods) and bound to a viewset with ``__get__`` when called.
+
+        The dict is built once per class. Return ``None`` if
+        :py:meth:`.GenericViewSet.get_handler` is overridden, so handlers
+        are resolved per request.
+        """
+        if cls.get_handler is not GenericViewSet.get_handler:
+            return None
+        handlers = cls.__dict__.get('_handlers')
+        if handlers is None:
+            handlers = {}
+            for action in chain(
+                    cls.LIST_ACTIONS.values(),
+                    cls.ITEM_ACTIONS.values(),
+                    *[actions.values() for actions in cls.STREAM_ACTIONS.values()]
+            ):
+                handler = next((klass.__dict__[action] for klass in cls.__mro__ if action in klass.__dict__), None)
+                if handler is not None:
+                    if not hasattr(handler, '__get__'):
+                        # Callable objects are not bound to instances.
+                        handler = staticmethod(handler)
+                    handlers[action] = handler
+            cls._handlers = handlers
+        return handlers
+
     @classmethod
     def _create_dispatcher(cls, action):
         """
         Create and return request dispatcher.
         """
-        def dispatcher(request, *args, **kwargs):
+        async def dispatcher(request, *args, **kwargs):
             """
             Handle request into proper handler functions.
             """
-            try:
-                viewset = cls(request)
-                handler = viewset.get_handler(action)
-                if handler is not None:
-                    handler = getattr(viewset, action)
-                    return handler(*args, **kwargs)
-                raise exceptions.MethodNotAllowed()
-            except exceptions.APIException as error:
-                return json(dict(
-                    message=error.message,
-                    details=error.details
-                ), status=error.status)
+            viewset = cls(request)
+            if cls.METRICS is None and cls.PROFILER is None:
+                return await viewset.handle_request(action, args, kwargs)
+            return await viewset.handle_instrumented_request(action, args, kwargs)
         return dispatcher
 
+    @classmethod
+    def _create_router(cls, actions):
+        """
+        Create and return a route handler that passes requests to dispatchers
+        of ``actions`` (a dict of HTTP method -> action) by request method.
+
+        Dispatchers are only created for implemented actions, other methods
+        share a ``405 Method Not Allowed`` dispatcher.
+        """
+        handlers = cls.get_handlers()
+        dispatchers = {
+            method: cls._create_dispatcher(action)
+            for method, action
+            in actions.items()
+            if handlers is None or action in handlers
+        }
+        not_allowed_dispatcher = cls._create_not_allowed_dispatcher(sorted(dispatchers))
+        for method in actions:
+            dispatchers.setdefault(method, not_allowed_dispatcher)
+
+        def router(request, *args, **kwargs):
+            """
+            Pass request to dispatcher of its method.
+            """
+            return dispatchers[request.method](request, *args, **kwargs)
+        return router
+
+    @classmethod
+    def _create_not_allowed_dispatcher(cls, allowed):
+        """
+        Create and return dispatcher of disallowed methods.
+        """
+        error = exceptions.MethodNotAllowed()
+        allow = ', '.join(allowed)
+
+        async def not_allowed_dispatcher(request, *args, **kwargs):
+            """
+            Return ``405 Method Not Allowed`` response.
+            """
+            return cls(request).render_error(error, {'Allow': allow})
+        return not_allowed_dispatcher
+
+    async def handle_instrumented_request(self, action, args, kwargs):
+        """
+        Handle request with metrics and/or profiling enabled.
+        """
+        awaitable = self.handle_request(action, args, kwargs)
+        if self.PROFILER is not None and self.PROFILER.should_profile(self.request):
+            awaitable = self.PROFILER.profile(self, action, awaitable)
+        if self.METRICS is not None:
+            awaitable = self.METRICS.record(self, action, awaitable)
+        return await awaitable
+
+    async def handle_request(self, action, args, kwargs):
+        """
+        Return response for ``action`` from response cache or
+        from :py:meth:`.GenericViewSet.dispatch`.
+        """
+        cache = self.RESPONSE_CACHE if action in self.CACHED_ACTIONS else None
+        single_flight = self.SINGLE_FLIGHT if action in self.COALESCED_ACTIONS else None
+        if cache is None and single_flight is None:
+            return self.finalize_response(await self.dispatch(action, *args, **kwargs))
+
+        key = self.get_cache_key(action, args, kwargs)
+        generation = None
+        if cache is not None:
+            entry = cache.get(key)
+            if entry is not None:
+                return self.finalize_response(entry.to_response(), entry)
+            # Writes during dispatch invalidate the cache, so the response
+            # rendered before them must not be stored.
+            generation = cache.generation
+        if single_flight is not None:
+            response = await self.dispatch_coalesced(single_flight, key, (action, args, kwargs))
+        else:
+            response = self.add_etag(await self.dispatch(action, *args, **kwargs))
+        entry = None
+        if cache is not None and response.status == 200 and isinstance(response, HTTPResponse):
+            entry = CachedResponse.from_response(response)
+            cache.set(key, entry, generation)
+        return self.finalize_response(response, entry)
+
+    async def dispatch_coalesced(self, single_flight, key, call):
+        """
+        Dispatch request through ``single_flight``, so identical concurrent
+        requests (with the same ``key``) are handled once.
+
+        ``call`` is a tuple of ``(action, args, kwargs)`` of the request.
+
+        Waiters get a copy of the response. Responses that cannot be shared
+        (streaming responses and ``304 Not Modified`` responses to
+        conditional requests) are recomputed by each waiter.
+        """
+        action, args, kwargs = call
+
+        async def compute():
+            """
+            Dispatch request and return a tuple of ``(response, entry)``,
+            where ``entry`` is a shareable copy of the response or ``None``.
+            """
+            response = self.add_etag(await self.dispatch(action, *args, **kwargs))
+            if isinstance(response, HTTPResponse) and response.status != 304:
+                return response, CachedResponse.from_response(response)
+            return response, None
+
+        (response, entry), leader = await single_flight.call(key, compute)
+        if leader:
+            return response
+        if entry is None:
+            return self.add_etag(await self.dispatch(action, *args, **kwargs))
+        return entry.to_response()
+
+    def measure(self, phase):
+        """
+        Return a context manager that adds time spent in its block
+        to ``phase`` timing of the current request if metrics are enabled.
+        """
+        if self.request_phases is None:
+            return NULL_TIMER
+        return self.request_phases.measure(phase)
+
+    def add_etag(self, response):
+        """
+        Add ``ETag`` header with a hash of response body to successful
+        ``GET`` responses that do not have one if ``USE_ETAGS`` is enabled.
+        """
+        return negotiation.add_etag(self, response)
+
+    def finalize_response(self, response, cache_entry=None):
+        """
+        Post-process response before sending it to the client
+        (see :py:func:`~restic.negotiation.finalize_response`).
+        """
+        return negotiation.finalize_response(self, response, cache_entry)
+
+    def get_accepted_encoding(self):
+        """
+        Return content encoding negotiated with ``Accept-Encoding``
+        request header or ``None``.
+        """
+        return negotiation.get_accepted_encoding(self)
+
+    def get_response_encoding(self, response):
+        """
+        Return content encoding to compress ``response`` with or ``None``.
+        """
+        return negotiation.get_response_encoding(self, response)
+
+    def compress_response(self, response, encoding, cache_entry=None):
+        """
+        Compress ``response`` body with ``encoding``.
+        """
+        negotiation.compress_response(self, response, encoding, cache_entry)
+
 
 class GenericModelViewSet(GenericViewSet):
     """
     Generic class for implementing model-based viewsets.
+
+    ``get_models`` and ``get_model`` can be either regular methods or
+    coroutine methods, model mixins will await them if needed.
+
+    Model mixins can pass optional keyword arguments ("hints") to
+    ``get_models``. A hint is only passed if ``get_models`` declares an
+    argument with its name (or accepts ``**kwargs``), so data source can
+    opt in into handling them. Known hints:
+
+    * ``page`` - :py:class:`~restic.pagination.Page` window of models
+      to return when the viewset is paginated.
+    * ``fields`` - tuple of names of serializer fields the client requested
+      (also passed to ``get_model``) or ``None`` if all fields are needed.
+    * ``query`` - :py:class:`~restic.filters.Query` with filtering & ordering
+      requested by the client or ``None`` (also passed to ``count_models``).
+
+    Clients can select fields with ``fields`` and ``exclude`` query
+    parameters (comma-separated field names) on ``list`` and ``retrieve``,
+    for example: ``GET /items/?fields=id,name``.
+
+    Override ``get_model_version``, ``get_models_version``,
+    ``get_model_last_modified`` and ``get_models_last_modified`` to provide
+    cheap validators for conditional requests (see ``USE_ETAGS``), so
+    ``304 Not Modified`` can be returned without serializing anything.
+    ``If-Match`` and ``If-Unmodified-Since`` headers of update and destroy
+    requests are always honoured.
     """
+    FIELDS_PARAM = 'fields'
+    EXCLUDE_PARAM = 'exclude'
+    __slots__ = ('serializer_context',)
+
+    def __init__(self, request):
+        super(GenericModelViewSet, self).__init__(request)
+        self.serializer_context = None
+
     def get_serializer_class(self):  # pragma: no cover
         """
         Return :class:`~restic.serializers.Serializer` class for this viewset.
         """
         raise NotImplementedError()
 
+    def get_serializer(self, *args, **kwargs):
+        """
+        Return :class:`~restic.serializers.Serializer` instance for this viewset.
+
+        Serializer gets the context of the current request if it accepts
+        ``context`` argument.
+        """
+        serializer_class = self.get_serializer_class()
+        if 'context' not in kwargs and accepts_context(serializer_class):
+            kwargs['context'] = self.get_serializer_context()
+        return serializer_class(*args, **kwargs)
+
+    def get_serializer_context(self):
+        """
+        Return a dict shared by all serializers of the current request.
+        Batch loaders of related models are cached in it.
+        """
+        if self.serializer_context is None:
+            self.serializer_context = dict(request=self.request, viewset=self)
+        return self.serializer_context
+
+    async def prefetch(self, serializer):
+        """
+        Load related models of ``serializer`` in batches
+        (see :py:meth:`~restic.serializers.Serializer.prefetch`).
+        """
+        result = serializer.prefetch()
+        if result is not None:
+            with self.measure('fetch'):
+                await result
+
+    def get_selected_fields(self):
+        """
+        Return a tuple of names of fields requested by the client with
+        ``fields`` and ``exclude`` query parameters or ``None`` if all
+        fields are requested.
+        """
+        args = self.request.args
+        include = args.get(self.FIELDS_PARAM)
+        exclude = args.get(self.EXCLUDE_PARAM)
+        if include is None and exclude is None:
+            return None
+        if include is not None:
+            include = [name for name in include.split(',') if name]
+        if exclude is not None:
+            exclude = [name for name in exclude.split(',') if name]
+        return tuple(select_fields(self.get_serializer_class().fields, include, exclude))
+
     def get_models(self):  # pragma: no cover
         """
         Return a list of models.
         """
         raise NotImplementedError()
 
-    def get_model(self, pk):  # pragma: no cover
+    def get_model_version(self, model):
         """
-        Return a single model matched by ID.
-        Return ``None`` if model is not found.
+        Return version of ``model`` (any string or number that changes
+        whenever model changes) or ``None`` if unknown.
         """
-        raise NotImplementedError()
+        return None
 
-    def get_model_or_404(self, pk):
+    def get_models_version(self):
         """
-        Return a single model matched by ID.
-        Raise :py:class:`~exceptions.NotFound` exception if model is not found.
+        Return version of the whole model collection or ``None`` if unknown.
         """
-        model = self.get_model(pk)
-        if model is None:
-            raise exceptions.NotFound(
-                'Model with such primary key was not found.'
-            )
-        return model
+        return None
 
+    def get_model_last_modified(self, model):
+        """
+        Return ``datetime`` of the last modification of ``model``
+        or ``None`` if unknown.
+        """
+        return None
 
-class ListModelMixin(object):
-    """
-    A mixin that allows ModelViewSet to list models.
-
-    An example of ``list`` is: ``GET /items/``
-    """
-    def list(self):
+    def get_models_last_modified(self):
         """
-        Get a list of models and return their representation in a
-        json response.
+        Return ``datetime`` of the last modification of the model collection
+        or ``None`` if unknown.
         """
-        models = self.get_models()
-        serializer = self.get_serializer_class()(models, many=True)
-        return json(serializer.serialize())
+        return None
 
+    async def get_validator_headers(self, model=None):
+        """
+        Return a dict with ``ETag`` and ``Last-Modified`` headers for
+        ``model`` (or the whole collection if ``model`` is ``None``)
+        built from version hooks.
+        """
+        return await negotiation.get_validator_headers(self, model)
 
-class CreateModelMixin(object):
-    """
-    A mixin that allows ModelViewSet to create models.
+    async def check_not_modified(self, model=None):
+        """
+        Return a tuple of ``(headers, response)``, where ``headers`` are
+        validator headers for ``model`` (or the whole collection) and
+        ``response`` is ``304 Not Modified`` response if client already has
+        current representation or ``None`` otherwise.
+        """
+        return await negotiation.check_not_modified(self, model)
 
-    An example of ``create`` is: ``POST /items/``
-    """
-    def create(self):
+    async def check_preconditions(self, model):
         """
-        Create a new model and return its representation in a json response.
+        Raise :py:class:`~exceptions.PreconditionFailed` if ``If-Match``
+        or ``If-Unmodified-Since`` request headers do not match ``model``.
         """
-        serializer = self.get_serializer_class()()
-        serializer.do_create(self.get_data())
-        return json(serializer.serialize(), status=201)
+        await negotiation.check_preconditions(self, model)
 
+    async def count_models(self, query=None):
+        """
+        Return total number of models (matching ``query`` if it is set).
 
-class RetrieveModelMixin(object):
-    """
-    A mixin that allows ModelViewSet to retrieve models.
+        Used by paginations that include count. Default implementation
+        counts models returned by ``get_models``, override it to use
+        something cheaper.
+        """
+        models, hints = call_with_hints(self.get_models, query=query)
+        models = await collect(await maybe_await(models))
+        if query is not None and 'query' not in hints:
+            models = query.apply(models)
+        try:
+            return len(models)
+        except TypeError:
+            return sum(1 for _ in models)
 
-    An example of ``retrieve`` is: ``GET /items/5``
-    """
-    def retrieve(self, pk):
+    def get_model(self, pk):  # pragma: no cover
         """
-        Get an existing model and return its representation in a
-        json response.
+        Return a single model matched by ID.
+        Return ``None`` if model is not found.
         """
-        model = self.get_model_or_404(pk)
-        serializer = self.get_serializer_class()(model, many=False)
-        return json(serializer.serialize())
+        raise NotImplementedError()
 
+    async def get_models_by_pks(self, pks):
+        """
+        Return a list of models matched by IDs from ``pks`` list.
+        Missing models are represented by ``None``.
 
-class UpdateModelMixin(object):
-    """
-    A mixin that allows ModelViewSet to update models.
+        Used by bulk operations. Default implementation calls ``get_model``
+        for each ID, override it to fetch all models at once.
+        """
+        return [
+            await maybe_await(self.get_model(pk))
+            for pk
+            in pks
+        ]
 
-    An example of ``update`` is: ``PUT /items/5`` or ``PATCH /items/5``
-    """
-    def update(self, pk):
+    async def get_models_by_pks_or_404(self, pks):
         """
-        Update an existing model and return its modified representation in a
-        json response.
+        Return a list of models matched by IDs from ``pks`` list.
+        Raise :py:class:`~exceptions.NotFound` exception if any model
+        is not found.
         """
-        model = self.get_model_or_404(pk)
-        serializer = self.get_serializer_class()(model)
-        serializer.do_update(self.get_data())
-        return json(serializer.serialize())
+        self.validate_pks(pks)
+        models = await maybe_await(self.get_models_by_pks(pks))
+        missing = [
+            pk
+            for pk, model
+            in zip(pks, models)
+            if model is None
+        ]
+        if missing:
+            raise exceptions.NotFound(
+                'Models with such primary keys were not found.',
+                details=missing
+            )
+        return models
 
-    def update_partial(self, pk):
+    @staticmethod
+    def validate_pks(pks):
         """
-        Alias for :py:meth:`~.UpdateModelMixin.update`
+        Check that ``pks`` is a list of unique scalar primary keys.
+        Raise :py:class:`~exceptions.BadRequest` exception otherwise.
         """
-        return self.update(pk)
-
+        if not all(
+                isinstance(pk, (str, int, float)) and not isinstance(pk, bool)
+                for pk
+                in pks
+        ):
+            raise exceptions.BadRequest('Primary keys must be strings or numbers.')
+        if len(set(pks)) != len(pks):
+            raise exceptions.BadRequest('Primary keys must be unique.')
+
+    def get_model_or_404(self, pk, **hints):
+        """
+        Return a single model matched by ID.
+        Raise :py:class:`~exceptions.ModelNotFound` exception if model is not found.
 
-class DestroyModelMixin(object):
-    """
-    A mixin that allows ModelViewSet to retrieve models.
+        ``hints`` are passed to ``get_model`` if it accepts them.
 
-    An example of ``retrieve`` is: ``DELETE /items/5``
-    """
-    def destroy(self, pk):
-        """
-        Delete an existing model and return an empty json response.
+        Return an awaitable if ``get_model`` is a coroutine method.
         """
-        model = self.get_model_or_404(pk)
-        serializer = self.get_serializer_class()(model)
-        serializer.do_destroy()
-        return json(None, status=204)
+        model, _ = call_with_hints(self.get_model, pk, **hints)
+        if isawaitable(model):
+            return self._await_model_or_404(model)
+        return self._check_model(model)
+
+    async def _await_model_or_404(self, model):
+        return self._check_model(await model)
+
+    @staticmethod
+    def _check_model(model):
+        if model is None:
+            raise exceptions.ModelNotFound()
+        return model
 
 
 class ReadOnlyModelViewSet(
@@ -279,7 +824,7 @@ class ReadOnlyModelViewSet(
     """
     Viewset for models that cannot be modified.
     """
-    pass
+    __slots__ = ()
 
 
 class ModelViewSet(
@@ -293,4 +838,14 @@ class ModelViewSet(
     """
     Fully featured CRUD viewset for models with.
     """
-    pass
+    __slots__ = ()
+
+
+class BulkModelViewSet(
+        BulkModelMixin,
+        ModelViewSet
+):
+    """
+    Fully featured CRUD viewset for models with bulk operations.
+    """
+    __slots__ = ()